@@ -0,0 +1,306 @@
+"""Offline batch scoring: PPGI/GL for every row of a CSV, Parquet or xlsx file.
+
+Usage, from the repo root (elsewhere, put the repo on ``PYTHONPATH`` so ``app``
+is importable; relative input/output paths are resolved against the current
+directory)::
+
+    python -m app.batch_score NoteBooks/data/Data.xlsx -o out/ppgi.csv --workers 4
+
+Input columns may use ``PredictInput`` field names or the headers of
+``NoteBooks/data/Data.xlsx`` (``Age``, ``Weight``, ``Height``, ``Waist
+circumference``, ``Food Item``, ``Carb``, ``Protien``, ``Fat`` ...); other
+columns are ignored unless passed with ``--keep``. The file is read in chunks
+of ``--chunk-rows`` rows and each chunk is scored by a process pool in which
+every worker loads the model once. Results are appended to the output (CSV or
+NDJSON) in input order as chunks complete, and a checkpoint next to the
+output records how far the run got, so an interrupted run resumes where it
+stopped instead of starting over.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+import time
+
+# Offline scoring must not add its rows and timings to the server's /metrics
+os.environ.setdefault('PPGI_METRICS', '0')
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Data.xlsx / feature-table headers -> PredictInput fields (matched lowercased and stripped)
+COLUMN_ALIASES = {
+    'age': 'age',
+    'weight': 'weight',
+    'weight(kg)': 'weight',
+    'height': 'height_cm',
+    'height(cm)': 'height_cm',
+    'waist circumference': 'waist_circumference',
+    'food item': 'food_item',
+    'carb': 'carb',
+    'carb(g/100g)': 'carb',
+    'protien': 'protein',
+    'protien(g/100g)': 'protein',
+    'fat(g/100g)': 'fat',
+    'dietary fiber': 'dietary_fiber',
+    'dietary fiber(g/100g)': 'dietary_fiber',
+    'portion (g)': 'portion_g',
+}
+
+_main = None  # app.main, imported lazily (per process) by _app()
+
+
+def _app():
+    """Import ``app.main`` with the repo root as cwd, as the server runs it (relative PPGI_* paths)."""
+    global _main
+    if _main is None:
+        os.chdir(ROOT)
+        from app import main
+        _main = main
+    return _main
+
+
+# -- input readers: each yields DataFrames of at most chunk_rows rows --
+
+def _read_csv(path: Path, chunk_rows: int):
+    import pandas as pd
+    yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def _read_parquet(path: Path, chunk_rows: int):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit('Reading Parquet input requires pyarrow (pip install pyarrow).')
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def _read_xlsx(path: Path, chunk_rows: int):
+    # Parsed once into the columnar cache (app.dataset); reruns read the cached columns
+    from app import dataset
+    try:
+        df = dataset.load(path)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+_READERS = {'.csv': _read_csv, '.parquet': _read_parquet, '.pq': _read_parquet, '.xlsx': _read_xlsx}
+
+
+def read_chunks(path: Path, chunk_rows: int):
+    reader = _READERS.get(path.suffix.lower())
+    if reader is None:
+        raise SystemExit(f'Unsupported input format: {path.suffix} (expected .csv, .parquet or .xlsx)')
+    return reader(path, chunk_rows)
+
+
+def _field_map(columns, fields) -> Dict[str, str]:
+    """Input column -> PredictInput field for every recognised column."""
+    mapping = {}
+    for col in columns:
+        key = str(col).strip().lower()
+        field = key if key in fields else COLUMN_ALIASES.get(key)
+        if field and field not in mapping.values():
+            mapping[col] = field
+    return mapping
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value)) or (isinstance(value, str) and not value.strip())
+
+
+def _plain(value):
+    """NumPy scalars -> Python values (as pydantic and json expect); blanks -> None."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    return None if _is_blank(value) else value
+
+
+def _records(df, fields) -> List[dict]:
+    """Rows of ``df`` as PredictInput kwargs; missing cells are dropped so defaults apply."""
+    mapping = _field_map(df.columns, fields)
+    out = []
+    for values in df[list(mapping)].itertuples(index=False, name=None):
+        out.append({mapping[c]: v for c, v in zip(mapping, map(_plain, values)) if v is not None})
+    return out
+
+
+def _kept(df, keep: List[str]) -> List[dict]:
+    if not keep:
+        return [{}] * len(df)
+    return [dict(zip(keep, map(_plain, values))) for values in df[keep].itertuples(index=False, name=None)]
+
+
+# -- worker side --
+
+def _init_worker() -> None:
+    """Pool initializer: load the model once for this process."""
+    _app()._load_rf_model()
+
+
+def score_chunk(first_row: int, records: List[dict], kept: List[dict], fmt: str, columns: List[str]) -> str:
+    """Score one chunk and render it in the output format; runs in a pool worker."""
+    main = _app()
+    state = main._get_state()
+    flats, payloads, index = main._payloads_from_rows(records)
+    for i, rec in enumerate(records):
+        if not rec and flats[i] is None:
+            flats[i] = {'error': 'No input values'}
+    ok = [(i, p) for i, p in zip(index, payloads) if flats[i] is None]
+    if ok:
+        index, payloads = [i for i, _ in ok], [p for _, p in ok]
+        try:
+            iauc_food, iauc_glu = main._score_payloads(state, payloads)
+            main._merge_results(flats, index, payloads, iauc_food, iauc_glu, [state.label] * len(payloads))
+        except Exception as e:
+            for i, p in zip(index, payloads):
+                flats[i] = {**p.dict(), 'error': f'Prediction failed: {e.__class__.__name__}: {e}'}
+    for n, flat in enumerate(flats):
+        flat['row'] = first_row + n
+        flat.update(kept[n])
+    if fmt == 'ndjson':
+        return ''.join(json.dumps({c: flat.get(c) for c in columns if c in flat}, default=str) + '\n' for flat in flats)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for flat in flats:
+        writer.writerow([flat.get(c, '') for c in columns])
+    return buf.getvalue()
+
+
+# -- checkpointing --
+
+def _input_identity(path: Path) -> dict:
+    st = path.stat()
+    return {'input': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _load_checkpoint(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(path: Path, data: dict) -> None:
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+class _Progress:
+    def __init__(self, interval: float, done: int = 0):
+        self.interval = interval
+        self.start = time.monotonic()
+        self.start_rows = done
+        self.rows = done
+        self._next = self.start + interval
+
+    def update(self, rows: int, force: bool = False) -> None:
+        self.rows += rows
+        now = time.monotonic()
+        if not force and (self.interval <= 0 or now < self._next):
+            return
+        self._next = now + self.interval
+        elapsed = max(now - self.start, 1e-9)
+        rate = (self.rows - self.start_rows) / elapsed
+        print(f'[batch_score] {self.rows} rows scored, {rate:,.0f} rows/s, {elapsed:.1f}s elapsed',
+              file=sys.stderr, flush=True)
+
+
+def run(input_path: Path, output_path: Path, workers: int = os.cpu_count() or 1, chunk_rows: int = 5000,
+        fmt: Optional[str] = None, keep: Optional[List[str]] = None, resume: bool = True,
+        progress_interval: float = 5.0) -> int:
+    """Score ``input_path`` into ``output_path``; returns the number of rows scored in this run."""
+    input_path, output_path = input_path.resolve(), output_path.resolve()
+    fmt = fmt or ('ndjson' if output_path.suffix.lower() in ('.ndjson', '.jsonl') else 'csv')
+    keep = list(keep or [])
+    main = _app()
+    fields = set(main._PREDICT_FIELDS)
+    columns = ['row'] + keep + [c for c in main.STREAM_CSV_COLUMNS if c not in keep]
+
+    ckpt_path = output_path.with_name(output_path.name + '.ckpt')
+    identity = {**_input_identity(input_path), 'chunk_rows': chunk_rows, 'format': fmt, 'columns': columns}
+    ckpt = _load_checkpoint(ckpt_path) if resume else None
+    if ckpt is not None and ckpt.get('identity') != identity:
+        raise SystemExit(f'{ckpt_path} belongs to a different input or settings; rerun with --no-resume to start over.')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if ckpt is not None and output_path.exists():
+        out = open(output_path, 'r+', encoding='utf-8', newline='')
+        out.truncate(ckpt['output_bytes'])  # drop anything written after the last checkpoint
+        out.seek(ckpt['output_bytes'])
+        done_chunks, done_rows = ckpt['chunks'], ckpt['rows']
+        print(f'[batch_score] resuming after {done_rows} rows ({done_chunks} chunks)', file=sys.stderr)
+    else:
+        out = open(output_path, 'w', encoding='utf-8', newline='')
+        if fmt == 'csv':
+            csv.writer(out).writerow(columns)
+        done_chunks, done_rows = 0, 0
+
+    progress = _Progress(progress_interval, done_rows)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    pending = []  # futures in input order; at most 2 * workers chunks in flight
+    chunks, rows = done_chunks, done_rows
+
+    def _write(text: str, n: int) -> None:
+        nonlocal done_chunks, done_rows
+        out.write(text)
+        out.flush()
+        done_chunks += 1
+        done_rows += n
+        _save_checkpoint(ckpt_path, {'identity': identity, 'chunks': done_chunks, 'rows': done_rows,
+                                     'output_bytes': out.tell()})
+        progress.update(n)
+
+    try:
+        for i, df in enumerate(read_chunks(input_path, chunk_rows)):
+            if i < done_chunks:
+                continue
+            records = _records(df, fields)
+            kept = _kept(df, keep)
+            args = (rows, records, kept, fmt, columns)
+            rows += len(df)
+            chunks += 1
+            if pool is None:
+                _write(score_chunk(*args), len(records))
+                continue
+            pending.append((pool.submit(score_chunk, *args), len(records)))
+            while len(pending) >= 2 * workers or (pending and pending[0][0].done()):
+                fut, n = pending.pop(0)
+                _write(fut.result(), n)
+        for fut, n in pending:
+            _write(fut.result(), n)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        out.close()
+    progress.update(0, force=True)
+    ckpt_path.unlink(missing_ok=True)
+    return done_rows - progress.start_rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.batch_score', description=__doc__.split('\n\n')[0])
+    ap.add_argument('input', type=Path, help='.csv, .parquet or .xlsx file (Data.xlsx layout or PredictInput fields)')
+    ap.add_argument('-o', '--output', type=Path, required=True, help='output .csv or .ndjson file')
+    ap.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='scoring processes (1 = in-process)')
+    ap.add_argument('--chunk-rows', type=int, default=5000, help='rows per scoring task / checkpoint')
+    ap.add_argument('--format', choices=('csv', 'ndjson'), help='output format (default: from the output suffix)')
+    ap.add_argument('--keep', action='append', default=[], help='input column copied to the output (repeatable)')
+    ap.add_argument('--no-resume', dest='resume', action='store_false', help='ignore an existing checkpoint')
+    ap.add_argument('--progress-interval', type=float, default=5.0, help='seconds between progress lines')
+    args = ap.parse_args(argv)
+    run(args.input, args.output, workers=max(args.workers, 1), chunk_rows=max(args.chunk_rows, 1),
+        fmt=args.format, keep=args.keep, resume=args.resume, progress_interval=args.progress_interval)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""Benchmarks for the inference path and the HTTP endpoints.
+
+Usage::
+
+    python -m app.benchmark -o .data/bench/run.json
+    python -m app.benchmark --baseline .data/bench/baseline.json --threshold 0.15
+    python -m app.benchmark --save-baseline .data/bench/baseline.json --quick
+
+Three suites (``--suite``, default all):
+
+* ``inference``: ``_score_payloads`` (feature building + one model call for
+  food and glucose-reference rows, caches off) for 1 row and for batches,
+  per backend (flat RandomForest, sklearn RandomForest, Pipeline, LightGBM
+  text model). Backends whose artifact is missing are reported as skipped.
+* ``load``: cold start per backend, i.e. ``import app.main`` plus
+  load-and-warm of the model in a fresh interpreter.
+* ``http``: ``POST /api/predict`` through an in-process ASGI client
+  (httpx + ASGITransport) at several concurrency levels; throughput and
+  p50/p99 latency. Inputs are drawn from a seeded generator and the response
+  cache is off, so every request runs the model.
+
+Results are written as JSON (machine info, git commit, one entry per
+benchmark). With ``--baseline`` each benchmark is compared to the same entry
+of an earlier run; a change past ``--threshold`` in the bad direction is
+flagged and makes the exit status 1.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BACKENDS = ('random_forest', 'random_forest_sklearn', 'pipeline', 'lightgbm')
+# Environment for each backend when loaded through the default artifact chain
+_BACKEND_ENV = {
+    'random_forest': {'PPGI_MODEL_BACKEND': 'random_forest'},
+    'random_forest_sklearn': {'PPGI_MODEL_BACKEND': 'random_forest', 'PPGI_FLAT_FOREST': '0', 'PPGI_MODEL_CACHE_DIR': ''},
+    'pipeline': {'PPGI_MODEL_BACKEND': 'pipeline'},
+    'lightgbm': {'PPGI_MODEL_BACKEND': 'lightgbm'},
+}
+
+_main = None  # app.main, imported lazily by _app()
+
+
+def _app():
+    """Import ``app.main`` from the repo root with its on-disk state redirected to a temp dir."""
+    global _main
+    if _main is None:
+        tmp = tempfile.mkdtemp(prefix='ppgi-bench-')
+        os.environ.setdefault('PPGI_RESULT_DB', os.path.join(tmp, 'results.sqlite3'))
+        os.environ.setdefault('PPGI_RESPONSE_CACHE_SIZE', '0')
+        os.environ.setdefault('PPGI_METRICS_DIR', '')
+        os.chdir(ROOT)
+        from app import main
+        _main = main
+    return _main
+
+
+def _payloads(n: int, seed: int = 0) -> list:
+    """``n`` PredictInputs with varied users and foods (deterministic for a seed)."""
+    main = _app()
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        carb, protein, fat = rng.uniform(0, 80), rng.uniform(0, 25), rng.uniform(0, 30)
+        out.append(main.PredictInput(
+            age=float(rng.integers(18, 80)), weight=round(float(rng.uniform(45, 120)), 1),
+            height_cm=round(float(rng.uniform(145, 200)), 1), waist_circumference=round(float(rng.uniform(60, 130)), 1),
+            carb=round(float(carb), 1), protein=round(float(protein), 1), fat=round(float(fat), 1),
+            dietary_fiber=round(float(rng.uniform(0, 12)), 1), portion_g=float(rng.choice([50, 100, 150, 250])),
+        ))
+    return out
+
+
+def _summary(samples_s: List[float], **extra) -> dict:
+    ms = np.asarray(samples_s, dtype=float) * 1000.0
+    return {
+        'unit': 'ms', 'metric': 'p50_ms', 'better': 'lower', 'n': int(ms.size),
+        'p50_ms': float(np.percentile(ms, 50)), 'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()), 'min_ms': float(ms.min()), **extra,
+    }
+
+
+def _time_calls(fn, repeat: int, warmup: int = 3) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+# -- inference --
+
+def _load_backend(backend: str):
+    """Loaded and warmed state for ``backend``, or None when its artifact is not available."""
+    main = _app()
+    saved = {k: getattr(main, k) for k in ('MODEL_BACKEND', 'USE_FLAT_FOREST', 'MODEL_CACHE_DIR')}
+    env = _BACKEND_ENV[backend]
+    main.MODEL_BACKEND = env['PPGI_MODEL_BACKEND']
+    main.USE_FLAT_FOREST = env.get('PPGI_FLAT_FOREST', '1') != '0'
+    main.MODEL_CACHE_DIR = env.get('PPGI_MODEL_CACHE_DIR', main.MODEL_CACHE_DIR)
+    try:
+        state = main._load_default_state(f'bench-{backend}')
+        if backend == 'pipeline' and not state.is_pipeline:
+            return None
+        main._warm_state(state)
+        return state
+    except (FileNotFoundError, RuntimeError):
+        return None
+    finally:
+        for k, v in saved.items():
+            setattr(main, k, v)
+
+
+def bench_inference(backends, batch_sizes, repeat: int) -> Dict[str, dict]:
+    main = _app()
+    results = {}
+    for backend in backends:
+        state = _load_backend(backend)
+        if state is None:
+            results[f'inference.{backend}'] = {'skipped': 'model artifact not available'}
+            print(f'inference {backend}: skipped (artifact not available)', file=sys.stderr)
+            continue
+        for size in batch_sizes:
+            payloads = _payloads(size, seed=size)
+            n = max(repeat // size, 5) if size > 1 else repeat
+            samples = _time_calls(lambda: main._score_payloads(state, payloads, use_cache=False), n)
+            entry = _summary(samples, rows=size, rows_per_s=size / float(np.median(samples)))
+            results[f'inference.{backend}.rows_{size}'] = entry
+            print(f"inference {backend} rows={size}: p50 {entry['p50_ms']:.3f} ms, "
+                  f"{entry['rows_per_s']:.0f} rows/s", file=sys.stderr)
+    return results
+
+
+# -- cold start --
+
+def _cold_load_child() -> None:
+    """Run in a fresh interpreter: time ``import app.main`` and one load + warm-up."""
+    t0 = time.perf_counter()
+    from app import main
+    t1 = time.perf_counter()
+    state = main._load_default_state('bench')
+    main._warm_state(state)
+    t2 = time.perf_counter()
+    print(json.dumps({'import_s': t1 - t0, 'load_s': t2 - t1, 'pipeline': state.is_pipeline}))
+
+
+def bench_load(backends, repeat: int) -> Dict[str, dict]:
+    results = {}
+    for backend in backends:
+        env = {**os.environ, **_BACKEND_ENV[backend], 'PPGI_PRELOAD': '0', 'PPGI_METRICS_DIR': '',
+               'PYTHONPATH': str(ROOT) + os.pathsep + os.environ.get('PYTHONPATH', '')}
+        runs, error = [], None
+        # The first run also creates the memory-mapped forest dump that later starts reuse
+        for _ in range(repeat + 1):
+            proc = subprocess.run(
+                [sys.executable, '-c', 'from app.benchmark import _cold_load_child; _cold_load_child()'],
+                cwd=str(ROOT), env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                error = (proc.stderr.strip().splitlines() or ['failed'])[-1]
+                break
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if error or (backend == 'pipeline' and not runs[0]['pipeline']):
+            results[f'load.{backend}'] = {'skipped': error or 'model artifact not available'}
+            print(f'load {backend}: skipped ({results[f"load.{backend}"]["skipped"]})', file=sys.stderr)
+            continue
+        warm = runs[1:] or runs
+        entry = _summary([r['load_s'] for r in warm], first_load_ms=runs[0]['load_s'] * 1000.0,
+                         import_ms=float(np.median([r['import_s'] for r in warm])) * 1000.0)
+        results[f'load.{backend}'] = entry
+        print(f"load {backend}: {entry['p50_ms']:.0f} ms (first {entry['first_load_ms']:.0f} ms, "
+              f"import {entry['import_ms']:.0f} ms)", file=sys.stderr)
+    return results
+
+
+# -- HTTP --
+
+async def _http_level(client, bodies: List[dict], concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i, errors
+        while next_i < len(bodies):
+            body = bodies[next_i]
+            next_i += 1
+            t0 = time.perf_counter()
+            r = await client.post('/api/predict', json=body)
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    entry = _summary(latencies, concurrency=concurrency, errors=errors, requests_per_s=len(bodies) / wall)
+    entry.update(unit='req/s', metric='requests_per_s', better='higher')
+    return entry
+
+
+async def _http_run(levels, requests: int) -> Dict[str, dict]:
+    import httpx
+    main = _app()
+    main._get_state()
+    bodies = [p.dict() for p in _payloads(requests, seed=1)]
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await _http_level(client, bodies[:min(len(bodies), 20)], 1)
+        for c in levels:
+            entry = await _http_level(client, bodies, c)
+            results[f'http.predict.c{c}'] = entry
+            print(f"http /api/predict c={c}: {entry['requests_per_s']:.0f} req/s, p50 {entry['p50_ms']:.2f} ms, "
+                  f"p99 {entry['p99_ms']:.2f} ms, errors {entry['errors']}", file=sys.stderr)
+    main._scheduler.shutdown()
+    return results
+
+
+def bench_http(levels, requests: int) -> Dict[str, dict]:
+    return asyncio.run(_http_run(levels, requests))
+
+
+# -- reporting / baseline comparison --
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT), capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _meta(args) -> dict:
+    versions = {}
+    for mod in ('numpy', 'pandas', 'sklearn', 'fastapi', 'pydantic'):
+        try:
+            versions[mod] = __import__(mod).__version__
+        except Exception:
+            versions[mod] = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'packages': versions,
+        'args': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'save_baseline')},
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[dict]:
+    """Per-benchmark change against ``baseline``; ``regression`` is set past ``threshold``."""
+    rows = []
+    for name, entry in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or 'metric' not in entry or entry['metric'] not in base:
+            continue
+        metric = entry['metric']
+        old, new = float(base[metric]), float(entry[metric])
+        change = (new - old) / old if old else 0.0
+        worse = change if entry.get('better', 'lower') == 'lower' else -change
+        rows.append({'name': name, 'metric': metric, 'baseline': old, 'current': new,
+                     'change': change, 'regression': worse > threshold})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.benchmark', description=__doc__.split('\n\n')[0])
+    ap.add_argument('--suite', action='append', choices=('inference', 'load', 'http'),
+                    help='suite to run (repeatable; default: all)')
+    ap.add_argument('--backend', action='append', choices=BACKENDS, help='backend to benchmark (repeatable; default: all)')
+    ap.add_argument('--batch-sizes', default='1,64,1024', help='comma-separated rows per inference call')
+    ap.add_argument('--repeat', type=int, default=300, help='timed calls per single-row benchmark')
+    ap.add_argument('--load-repeat', type=int, default=3, help='cold starts per backend (after one priming start)')
+    ap.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrent HTTP clients')
+    ap.add_argument('--requests', type=int, default=2000, help='HTTP requests per concurrency level')
+    ap.add_argument('--quick', action='store_true', help='fewer repetitions (smoke run)')
+    ap.add_argument('-o', '--output', type=Path, help='write results JSON here')
+    ap.add_argument('--baseline', type=Path, help='earlier results JSON to compare against')
+    ap.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged as a regression')
+    ap.add_argument('--save-baseline', type=Path, help='also write the results JSON here as the new baseline')
+    args = ap.parse_args(argv)
+
+    for name in ('output', 'baseline', 'save_baseline'):
+        if getattr(args, name):
+            setattr(args, name, getattr(args, name).resolve())
+    suites = args.suite or ['inference', 'load', 'http']
+    backends = args.backend or list(BACKENDS)
+    if args.quick:
+        args.repeat, args.load_repeat, args.requests = min(args.repeat, 50), min(args.load_repeat, 1), min(args.requests, 200)
+    results: Dict[str, dict] = {}
+    if 'inference' in suites:
+        results.update(bench_inference(backends, [int(x) for x in args.batch_sizes.split(',')], args.repeat))
+    if 'load' in suites:
+        results.update(bench_load(backends, args.load_repeat))
+    if 'http' in suites:
+        results.update(bench_http([int(x) for x in args.concurrency.split(',')], args.requests))
+
+    report = {'meta': _meta(args), 'results': results}
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        rows = compare(results, baseline.get('results', {}), args.threshold)
+        report['comparison'] = {'baseline': str(args.baseline), 'baseline_meta': baseline.get('meta'),
+                                'threshold': args.threshold, 'benchmarks': rows}
+        print(f"\n{'benchmark':<42} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+        for r in rows:
+            flag = '  REGRESSION' if r['regression'] else ''
+            print(f"{r['name']:<42} {r['metric']:<16} {r['baseline']:>12.3f} {r['current']:>12.3f} "
+                  f"{r['change']:>+8.1%}{flag}", file=sys.stderr)
+        if any(r['regression'] for r in rows):
+            exit_code = 1
+    text = json.dumps(report, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+    if not args.output and not args.save_baseline:
+        print(text)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Incremental parsers for bulk uploads (CSV or NDJSON request bodies).
+
+Each parser is fed raw body chunks as they arrive and returns the complete
+rows found so far as dicts, so an upload of any size is parsed with memory
+bounded by one chunk plus one partial record. A record that cannot be parsed
+is returned in place as a ``BulkParseError`` so the caller can report it and
+keep going.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Union
+import codecs
+import csv
+import json
+
+# A single record larger than this is treated as malformed input rather than buffered
+MAX_RECORD_BYTES = 1 << 20
+
+
+class BulkParseError(ValueError):
+    """An upload (or one of its records) that cannot be parsed as the declared format."""
+
+
+Row = Union[Dict[str, object], BulkParseError]
+
+
+class _LineParser(ABC):
+    """Splits the decoded body into lines; subclasses turn complete lines into rows."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._pending = ''
+        self.records = 0
+
+    def _lines(self, chunk: bytes, final: bool) -> List[str]:
+        text = self._pending + self._decoder.decode(chunk, final)
+        lines = text.split('\n')
+        self._pending = '' if final else lines.pop()
+        if len(self._pending) > MAX_RECORD_BYTES:
+            raise BulkParseError(f'Record {self.records + 1} exceeds {MAX_RECORD_BYTES} bytes.')
+        return lines
+
+    def feed(self, chunk: bytes) -> List[Row]:
+        return self._parse(self._lines(chunk, final=False))
+
+    def close(self) -> List[Row]:
+        return self._parse(self._lines(b'', final=True), final=True)
+
+    @abstractmethod
+    def _parse(self, lines: List[str], final: bool = False) -> List[Row]:
+        """Rows for ``lines`` (``final``: no more input follows)."""
+
+
+class CSVRowParser(_LineParser):
+    """CSV with a header row; empty cells are dropped so model defaults apply.
+
+    Header names are matched case-insensitively after stripping whitespace.
+    Quoted fields may span lines: a record is only parsed once it holds an
+    even number of quote characters.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.header: Optional[List[str]] = None
+        self._record: List[str] = []
+        self._record_len = 0
+        self._quotes = 0
+
+    def _parse(self, lines: List[str], final: bool = False) -> List[Row]:
+        complete = []
+        for line in lines:
+            self._record.append(line)
+            self._record_len += len(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2 == 0:
+                complete.append('\n'.join(self._record))
+                self._record, self._record_len, self._quotes = [], 0, 0
+            elif self._record_len > MAX_RECORD_BYTES:
+                raise BulkParseError(f'Unterminated quoted field in record {self.records + len(complete) + 1}.')
+        rows: List[Row] = []
+        reader = csv.reader(complete)
+        while True:
+            try:
+                values = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                self.records += 1
+                rows.append(BulkParseError(f'Invalid CSV in record {self.records}: {e}'))
+                continue
+            if not values or all(not v.strip() for v in values):
+                continue
+            self.records += 1
+            if self.header is None:
+                self.header = [v.strip().lower() for v in values]
+                continue
+            rows.append({k: v.strip() for k, v in zip(self.header, values) if k and v.strip() != ''})
+        if final and self._record:
+            self.records += 1
+            rows.append(BulkParseError(f'Unterminated quoted field in record {self.records}.'))
+            self._record, self._record_len, self._quotes = [], 0, 0
+        return rows
+
+
+class NDJSONRowParser(_LineParser):
+    """One JSON object per line; blank lines are skipped."""
+
+    def _parse(self, lines: List[str], final: bool = False) -> List[Row]:
+        rows = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            self.records += 1
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                rows.append(BulkParseError(f'Invalid JSON in record {self.records}: {e}'))
+                continue
+            if not isinstance(obj, dict):
+                obj = BulkParseError(f'Record {self.records} is not a JSON object.')
+            rows.append(obj)
+        return rows
+
+
+def parser_for(fmt: str) -> _LineParser:
+    """Parser for ``fmt`` ('csv' or 'ndjson')."""
+    if fmt == 'csv':
+        return CSVRowParser()
+    if fmt == 'ndjson':
+        return NDJSONRowParser()
+    raise BulkParseError(f'Unsupported upload format: {fmt}')
@@ -0,0 +1,97 @@
+"""Fast request/response codec for the prediction endpoints.
+
+``PredictRecord`` is the internal form of a validated ``PredictInput``: an
+immutable named tuple (no per-instance ``__dict__``, no validation on copy),
+created once per item after request validation. Derived payloads (per-100g
+nutrients, the glucose reference) are made with ``replace``, which is a
+tuple copy for records instead of a ``dict()`` + re-validation round trip.
+
+``dumps`` renders JSON bodies with ``orjson`` when it is installed (the
+standard library encoder otherwise), producing the same compact output as
+``JSONResponse``.
+"""
+from typing import NamedTuple, Optional
+import json
+import math
+
+from starlette.responses import Response
+
+try:  # optional: ~5x faster encoding of result dicts
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class PredictRecord(NamedTuple):
+    # Same fields, order and defaults as main.PredictInput (checked when app.main is imported)
+    age: float = 30.0
+    weight: float = 70.0
+    height_cm: Optional[float] = None
+    waist_circumference: float = 80.0
+    food_item: str = ""
+    carb: float = 0.0
+    protein: float = 0.0
+    fat: float = 0.0
+    dietary_fiber: float = 0.0
+    portion_g: float = 100.0
+    nutrients_per_serving: bool = False
+    food_id: Optional[str] = None
+
+    @classmethod
+    def from_input(cls, payload) -> 'PredictRecord':
+        """Record for a validated PredictInput (or another record, returned as is)."""
+        if isinstance(payload, cls):
+            return payload
+        return cls._make([getattr(payload, f) for f in cls._fields])
+
+    def dict(self) -> dict:
+        """Field -> value, like ``PredictInput.dict()``."""
+        return dict(zip(self._fields, self))
+
+
+def replace(payload, **changes):
+    """Copy of ``payload`` (record or PredictInput) with ``changes`` applied."""
+    if isinstance(payload, PredictRecord):
+        return payload._replace(**changes)
+    data = payload.dict()
+    data.update(changes)
+    return type(payload)(**data)
+
+
+def _default(obj):
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        """Compact UTF-8 JSON; non-finite floats raise ValueError like JSONResponse."""
+        _check_finite(obj)
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+else:  # pragma: no cover
+    def dumps(obj) -> bytes:
+        """Compact UTF-8 JSON; non-finite floats raise ValueError like JSONResponse."""
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                          default=_default).encode('utf-8')
+
+
+def _check_finite(obj) -> None:
+    # orjson writes NaN/Infinity as null; JSONResponse refuses them
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            raise ValueError('Out of range float values are not JSON compliant')
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            if not isinstance(v, str):
+                _check_finite(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _check_finite(v)
+
+
+class FastJSONResponse(Response):
+    """``JSONResponse`` rendered with ``dumps``."""
+
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        return dumps(content)
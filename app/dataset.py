@@ -0,0 +1,267 @@
+"""Columnar cache for the training workbooks.
+
+``NoteBooks/data/Data.xlsx`` and the notebook outputs in ``NoteBooks/out``
+are parsed once with ``pandas.read_excel`` and every sheet is written as one
+``.npy`` file per column under ``PPGI_DATASET_CACHE_DIR``. Later loads read
+only the requested columns; numeric and boolean columns are memory-mapped,
+text columns (and mixed columns such as ``"0.2 ± 0.1"`` next to plain
+numbers) are stored as fixed-width strings plus a per-cell type tag and
+rebuilt into the same Python values ``read_excel`` returns.
+
+A cache entry is reused while the workbook's size and mtime are unchanged;
+if they changed but the content hash did not (a copy, a ``touch``), only the
+manifest is updated. Otherwise the workbook is converted again.
+
+Usage::
+
+    from app import dataset
+    df = dataset.load('raw', sheet='Sheet3', columns=['Age', 'Food Item', 'IAUC'])
+
+    python -m app.dataset            # build/refresh the cache for all known workbooks
+    python -m app.dataset cleaned -v # ... and list the columns of one of them
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cache root; one sub-directory per workbook
+CACHE_DIR = os.environ.get("PPGI_DATASET_CACHE_DIR", str(ROOT / ".data" / "datasets"))
+
+# Short names for the workbooks used by the notebooks and the batch tools
+DATASETS = {
+    'raw': ROOT / 'NoteBooks' / 'data' / 'Data.xlsx',
+    'cleaned': ROOT / 'NoteBooks' / 'out' / 'df_cleaned.xlsx',
+    'encoded': ROOT / 'NoteBooks' / 'out' / 'df_encoded.xlsx',
+}
+
+FORMAT_VERSION = 1
+
+# Per-cell tags of text/mixed columns
+_NULL, _STR, _FLOAT, _INT, _BOOL = range(5)
+
+
+def resolve(source: Union[str, Path]) -> Path:
+    """Workbook path for a short name from DATASETS or a path."""
+    if isinstance(source, str) and source in DATASETS:
+        return DATASETS[source]
+    return Path(source).resolve()
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _entry_dir(path: Path, cache_dir: Union[str, Path]) -> Path:
+    key = hashlib.sha256(str(path).encode()).hexdigest()[:10]
+    return Path(cache_dir) / f'{path.stem}-{key}'
+
+
+def _read_manifest(entry: Path) -> Optional[dict]:
+    try:
+        manifest = json.loads((entry / 'manifest.json').read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == FORMAT_VERSION else None
+
+
+def _write_manifest(entry: Path, manifest: dict) -> None:
+    tmp = entry / 'manifest.json.tmp'
+    tmp.write_text(json.dumps(manifest, indent=1, ensure_ascii=False))
+    os.replace(tmp, entry / 'manifest.json')
+
+
+# -- conversion --
+
+def _encode_column(series, directory: Path, stem: str) -> dict:
+    """Write one column; returns its manifest entry."""
+    import pandas as pd
+
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype) or \
+            pd.api.types.is_datetime64_dtype(dtype):
+        np.save(directory / f'{stem}.npy', np.ascontiguousarray(series.to_numpy()))
+        return {'kind': 'array', 'file': f'{stem}.npy', 'dtype': str(dtype)}
+    values = series.to_numpy(dtype=object)
+    tags = np.empty(len(values), dtype=np.int8)
+    text = []
+    for i, v in enumerate(values):
+        if v is None or (isinstance(v, float) and v != v) or v is pd.NaT:
+            tags[i] = _NULL
+            text.append('')
+        elif isinstance(v, (bool, np.bool_)):
+            tags[i] = _BOOL
+            text.append('1' if v else '')
+        elif isinstance(v, (int, np.integer)):
+            tags[i] = _INT
+            text.append(str(int(v)))
+        elif isinstance(v, (float, np.floating)):
+            tags[i] = _FLOAT
+            text.append(repr(float(v)))
+        else:
+            tags[i] = _STR
+            text.append(str(v))
+    np.save(directory / f'{stem}.npy', np.array(text, dtype=str))
+    np.save(directory / f'{stem}.tags.npy', tags)
+    kind = 'text' if set(np.unique(tags).tolist()) <= {_NULL, _STR} else 'mixed'
+    return {'kind': kind, 'file': f'{stem}.npy', 'tags': f'{stem}.tags.npy', 'dtype': str(dtype)}
+
+
+def _convert(path: Path, entry: Path, identity: dict) -> dict:
+    import pandas as pd
+
+    try:
+        import openpyxl  # noqa: F401  (engine used by read_excel)
+    except ImportError:
+        raise RuntimeError('Converting xlsx workbooks requires openpyxl (pip install openpyxl).')
+    book = pd.read_excel(path, sheet_name=None)
+    tmp = entry.with_name(f'{entry.name}.tmp-{os.getpid()}')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    sheets = {}
+    for s, (name, df) in enumerate(book.items()):
+        sheet_dir = tmp / f's{s}'
+        sheet_dir.mkdir()
+        columns = []
+        for c, col in enumerate(df.columns):
+            columns.append({'name': str(col), **_encode_column(df[col], sheet_dir, f'c{c}')})
+        sheets[str(name)] = {'dir': f's{s}', 'rows': len(df), 'columns': columns}
+    manifest = {'version': FORMAT_VERSION, **identity, 'sheets': sheets}
+    _write_manifest(tmp, manifest)
+    # Swap the new entry in; a concurrent reader keeps the files it already opened
+    old = entry.with_name(f'{entry.name}.old-{os.getpid()}')
+    if entry.exists():
+        os.replace(entry, old)
+    os.replace(tmp, entry)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def ensure(source: Union[str, Path], cache_dir: Union[str, Path, None] = None) -> Path:
+    """Cache entry for ``source``, converting the workbook if the entry is missing or stale."""
+    path = resolve(source)
+    entry = _entry_dir(path, cache_dir or CACHE_DIR)
+    _manifest(path, entry)
+    return entry
+
+
+def _manifest(path: Path, entry: Path) -> dict:
+    st = path.stat()
+    manifest = _read_manifest(entry)
+    if manifest is not None and manifest['size'] == st.st_size and manifest['mtime_ns'] == st.st_mtime_ns:
+        return manifest
+    digest = _sha256(path)
+    identity = {'source': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+    if manifest is not None and manifest.get('sha256') == digest:
+        manifest.update(identity)
+        _write_manifest(entry, manifest)
+        return manifest
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    return _convert(path, entry, identity)
+
+
+# -- loading --
+
+def _sheet(manifest: dict, sheet: Union[int, str]) -> dict:
+    sheets = manifest['sheets']
+    if isinstance(sheet, int):
+        try:
+            return list(sheets.values())[sheet]
+        except IndexError:
+            raise KeyError(f'Worksheet index {sheet} is invalid, {len(sheets)} worksheets found') from None
+    if sheet not in sheets:
+        raise KeyError(f'Worksheet named {sheet!r} not found')
+    return sheets[sheet]
+
+
+def _decode_column(directory: Path, meta: dict, mmap: bool) -> np.ndarray:
+    if meta['kind'] == 'array':
+        # np.asarray drops the memmap subclass (and its per-access overhead) but keeps the mapping
+        return np.asarray(np.load(directory / meta['file'], mmap_mode='r' if mmap else None))
+    text = np.load(directory / meta['file'])
+    tags = np.load(directory / meta['tags'])
+    out = np.empty(len(tags), dtype=object)
+    out[:] = np.nan
+    is_str = tags == _STR
+    out[is_str] = text[is_str].tolist()
+    if meta['kind'] == 'mixed':
+        for tag, cast in ((_FLOAT, float), (_INT, int), (_BOOL, bool)):
+            idx = np.flatnonzero(tags == tag)
+            if len(idx):
+                out[idx] = [cast(v) for v in text[idx].tolist()]
+    return out
+
+
+def load_arrays(source: Union[str, Path], sheet: Union[int, str] = 0, columns: Optional[Sequence[str]] = None,
+                mmap: bool = True, cache_dir: Union[str, Path, None] = None) -> Dict[str, np.ndarray]:
+    """Column name -> array for one sheet (all columns unless ``columns`` is given).
+
+    ``sheet`` is a worksheet index or name, as for ``read_excel``. Numeric
+    columns are read-only memory maps when ``mmap`` is true; text and mixed
+    columns are object arrays with NaN for empty cells.
+    """
+    path = resolve(source)
+    entry = _entry_dir(path, cache_dir or CACHE_DIR)
+    meta = _sheet(_manifest(path, entry), sheet)
+    by_name = {c['name']: c for c in meta['columns']}
+    names = list(by_name) if columns is None else list(columns)
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        raise KeyError(f'Columns not found: {missing}')
+    directory = entry / meta['dir']
+    return {n: _decode_column(directory, by_name[n], mmap) for n in names}
+
+
+def load(source: Union[str, Path], sheet: Union[int, str] = 0, columns: Optional[Sequence[str]] = None,
+         mmap: bool = True, cache_dir: Union[str, Path, None] = None):
+    """One sheet as a DataFrame, like ``pd.read_excel(source, sheet_name=sheet)[columns]``."""
+    import pandas as pd
+
+    arrays = load_arrays(source, sheet, columns, mmap, cache_dir)
+    if not arrays:
+        return pd.DataFrame()
+    return pd.DataFrame({n: pd.Series(a, copy=False) for n, a in arrays.items()}, copy=False)
+
+
+def sheets(source: Union[str, Path], cache_dir: Union[str, Path, None] = None) -> Dict[str, List[str]]:
+    """Worksheet name -> column names."""
+    path = resolve(source)
+    manifest = _manifest(path, _entry_dir(path, cache_dir or CACHE_DIR))
+    return {name: [c['name'] for c in meta['columns']] for name, meta in manifest['sheets'].items()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.dataset', description=__doc__.split('\n\n')[0])
+    ap.add_argument('sources', nargs='*', help=f'workbook paths or names ({", ".join(DATASETS)}; default: all)')
+    ap.add_argument('--cache-dir', default=CACHE_DIR, help='cache root (default: PPGI_DATASET_CACHE_DIR)')
+    ap.add_argument('-v', '--verbose', action='store_true', help='list sheets and columns')
+    args = ap.parse_args(argv)
+    for source in args.sources or [n for n, p in DATASETS.items() if p.exists()]:
+        start = time.perf_counter()
+        entry = ensure(source, args.cache_dir)
+        elapsed = time.perf_counter() - start
+        manifest = _read_manifest(entry)
+        print(f'{source}: {entry} ({elapsed * 1000:.1f} ms)')
+        for name, meta in manifest['sheets'].items():
+            print(f'  {name}: {meta["rows"]} rows x {len(meta["columns"])} columns')
+            if args.verbose:
+                for c in meta['columns']:
+                    print(f'    {c["name"]!r} {c["kind"]} {c["dtype"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Plain-dict lookup tables compiled from a fitted ``category_encoders.TargetEncoder``.
+
+The encoder is an ordinal step (category -> int code) followed by a code ->
+smoothed target mean mapping. Both are folded into one ``{category: value}``
+table per column, plus the values used for unseen (code -1) and missing
+(code -2) categories, so encoding needs neither pandas nor category_encoders.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _code_value(mapping, code: int, policy: str) -> float:
+    """Encoded value for the ordinal ``code`` under a handle_unknown/handle_missing policy."""
+    if policy == 'value' and code in mapping.index:
+        return float(mapping.loc[code])
+    # 'return_nan' (and 'error', which the parity probe rejects) have no fixed value
+    return np.nan
+
+
+class CompiledTargetEncoder:
+    """Target encoding as dict lookups; ``value(col, category)`` mirrors ``transform``."""
+
+    def __init__(self, tables: Dict[str, Dict[Any, float]], unknown: Dict[str, float],
+                 missing: Dict[str, float]):
+        self.tables = tables
+        self.unknown = unknown
+        self.missing = missing
+        self.cols: List[str] = list(tables)
+
+    @classmethod
+    def from_category_encoders(cls, encoder) -> 'CompiledTargetEncoder':
+        tables: Dict[str, Dict[Any, float]] = {}
+        unknown: Dict[str, float] = {}
+        missing: Dict[str, float] = {}
+        ordinal = {m['col']: m['mapping'] for m in encoder.ordinal_encoder.mapping}
+        for col in encoder.cols:
+            target = encoder.mapping[col]
+            codes = ordinal[col]
+            table = {}
+            missing_code = -2
+            for category, code in codes.items():
+                if _is_missing(category):
+                    # Missing values seen during fit have their own code (and mean)
+                    missing_code = int(code)
+                    continue
+                table[category] = float(target.loc[int(code)]) if int(code) in target.index else np.nan
+            tables[col] = table
+            unknown[col] = _code_value(target, -1, getattr(encoder, 'handle_unknown', 'value'))
+            missing[col] = _code_value(target, missing_code, getattr(encoder, 'handle_missing', 'value'))
+        return cls(tables, unknown, missing)
+
+    def value(self, col: str, category: Any) -> float:
+        if _is_missing(category):
+            return self.missing[col]
+        return self.tables[col].get(category, self.unknown[col])
+
+    def encode_column(self, col: str, categories: Iterable) -> np.ndarray:
+        return np.array([self.value(col, c) for c in categories], dtype=np.float64)
+
+    def transform_frame(self, df):
+        """Encode the categorical columns of a DataFrame (other columns untouched)."""
+        df = df.copy()
+        for col in self.cols:
+            if col in df.columns:
+                df[col] = self.encode_column(col, df[col].tolist())
+        return df
+
+
+def compile_target_encoder(encoder, probe_frame=None) -> Optional[CompiledTargetEncoder]:
+    """Compile ``encoder``; return None if it is not a supported TargetEncoder.
+
+    When ``probe_frame`` (a frame the real encoder accepts) is given, every
+    known category plus an unseen and a missing value are pushed through both
+    the real encoder and the tables, and the tables are only returned if the
+    outputs are identical.
+    """
+    if encoder is None:
+        return None
+    try:
+        compiled = CompiledTargetEncoder.from_category_encoders(encoder)
+    except Exception:
+        return None
+    if probe_frame is None:
+        return compiled
+    try:
+        import pandas as pd
+        n = max(len(t) for t in compiled.tables.values()) + 2
+        probe = pd.concat([probe_frame.iloc[[0]]] * n, ignore_index=True)
+        for col in compiled.cols:
+            values = list(compiled.tables[col]) + ['__unseen__', None]
+            probe[col] = (values * n)[:n]
+        expected = encoder.transform(probe)
+        for col in compiled.cols:
+            got = compiled.encode_column(col, probe[col].tolist())
+            if not np.array_equal(got, expected[col].to_numpy(dtype=np.float64), equal_nan=True):
+                return None
+    except Exception:
+        return None
+    return compiled
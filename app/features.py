@@ -0,0 +1,231 @@
+"""Array-based feature engineering for the bare RandomForest path.
+
+Mirrors ``_engineer_features`` + ``_prepare_X`` from ``app.main`` but writes
+straight into a preallocated float64 matrix in model column order, avoiding
+per-column pandas overhead on the request path. The arithmetic is performed
+with the same operands and order as the DataFrame code, so results are
+bit-for-bit identical.
+"""
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+NUTRIENT_COLS = ['Carb(g/100g)', 'Protien(g/100g)', 'Fat(g/100g)', 'Dietary Fiber(g/100g)']
+_SHORT_NAMES = {
+    'Carb(g/100g)': 'Carb',
+    'Protien(g/100g)': 'Protien',
+    'Fat(g/100g)': 'Fat',
+    'Dietary Fiber(g/100g)': 'Dietary_Fiber',
+}
+
+# Numeric inputs the plan reads, in the column order of the ``raw`` matrix.
+BASE_COLUMNS = [
+    'Age', 'Weight(kg)', 'Height(cm)', 'Waist circumference', 'Hip circumference',
+    'BMI(kg/m2)', 'WC/HC',
+] + NUTRIENT_COLS
+_BASE_INDEX = {c: i for i, c in enumerate(BASE_COLUMNS)}
+# BASE_COLUMNS that describe the user (the rest describe the food)
+USER_COLUMNS = [c for c in BASE_COLUMNS if c not in NUTRIENT_COLS]
+
+
+def _base(name: str) -> Callable:
+    i = _BASE_INDEX[name]
+    return lambda raw, total: raw[:, i]
+
+
+def _column_fn(name: str) -> Optional[Callable]:
+    """Return ``f(raw, total) -> column`` for an engineered column, or None if unknown."""
+    if name in _BASE_INDEX:
+        return _base(name)
+    if name == 'Total_Nutrients':
+        return lambda raw, total: total
+    for nut, short in _SHORT_NAMES.items():
+        i = _BASE_INDEX[nut]
+        if name == f'{short}_Proportion':
+            return lambda raw, total, i=i: raw[:, i] / total
+        if name == f'{short}_sq':
+            return lambda raw, total, i=i: raw[:, i] ** 2
+        if name == f'{nut}_x_Age':
+            return lambda raw, total, i=i, a=_BASE_INDEX['Age']: raw[:, i] * raw[:, a]
+        if name == f'{nut}_x_BMI':
+            return lambda raw, total, i=i, b=_BASE_INDEX['BMI(kg/m2)']: raw[:, i] * raw[:, b]
+        if name == f'WC/HC_x_{nut}':
+            return lambda raw, total, i=i, w=_BASE_INDEX['WC/HC']: raw[:, w] * raw[:, i]
+    for a_pos, a in enumerate(NUTRIENT_COLS):
+        for b in NUTRIENT_COLS[a_pos + 1:]:
+            if name == f'{_SHORT_NAMES[a]}_x_{_SHORT_NAMES[b]}':
+                ia, ib = _BASE_INDEX[a], _BASE_INDEX[b]
+                return lambda raw, total, ia=ia, ib=ib: raw[:, ia] * raw[:, ib]
+    return None
+
+
+def _cross_part(name: str) -> Optional[tuple]:
+    """How a column splits for user x food blocks.
+
+    Returns ('user', i) for user-only columns, ('inter', nutrient_i, user_i)
+    for user x nutrient interactions, ('food', fn) for columns that only read
+    nutrients, or None if the column is not derivable.
+    """
+    if name in USER_COLUMNS:
+        return ('user', _BASE_INDEX[name])
+    for nut in NUTRIENT_COLS:
+        for pattern, user_col in ((f'{nut}_x_Age', 'Age'), (f'{nut}_x_BMI', 'BMI(kg/m2)'),
+                                  (f'WC/HC_x_{nut}', 'WC/HC')):
+            if name == pattern:
+                return ('inter', _BASE_INDEX[nut], _BASE_INDEX[user_col])
+    fn = _column_fn(name)
+    return ('food', fn) if fn is not None else None
+
+
+def total_nutrients(raw: np.ndarray) -> np.ndarray:
+    """Total_Nutrients exactly as ``_engineer_features`` computes it (0 -> 1e-6)."""
+    c = _BASE_INDEX
+    total = raw[:, c['Carb(g/100g)']] + raw[:, c['Protien(g/100g)']] + raw[:, c['Fat(g/100g)']] + raw[:, c['Dietary Fiber(g/100g)']]
+    total[total == 0] = 1e-6
+    return total
+
+
+class FeaturePlan:
+    """Compiled mapping from raw numeric inputs to the model feature matrix.
+
+    ``columns`` is the model's feature order. Columns that are not derivable
+    from ``BASE_COLUMNS`` (e.g. target-encoded categoricals) are taken from
+    ``constants``; anything else is filled with 0.0, like ``_prepare_X``.
+    """
+
+    def __init__(self, columns: Sequence[str], constants: Optional[Dict[str, float]] = None):
+        self.columns: List[str] = list(columns)
+        constants = constants or {}
+        self._computed = []
+        self._parts = []
+        self._constant = np.zeros(len(self.columns), dtype=np.float64)
+        for j, col in enumerate(self.columns):
+            fn = _column_fn(col)
+            if fn is not None:
+                self._computed.append((j, fn))
+                self._parts.append((j, _cross_part(col)))
+            else:
+                v = float(constants.get(col, 0.0))
+                self._constant[j] = 0.0 if np.isnan(v) else v
+        # Nutrient-only columns (depend on the food alone) vs. user / interaction columns
+        self.food_columns = [j for j, part in self._parts if part[0] == 'food']
+        self._food_fns = [part[1] for j, part in self._parts if part[0] == 'food']
+        self._user_parts = [(j, part) for j, part in self._parts if part[0] != 'food']
+
+    def transform(self, raw: np.ndarray) -> np.ndarray:
+        """Build the (n_rows, n_columns) float64 matrix from ``raw`` (n_rows, len(BASE_COLUMNS))."""
+        raw = np.asarray(raw, dtype=np.float64)
+        if raw.ndim == 1:
+            raw = raw.reshape(1, -1)
+        out = np.empty((raw.shape[0], len(self.columns)), dtype=np.float64)
+        out[:] = self._constant
+        total = total_nutrients(raw)
+        for j, fn in self._computed:
+            out[:, j] = fn(raw, total)
+        # _prepare_X: NaN (e.g. missing height/BMI) -> 0.0
+        np.nan_to_num(out, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        return out
+
+    def food_block(self, food_raw: np.ndarray) -> np.ndarray:
+        """Nutrient-only columns (``food_columns`` order) for each food row of ``food_raw``."""
+        food_raw = np.asarray(food_raw, dtype=np.float64).reshape(-1, len(BASE_COLUMNS))
+        total = total_nutrients(food_raw)
+        block = np.empty((food_raw.shape[0], len(self._food_fns)), dtype=np.float64)
+        for k, fn in enumerate(self._food_fns):
+            block[:, k] = fn(food_raw, total)
+        return block
+
+    def combine(self, raw: np.ndarray, block: np.ndarray) -> np.ndarray:
+        """``transform(raw)`` with the nutrient-only columns taken from a precomputed ``block``.
+
+        Only the user and user x nutrient columns are computed here.
+        """
+        raw = np.asarray(raw, dtype=np.float64).reshape(-1, len(BASE_COLUMNS))
+        out = np.empty((raw.shape[0], len(self.columns)), dtype=np.float64)
+        out[:] = self._constant
+        out[:, self.food_columns] = block
+        for j, part in self._user_parts:
+            if part[0] == 'user':
+                out[:, j] = raw[:, part[1]]
+            else:
+                out[:, j] = raw[:, part[1]] * raw[:, part[2]]
+        np.nan_to_num(out, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        return out
+
+    def cross(self, user_raw: np.ndarray, food_raw: np.ndarray, food_block: Optional[np.ndarray] = None) -> np.ndarray:
+        """Feature matrix for every (user, food) pair, row ``u * n_foods + f``.
+
+        Equal to ``transform`` on the U x F combined raw rows, but user-only
+        columns are computed once per user, nutrient-only columns once per
+        food (or taken from ``food_block``), and the user x nutrient
+        interactions by broadcasting.
+        """
+        user_raw = np.asarray(user_raw, dtype=np.float64).reshape(-1, len(BASE_COLUMNS))
+        food_raw = np.asarray(food_raw, dtype=np.float64).reshape(-1, len(BASE_COLUMNS))
+        n_users, n_foods = user_raw.shape[0], food_raw.shape[0]
+        out = np.empty((n_users, n_foods, len(self.columns)), dtype=np.float64)
+        out[:] = self._constant
+        if food_block is None:
+            food_block = self.food_block(food_raw)
+        out[:, :, self.food_columns] = food_block[None, :, :]
+        for j, part in self._user_parts:
+            if part[0] == 'user':
+                out[:, :, j] = user_raw[:, part[1], None]
+            else:
+                out[:, :, j] = food_raw[None, :, part[1]] * user_raw[:, part[2], None]
+        out = out.reshape(n_users * n_foods, len(self.columns))
+        np.nan_to_num(out, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        return out
+
+
+class FoodBlockCache:
+    """Nutrient-only feature columns of one FeaturePlan, precomputed per catalog food.
+
+    ``sync`` takes ``(food_id, (carb, protein, fat, dietary_fiber))`` pairs and
+    only recomputes rows for foods that are new or whose nutrients changed.
+    Rows are replaced as one tuple, so readers never see a half-updated cache.
+    """
+
+    def __init__(self, plan: FeaturePlan):
+        self.plan = plan
+        self.source = None  # object the rows were last synced from (e.g. the catalog)
+        self.recomputed = 0
+        # food_id -> (row, nutrients), block
+        self._data = ({}, np.empty((0, len(plan.food_columns))))
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    def sync(self, foods: Sequence, source=None) -> int:
+        """Rebuild the rows for ``foods``; returns how many rows had to be recomputed."""
+        old_index, old_block = self._data
+        index: Dict[str, tuple] = {}
+        block = np.empty((len(foods), len(self.plan.food_columns)), dtype=np.float64)
+        changed, changed_nut = [], []
+        for r, (food_id, values) in enumerate(foods):
+            values = tuple(float(v) for v in values)
+            index[food_id] = (r, values)
+            old = old_index.get(food_id)
+            if old is not None and old[1] == values:
+                block[r] = old_block[old[0]]
+            else:
+                changed.append(r)
+                changed_nut.append(values)
+        if changed:
+            raw = np.zeros((len(changed), len(BASE_COLUMNS)), dtype=np.float64)
+            raw[:, [_BASE_INDEX[c] for c in NUTRIENT_COLS]] = changed_nut
+            block[changed] = self.plan.food_block(raw)
+        self._data = (index, block)
+        self.source = source
+        self.recomputed += len(changed)
+        return len(changed)
+
+    def lookup(self, food_id: Optional[str], nutrients: tuple) -> Optional[np.ndarray]:
+        """Cached block row for ``food_id``, if present and computed from the same ``nutrients``."""
+        if not food_id:
+            return None
+        index, block = self._data
+        entry = index.get(food_id)
+        if entry is None or entry[1] != nutrients:
+            return None
+        return block[entry[0]]
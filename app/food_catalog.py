@@ -0,0 +1,181 @@
+"""Server-side food composition catalog with prefix and trigram search.
+
+Foods (per-100g carb/protein/fat/dietary fiber) are loaded from a CSV or JSON
+file into memory. Two indexes back the autocomplete search:
+
+* a sorted list of (name token, food) pairs, so every query token is matched
+  as a prefix with two binary searches;
+* a trigram -> foods inverted index, used to fill up the results with fuzzy
+  matches (typos, missing spaces) when prefixes alone find too few.
+"""
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import csv
+import json
+import re
+import unicodedata
+
+NUTRIENT_FIELDS = ('carb', 'protein', 'fat', 'dietary_fiber')
+# Alternative column / key names accepted in catalog files (lowercased)
+_ALIASES = {
+    'food_id': 'id', 'key': 'id',
+    'label': 'name', 'food': 'name', 'food item': 'name', 'food_item': 'name',
+    'carbohydrate': 'carb', 'carb(g/100g)': 'carb',
+    'protien': 'protein', 'protien(g/100g)': 'protein',
+    'fat(g/100g)': 'fat',
+    'fiber': 'dietary_fiber', 'dietary fiber': 'dietary_fiber', 'dietary fiber(g/100g)': 'dietary_fiber',
+}
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free, alphanumeric tokens separated by single spaces."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def _slug(text: str) -> str:
+    return normalize(text).replace(' ', '_')
+
+
+def _trigrams(norm: str) -> set:
+    padded = f'  {norm} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Food:
+    __slots__ = ('id', 'name', 'carb', 'protein', 'fat', 'dietary_fiber', 'norm')
+
+    def __init__(self, id: str, name: str, carb: float, protein: float, fat: float, dietary_fiber: float):
+        self.id = id
+        self.name = name
+        self.carb = carb
+        self.protein = protein
+        self.fat = fat
+        self.dietary_fiber = dietary_fiber
+        self.norm = normalize(name)
+
+    def nutrients(self) -> Dict[str, float]:
+        """Per-100g values keyed by PredictInput field name."""
+        return {f: getattr(self, f) for f in NUTRIENT_FIELDS}
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'name': self.name, **self.nutrients()}
+
+
+class FoodCatalog:
+    """In-memory foods keyed by id, with ``search`` for autocomplete."""
+
+    def __init__(self, foods: List[Food]):
+        self.foods: List[Food] = []
+        self._by_id: Dict[str, int] = {}
+        for food in foods:
+            if food.id in self._by_id:
+                raise ValueError(f'Duplicate food id: {food.id}')
+            self._by_id[food.id] = len(self.foods)
+            self.foods.append(food)
+        tokens = []
+        self._trigram_index: Dict[str, List[int]] = {}
+        self._trigram_counts: List[int] = []
+        for i, food in enumerate(self.foods):
+            for pos, tok in enumerate(food.norm.split()):
+                tokens.append((tok, pos, i))
+            grams = _trigrams(food.norm)
+            self._trigram_counts.append(len(grams))
+            for g in grams:
+                self._trigram_index.setdefault(g, []).append(i)
+        tokens.sort()
+        self._tokens = [t[0] for t in tokens]
+        self._token_refs = [(t[1], t[2]) for t in tokens]
+
+    def __len__(self) -> int:
+        return len(self.foods)
+
+    def get(self, food_id: str) -> Optional[Food]:
+        i = self._by_id.get(food_id)
+        return self.foods[i] if i is not None else None
+
+    def _prefix_matches(self, token: str) -> Dict[int, int]:
+        """food index -> earliest position of a name token starting with ``token``."""
+        lo = bisect_left(self._tokens, token)
+        hi = bisect_left(self._tokens, token + '\x7f', lo)
+        found: Dict[int, int] = {}
+        for pos, i in self._token_refs[lo:hi]:
+            if pos < found.get(i, 1 << 30):
+                found[i] = pos
+        return found
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """Best matches for ``query``: foods whose name tokens start with every query token
+        (whole-name prefix first, then earlier token position, then shorter names), topped
+        up with trigram matches when fewer than ``limit`` are found."""
+        norm = normalize(query)
+        if not norm or limit <= 0:
+            return []
+        q_tokens = norm.split()
+        hits = None
+        for tok in q_tokens:
+            found = self._prefix_matches(tok)
+            hits = found if hits is None else {i: max(p, found[i]) for i, p in hits.items() if i in found}
+            if not hits:
+                break
+        ranked = sorted(
+            hits or {},
+            key=lambda i: (not self.foods[i].norm.startswith(norm), hits[i], len(self.foods[i].norm), self.foods[i].norm),
+        )
+        results = [{**self.foods[i].to_dict(), 'match': 'prefix', 'score': 1.0} for i in ranked[:limit]]
+        if fuzzy and len(results) < limit:
+            seen = set(ranked)
+            q_grams = _trigrams(norm)
+            shared: Dict[int, int] = {}
+            for g in q_grams:
+                for i in self._trigram_index.get(g, ()):
+                    if i not in seen:
+                        shared[i] = shared.get(i, 0) + 1
+            scored = []
+            for i, n in shared.items():
+                # Jaccard similarity of the trigram sets
+                score = n / (len(q_grams) + self._trigram_counts[i] - n)
+                if score >= 0.3:
+                    scored.append((-score, self.foods[i].norm, i))
+            scored.sort()
+            for neg, _, i in scored[:limit - len(results)]:
+                results.append({**self.foods[i].to_dict(), 'match': 'fuzzy', 'score': round(-neg, 3)})
+        return results
+
+
+def _float(value) -> float:
+    if value in (None, ''):
+        return 0.0
+    return float(value)
+
+
+def _food_from_record(record: dict) -> Food:
+    rec = {}
+    for k, v in record.items():
+        key = str(k).strip().lower()
+        rec[_ALIASES.get(key, key)] = v
+    name = str(rec.get('name') or '').strip()
+    if not name:
+        raise ValueError(f'Food record without a name: {record}')
+    food_id = str(rec.get('id') or '').strip() or _slug(name)
+    return Food(food_id, name, *(_float(rec.get(f)) for f in NUTRIENT_FIELDS))
+
+
+def load_catalog(path: Union[str, Path]) -> FoodCatalog:
+    """Load foods from a CSV (header row) or JSON file.
+
+    JSON may be a list of food objects or a ``{name: {nutrients}}`` mapping
+    (the layout of ``FOOD_DATA`` in the Streamlit apps).
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        data = json.loads(path.read_text(encoding='utf-8'))
+        if isinstance(data, dict):
+            data = [{'name': name, **values} for name, values in data.items()]
+        records = data
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            records = list(csv.DictReader(f))
+    return FoodCatalog([_food_from_record(r) for r in records])
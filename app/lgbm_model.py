@@ -0,0 +1,161 @@
+"""Pure-NumPy evaluator for LightGBM text model files (``model.save_model``).
+
+Parses the v4 text format into flat node arrays shared by all trees and
+scores rows with a vectorized, level-by-level traversal. This avoids the
+lightgbm C library (and its libgomp dependency) at serving time.
+
+Only numerical splits are supported; models with categorical splits raise
+``ValueError`` at load time.
+"""
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+
+# LightGBM treats |x| <= kZeroThreshold as zero for MissingType::Zero
+_ZERO_THRESHOLD = 1e-35
+_MISSING_ZERO = 1
+_MISSING_NAN = 2
+
+_IDENTITY_OBJECTIVES = {
+    'regression', 'regression_l2', 'l2', 'mean_squared_error', 'mse', 'rmse',
+    'regression_l1', 'l1', 'mean_absolute_error', 'mae',
+    'huber', 'fair', 'quantile', 'mape',
+}
+_EXP_OBJECTIVES = {'poisson', 'gamma', 'tweedie'}
+
+
+def _parse_blocks(text: str):
+    """Split the model text into the header dict and a list of per-tree dicts."""
+    header: Dict[str, str] = {}
+    trees: List[Dict[str, str]] = []
+    current = header
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line == 'end of trees':
+            break
+        if line.startswith('Tree='):
+            current = {}
+            trees.append(current)
+            continue
+        if '=' in line:
+            key, _, value = line.partition('=')
+            current[key] = value
+    return header, trees
+
+
+def _floats(value: str) -> np.ndarray:
+    return np.array([float(v) for v in value.split()], dtype=np.float64)
+
+
+def _ints(value: str) -> np.ndarray:
+    return np.array([int(v) for v in value.split()], dtype=np.int64)
+
+
+class LightGBMTextModel:
+    """Regression model loaded from a LightGBM text dump.
+
+    All trees are flattened into shared arrays; per-tree ``root`` entries point
+    into them. Child references are global node ids when ``>= 0`` and encode a
+    leaf as ``-(leaf_id + 1)`` otherwise (leaf ids index ``leaf_value``).
+    """
+
+    def __init__(self, text: str):
+        header, trees = _parse_blocks(text)
+        if header.get('version') not in (None, 'v4'):
+            raise ValueError(f"Unsupported LightGBM model version: {header.get('version')}")
+        if int(header.get('num_class', '1')) != 1 or int(header.get('num_tree_per_iteration', '1')) != 1:
+            raise ValueError('Only single-output LightGBM models are supported.')
+        objective = header.get('objective', 'regression').split()[0]
+        if objective in _IDENTITY_OBJECTIVES:
+            self._link = None
+        elif objective in _EXP_OBJECTIVES:
+            self._link = np.exp
+        else:
+            raise ValueError(f'Unsupported LightGBM objective: {objective}')
+        self.objective = objective
+        self.feature_names: List[str] = header.get('feature_names', '').split()
+        self.n_features = int(header.get('max_feature_idx', len(self.feature_names) - 1)) + 1
+        self.average_output = 'average_output' in header
+
+        split_feature, threshold, decision_type = [], [], []
+        left_child, right_child, leaf_value, roots = [], [], [], []
+        n_nodes = n_leaves = 0
+        for t in trees:
+            if int(t.get('num_cat', '0')) > 0:
+                raise ValueError('LightGBM models with categorical splits are not supported.')
+            leaves = _floats(t['leaf_value'])
+            if int(t['num_leaves']) <= 1:
+                roots.append(-(n_leaves + 1))
+            else:
+                left = _ints(t['left_child'])
+                right = _ints(t['right_child'])
+                # Rebase child references into the shared node/leaf arrays
+                left_child.append(np.where(left >= 0, left + n_nodes, -(~left + n_leaves) - 1))
+                right_child.append(np.where(right >= 0, right + n_nodes, -(~right + n_leaves) - 1))
+                split_feature.append(_ints(t['split_feature']))
+                threshold.append(_floats(t['threshold']))
+                decision_type.append(_ints(t['decision_type']))
+                roots.append(n_nodes)
+                n_nodes += len(left)
+            leaf_value.append(leaves)
+            n_leaves += len(leaves)
+
+        def _cat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+        self.split_feature = _cat(split_feature, np.int32)
+        self.threshold = _cat(threshold, np.float64)
+        decision = _cat(decision_type, np.int8)
+        if np.any(decision & 1):
+            raise ValueError('LightGBM models with categorical splits are not supported.')
+        self.default_left = (decision & 2) != 0
+        self.missing_type = (decision >> 2) & 3
+        self.left_child = _cat(left_child, np.int64)
+        self.right_child = _cat(right_child, np.int64)
+        self.leaf_value = _cat(leaf_value, np.float64)
+        self.roots = np.array(roots, dtype=np.int64)
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> 'LightGBMTextModel':
+        return cls(Path(path).read_text())
+
+    def predict(self, X) -> np.ndarray:
+        """Predict one value per row of ``X`` (array-like, n_rows x n_features)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f'Expected {self.n_features} features, got {X.shape[1]}')
+        n = X.shape[0]
+        if self.n_trees == 0:
+            return np.zeros(n, dtype=np.float64)
+
+        rows = np.arange(n)[:, None]
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        active = node >= 0
+        # Walk every (row, tree) pair one level per iteration until all reach a leaf
+        while active.any():
+            idx = np.where(active, node, 0)
+            fval = X[rows, self.split_feature[idx]]
+            mtype = self.missing_type[idx]
+            is_nan = np.isnan(fval)
+            fval = np.where(is_nan & (mtype != _MISSING_NAN), 0.0, fval)
+            missing = ((mtype == _MISSING_ZERO) & (np.abs(fval) <= _ZERO_THRESHOLD)) | (
+                (mtype == _MISSING_NAN) & is_nan
+            )
+            go_left = np.where(missing, self.default_left[idx], fval <= self.threshold[idx])
+            nxt = np.where(go_left, self.left_child[idx], self.right_child[idx])
+            node = np.where(active, nxt, node)
+            active = node >= 0
+
+        # Accumulate trees in order (cumsum is sequential, unlike pairwise sum) to match lightgbm
+        out = np.cumsum(self.leaf_value[-node - 1], axis=1)[:, -1]
+        if self.average_output:
+            out = out / self.n_trees
+        if self._link is not None:
+            out = self._link(out)
+        return out
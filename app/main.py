@@ -1,20 +1,64 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
+from pydantic import BaseModel, ValidationError
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import io
 import csv
-from datetime import datetime
+import json
+import asyncio
+import gc
+import hashlib
+import hmac
+import os
+import threading
+import time
+import uuid
+import warnings
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 
 import numpy as np
 import pandas as pd
 
-app = FastAPI(title="PPGI FastAPI")
+from .bulk import BulkParseError, parser_for
+from .cache import LRUCache
+from .codec import FastJSONResponse, PredictRecord, replace
+from .encoding import CompiledTargetEncoder, compile_target_encoder
+from .features import BASE_COLUMNS, NUTRIENT_COLS, FeaturePlan, FoodBlockCache
+from .food_catalog import NUTRIENT_FIELDS, FoodCatalog, load_catalog
+from .lgbm_model import LightGBMTextModel
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, MetricsMiddleware
+from .rf_compact import CompactForest
+from .rf_flat import FlatForest, SmallBatchForest
+from .profiler import Profiler
+from .registry import DEFAULT_VERSION, ModelRegistry
+from .response_cache import ResponseCache, canonical_key, etag_for
+from .result_store import ResultStore
+from .scheduler import InferenceQueueFull, InferenceScheduler
+from .static_assets import StaticAssets
 
-# Serve the static frontend from the "static" directory (reverted to relative for Railway)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Workers forked from a preloaded master already have the model; otherwise
+    # load it in the background so the first request does not pay for it.
+    if _state is None:
+        threading.Thread(target=_warm_model, name="model-warmup", daemon=True).start()
+    yield
+    _scheduler.shutdown()
+    if _result_store is not None:
+        _result_store.close()
+
+app = FastAPI(title="PPGI FastAPI", lifespan=_lifespan)
+
+# Static frontend, read into memory once: pre-compressed (gzip/brotli), ETags, and
+# content-hashed /static URLs (referenced from the pages) with far-future caching
+_static = StaticAssets(Path(__file__).parent.parent / "static")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def static_asset(path: str, request: Request):
+    return _static.response(path, request)
 
 class PredictInput(BaseModel):
     age: float = 30.0
@@ -32,12 +76,224 @@ class PredictInput(BaseModel):
     # are for the serving (the value is per-serving). When set, server
     # will convert them to per-100g before passing to the model.
     nutrients_per_serving: bool = False
+    # Catalog food (see /api/foods): when set, the server fills food_item and the
+    # per-100g nutrients from the catalog and ignores the values sent here.
+    food_id: Optional[str] = None
+
+# codec.PredictRecord mirrors PredictInput by hand; fail at import if they drift apart
+if (PredictRecord._fields != tuple(PredictInput.model_fields)
+        or PredictRecord._field_defaults != {k: f.default for k, f in PredictInput.model_fields.items()}):
+    raise RuntimeError('codec.PredictRecord fields/defaults are out of sync with PredictInput')
+
+class GIMatrixInput(BaseModel):
+    # Only the user fields (age, weight, height_cm, waist_circumference) are read from users,
+    # and only the food fields (food_item, nutrients, portion) from foods.
+    users: List[PredictInput]
+    foods: List[PredictInput]
+
+# PredictInput fields that describe the user rather than the food
+USER_FIELDS = ('age', 'weight', 'height_cm', 'waist_circumference')
+# Numeric PredictInput fields a sweep axis can vary
+SWEEP_FIELDS = USER_FIELDS + NUTRIENT_FIELDS + ('portion_g',)
+
+class SweepAxis(BaseModel):
+    # ``steps`` evenly spaced values from start to stop (both included)
+    field: str
+    start: float
+    stop: float
+    steps: int = 11
+
+class SweepInput(BaseModel):
+    # One or two axes; every other field comes from base
+    base: PredictInput
+    axes: List[SweepAxis]
+
+class _ModelState:
+    """A loaded model plus everything the feature path needs to feed it.
+
+    The active state is replaced as a single object (see _swap_state), so a
+    request that picked up one state never mixes it with another model's
+    feature columns or encoder.
+    """
+
+    def __init__(self, model, backend: str, feature_columns: Optional[list] = None,
+                 is_pipeline: bool = False, target_encoder: Optional[object] = None,
+                 version: str = 'default', source: Optional[Path] = None):
+        self.model = model
+        # Which model family serves predictions: 'random_forest', 'pipeline' or 'lightgbm'
+        self.backend = backend
+        self.feature_columns = feature_columns
+        self.is_pipeline = is_pipeline
+        self.target_encoder = target_encoder
+        # Dict lookup tables equivalent to target_encoder.transform (None if not verified)
+        self.encoder_tables: Optional[CompiledTargetEncoder] = _compiled_encoder(target_encoder)
+        self.version = version
+        self.source = source
+        self.feature_plan: Optional[FeaturePlan] = None
+        self.feature_plan_checked = False
+        # Nutrient-only feature columns per catalog food (see _food_block_cache)
+        self.food_blocks: Optional[FoodBlockCache] = None
+        # Glucose-reference IAUC per user profile. One cache per state, so requests still
+        # running on a swapped-out model can never write their values into its successor's
+        self.glucose_refs = LRUCache(maxsize=GLUCOSE_CACHE_SIZE, ttl=GLUCOSE_CACHE_TTL)
+        # Identity of the loaded artifact files (see _artifact_fingerprint)
+        self.fingerprint = ''
+
+    @property
+    def label(self) -> str:
+        """Value reported as ``source`` in results: backend and model version."""
+        return f"{self.backend}:{self.version}"
 
-_rf_model: Optional[object] = None
-_feature_columns: Optional[list] = None
-_is_pipeline: bool = False
+    @property
+    def cache_version(self) -> str:
+        """Response-cache namespace: the label plus the artifact fingerprint."""
+        return f"{self.label}:{self.fingerprint}"
+
+_state: Optional[_ModelState] = None
 _last_result: Optional[dict] = None
 _target_encoder: Optional[object] = None
+_target_encoder_path: Optional[Path] = None
+_model_lock = threading.Lock()
+_model_load_error: Optional[str] = None
+_compiled_encoders: dict = {}
+
+# Categorical columns present during training; the UI does not collect them, so
+# every request uses these stable defaults
+_CATEGORICAL_DEFAULTS = {
+    'Gender': 'Male',
+    'Family history diabetics': 'No',
+    'Physical activity': 'Light',
+    'Health Problem': 'None',
+    'Alcoholic': 'No',
+    'Blood Group': 'Unknown',
+}
+
+# The array feature path feeds plain ndarrays to a model fitted on a DataFrame;
+# columns are already in feature_names_in_ order, so the name check is moot.
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+# Model backend selection: 'auto' (Pipeline, else bare RF), 'pipeline',
+# 'random_forest' or 'lightgbm' (text model evaluated in NumPy, see lgbm_model.py)
+MODEL_BACKEND = os.environ.get("PPGI_MODEL_BACKEND", "auto").strip().lower()
+LGBM_MODEL_PATH = os.environ.get("PPGI_LGBM_MODEL", "")
+# Serve bare RandomForest artifacts through the flattened array predictor (rf_flat.py)
+USE_FLAT_FOREST = os.environ.get("PPGI_FLAT_FOREST", "1") != "0"
+# Largest batch served by the flat/compact array predictors; bigger batches use sklearn's
+# predict, which scales better with the number of rows
+FLAT_FOREST_MAX_ROWS = int(os.environ.get("PPGI_FLAT_FOREST_MAX_ROWS", "64"))
+# Flattened forests are dumped here as .npy files and memory-mapped on later loads,
+# so all workers share one page-cache copy of the trees ('' disables the dump).
+MODEL_CACHE_DIR = os.environ.get("PPGI_MODEL_CACHE_DIR", str(Path(__file__).parent.parent / ".model_cache"))
+# Load the model at import time (set by start.sh together with gunicorn --preload)
+PRELOAD_MODEL = os.environ.get("PPGI_PRELOAD", "0") == "1"
+# Versioned artifacts for the model registry (one file or bundle directory per version)
+MODEL_DIR = os.environ.get("PPGI_MODEL_DIR", str(Path(__file__).parent.parent / "models"))
+# Manifest of a bundle directory (model + encoder + feature columns, see app/train.py)
+BUNDLE_MANIFEST = "bundle.json"
+# Food composition catalog (CSV or JSON, per-100g nutrients) behind /api/foods and food_id
+FOOD_CATALOG_PATH = os.environ.get("PPGI_FOOD_CATALOG", str(Path(__file__).parent.parent / "data" / "foods.csv"))
+# Seconds between checks of the catalog file for changes (0 disables reloading)
+FOOD_CATALOG_SYNC = float(os.environ.get("PPGI_FOOD_CATALOG_SYNC", "5"))
+# Rendered /api/predict responses per (inputs, model version): per-process LRU size (0 disables),
+# SQLite file shared by all workers ('' keeps the cache per process) and its entry limit
+RESPONSE_CACHE_SIZE = int(os.environ.get("PPGI_RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_DB = os.environ.get("PPGI_RESPONSE_CACHE_DB", str(Path(__file__).parent.parent / ".data" / "response_cache.sqlite3"))
+RESPONSE_CACHE_SHARED_SIZE = int(os.environ.get("PPGI_RESPONSE_CACHE_SHARED_SIZE", "100000"))
+# Prediction history shared by all workers (SQLite, WAL mode); '' keeps only an in-memory last result
+RESULT_DB = os.environ.get("PPGI_RESULT_DB", str(Path(__file__).parent.parent / ".data" / "results.sqlite3"))
+SESSION_COOKIE = "ppgi_session"
+# Shared secret for /admin endpoints (X-Admin-Token header); admin API is disabled when unset
+ADMIN_TOKEN = os.environ.get("PPGI_ADMIN_TOKEN", "")
+
+# Prometheus metrics at /metrics (PPGI_METRICS=0 disables); each process dumps its counters
+# to PPGI_METRICS_DIR every PPGI_METRICS_FLUSH seconds so /metrics covers all workers
+METRICS_ENABLED = os.environ.get("PPGI_METRICS", "1") != "0"
+METRICS_DIR = os.environ.get("PPGI_METRICS_DIR", str(Path(__file__).parent.parent / ".data" / "metrics"))
+METRICS_FLUSH = float(os.environ.get("PPGI_METRICS_FLUSH", "5"))
+# Output of /admin/profile sessions (collapsed stacks, allocation reports), shared by all workers
+PROFILE_DIR = os.environ.get("PPGI_PROFILE_DIR", str(Path(__file__).parent.parent / ".data" / "profiles"))
+
+# Glucose-reference IAUCs cached per loaded model: entries (user profiles) and TTL in seconds (0 = none)
+GLUCOSE_CACHE_SIZE = int(os.environ.get("PPGI_GLUCOSE_CACHE_SIZE", "4096"))
+GLUCOSE_CACHE_TTL = float(os.environ.get("PPGI_GLUCOSE_CACHE_TTL", "3600"))
+# Upper bound on items accepted by /api/predict/batch in a single request
+MAX_BATCH_ITEMS = int(os.environ.get("PPGI_MAX_BATCH_ITEMS", "1000"))
+# Upper bound on users x foods cells accepted by /api/predict/matrix
+MAX_MATRIX_CELLS = int(os.environ.get("PPGI_MAX_MATRIX_CELLS", "100000"))
+# Upper bound on grid cells (product of the axis steps) accepted by /api/predict/sweep
+MAX_SWEEP_CELLS = int(os.environ.get("PPGI_MAX_SWEEP_CELLS", "10000"))
+# Rows scored per model call by the streaming upload endpoint (/api/predict/stream)
+STREAM_CHUNK_ROWS = int(os.environ.get("PPGI_STREAM_CHUNK_ROWS", "256"))
+
+# Inference runs on a pool (PPGI_INFERENCE_EXECUTOR=thread|process) so it never blocks
+# the event loop; requests arriving within PPGI_BATCH_WINDOW_MS are scored together.
+# Once PPGI_MAX_QUEUE requests are waiting, new ones are rejected with 429.
+INFERENCE_EXECUTOR = os.environ.get("PPGI_INFERENCE_EXECUTOR", "thread").strip().lower()
+INFERENCE_WORKERS = int(os.environ.get("PPGI_INFERENCE_WORKERS", "2"))
+BATCH_WINDOW_MS = float(os.environ.get("PPGI_BATCH_WINDOW_MS", "2"))
+MAX_BATCH_ROWS = int(os.environ.get("PPGI_MAX_BATCH_ROWS", "256"))
+MAX_QUEUE = int(os.environ.get("PPGI_MAX_QUEUE", "1000"))
+
+_result_store: Optional[ResultStore] = ResultStore(RESULT_DB) if RESULT_DB else None
+_profiler = Profiler(PROFILE_DIR)
+_metrics = Metrics(METRICS_ENABLED, METRICS_DIR, METRICS_FLUSH)
+_metrics.describe("ppgi_inference_rows_total", "counter", "Rows sent to the model, by kind (food or glucose_ref).")
+_metrics.describe("ppgi_errors_total", "counter", "Failed predictions by exception class.")
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, metrics=_metrics)
+_response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_DB if RESPONSE_CACHE_SIZE > 0 else None, RESPONSE_CACHE_SHARED_SIZE,
+)
+
+_food_catalog_error: Optional[str] = None
+_food_catalog_mtime: Optional[int] = None
+_food_catalog_next_check = 0.0
+_food_blocks_lock = threading.Lock()
+
+def _catalog_mtime() -> Optional[int]:
+    try:
+        return os.stat(FOOD_CATALOG_PATH).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+def _load_food_catalog() -> FoodCatalog:
+    """Catalog from PPGI_FOOD_CATALOG, or an empty one (error kept for /api/foods)."""
+    global _food_catalog_error, _food_catalog_mtime
+    _food_catalog_mtime = _catalog_mtime()
+    if FOOD_CATALOG_PATH and os.path.exists(FOOD_CATALOG_PATH):
+        try:
+            catalog = load_catalog(FOOD_CATALOG_PATH)
+            _food_catalog_error = None
+            return catalog
+        except Exception as e:
+            _food_catalog_error = f"{e.__class__.__name__}: {e}"
+    return FoodCatalog([])
+
+def _reload_food_catalog() -> None:
+    """Swap in the edited catalog file and bring the active model's food blocks up to date."""
+    global _food_catalog
+    catalog = _load_food_catalog()
+    if _food_catalog_error is None:
+        _food_catalog = catalog
+        if _state is not None:
+            _food_block_cache(_state)
+
+def _maybe_reload_food_catalog() -> None:
+    """Pick up edits to the catalog file (checked at most every PPGI_FOOD_CATALOG_SYNC seconds)."""
+    global _food_catalog_next_check
+    now = time.monotonic()
+    if FOOD_CATALOG_SYNC <= 0 or now < _food_catalog_next_check:
+        return
+    _food_catalog_next_check = now + FOOD_CATALOG_SYNC
+    if _catalog_mtime() != _food_catalog_mtime:
+        threading.Thread(target=_reload_food_catalog, name="food-catalog-reload", daemon=True).start()
+
+_food_catalog = _load_food_catalog()
+
+# Glucose-reference IAUC per (model, age, weight, height, waist). The reference
+# does not depend on the food, so repeat users skip the second inference.
+# Lookups counted by the glucose-reference caches of swapped-out models (keeps the metrics monotonic)
+_retired_glucose_refs = {"hits": 0, "misses": 0}
 
 def _engineer_features(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -82,6 +338,23 @@ def _engineer_features(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+def _get_state() -> _ModelState:
+    """Active model state, loading the initial version on first use."""
+    if _state is not None:
+        return _state
+    # Inference runs on executor threads; make sure only one of them loads the model
+    with _model_lock:
+        if _state is None:
+            version = _registry.marker_version()
+            if version and _registry.get(version) is not None:
+                try:
+                    _registry.activate(version, publish=False)
+                except Exception:
+                    pass
+            if _state is None:
+                _registry.activate(DEFAULT_VERSION, publish=False)
+        return _state
+
 def _load_rf_model():
     """Lazy-load Random Forest model from joblib, and optional target encoder.
 
@@ -89,35 +362,22 @@ def _load_rf_model():
     target encoder (target_encoder.joblib) to reproduce training preprocessing
     for categorical variables when not using a full Pipeline.
     """
-    global _rf_model, _feature_columns, _is_pipeline, _target_encoder
-    if _rf_model is not None:
-        return _rf_model
+    return _get_state().model
 
+def _import_joblib():
     try:
         import joblib  # scikit-learn models are typically saved with joblib
     except Exception as e:
         raise RuntimeError("joblib is required to load the RandomForest model.") from e
+    return joblib
 
-    # Model path preference: prefer full Pipeline if available, otherwise RF model.
-    root = Path(__file__).parent.parent
-    # Ensure custom training modules (e.g., ml_pipeline.py) are importable when loading a Pipeline
-    try:
-        import sys as _sys
-        nb_dir = root / 'NoteBooks'
-        if nb_dir.exists():
-            p = str(nb_dir)
-            if p not in _sys.path:
-                _sys.path.insert(0, p)
-    except Exception:
-        pass
-    candidates = [
-        root / 'NoteBooks' / 'out' / 'final_iauc_pipeline.joblib',
-        root / 'random_forest_model.joblib',
-        root / 'NoteBooks' / 'random_forest_model.joblib',
-    ]
+def _load_target_encoder(root: Path) -> Optional[object]:
+    """Load (once) the saved target encoder shared by artifacts that do not bundle their own."""
+    global _target_encoder, _target_encoder_path
     # Attempt to load a saved target encoder if present
     try:
         if _target_encoder is None:
+            joblib = _import_joblib()
             enc_cands = [
                 root / 'target_encoder.joblib',
                 root / 'NoteBooks' / 'out' / 'target_encoder.joblib',
@@ -127,17 +387,65 @@ def _load_rf_model():
                 if ec.exists():
                     try:
                         _target_encoder = joblib.load(str(ec))
+                        _target_encoder_path = ec
                         break
                     except Exception:
                         continue
     except Exception:
         pass
+    return _target_encoder
+
+def _compiled_encoder(encoder) -> Optional[CompiledTargetEncoder]:
+    """Lookup tables for a fitted target encoder, verified against encoder.transform (memoized)."""
+    if encoder is None:
+        return None
+    key = id(encoder)
+    if key not in _compiled_encoders:
+        probe = _engineer_features(pd.DataFrame([_raw_feature_row(PredictInput())]))
+        _compiled_encoders[key] = compile_target_encoder(encoder, probe)
+    return _compiled_encoders[key]
+
+def _load_default_state(version: str = DEFAULT_VERSION) -> _ModelState:
+    """Load the built-in artifact chain (Pipeline, else bare RF, or LightGBM per PPGI_MODEL_BACKEND)."""
+    joblib = _import_joblib()
+
+    # Model path preference: prefer full Pipeline if available, otherwise RF model.
+    root = Path(__file__).parent.parent
+    # Ensure custom training modules (e.g., ml_pipeline.py) are importable when loading a Pipeline
+    try:
+        import sys as _sys
+        nb_dir = root / 'NoteBooks'
+        if nb_dir.exists():
+            p = str(nb_dir)
+            if p not in _sys.path:
+                _sys.path.insert(0, p)
+    except Exception:
+        pass
+    candidates = [
+        root / 'NoteBooks' / 'out' / 'final_iauc_pipeline.joblib',
+        root / 'random_forest_model.joblib',
+        root / 'NoteBooks' / 'random_forest_model.joblib',
+    ]
+    encoder = _load_target_encoder(root)
+    if MODEL_BACKEND == 'lightgbm':
+        lgbm_cands = [Path(LGBM_MODEL_PATH)] if LGBM_MODEL_PATH else [
+            root / 'lightgbm_model.txt',
+            root / 'NoteBooks' / 'lightgbm_model.txt',
+        ]
+        for c in lgbm_cands:
+            if c.exists():
+                return _load_lightgbm_state(c, encoder, version)
+        raise FileNotFoundError(f"LightGBM model not found. Tried: {', '.join(str(c) for c in lgbm_cands)}")
+    if MODEL_BACKEND == 'random_forest':
+        candidates = candidates[1:]
+    elif MODEL_BACKEND == 'pipeline':
+        candidates = candidates[:1]
     last_err: Optional[Exception] = None
     for c in candidates:
         if not c.exists():
             continue
         try:
-            model = joblib.load(str(c))
+            return _load_joblib_state(c, encoder, version, joblib)
         except ModuleNotFoundError as e:
             # If the pipeline refers to a custom module (e.g., ml_pipeline) that's not
             # present in the server environment, skip this candidate and try next.
@@ -147,26 +455,6 @@ def _load_rf_model():
             last_err = e
             continue
 
-        # Loaded successfully; determine model type and feature info
-        try:
-            from sklearn.pipeline import Pipeline  # type: ignore
-            if isinstance(model, Pipeline):
-                _is_pipeline = True
-                _rf_model = model
-                return _rf_model
-            if hasattr(model, 'feature_names_in_'):
-                _feature_columns = list(model.feature_names_in_)
-            elif isinstance(model, tuple) and len(model) == 2:
-                m, cols = model
-                _rf_model = m
-                _feature_columns = list(cols)
-                return _rf_model
-        except Exception:
-            _feature_columns = None
-
-        _rf_model = model
-        return _rf_model
-
     # If we got here, nothing loaded; surface a helpful message
     if last_err is not None:
         raise RuntimeError(
@@ -174,95 +462,749 @@ def _load_rf_model():
         ) from last_err
     raise FileNotFoundError('Model not found. Expected final_iauc_pipeline.joblib (NoteBooks/out/) or random_forest_model.joblib (project root/NoteBooks/)')
 
-def _build_feature_frame(payload: PredictInput) -> pd.DataFrame:
-    # Build the input dataframe
-    hip_circ = 95.0  # Assumed hip circumference if not collected
-    wc = float(payload.waist_circumference or 0.0)
-    wth_ratio = (wc / hip_circ) if hip_circ else 0.0
+def _load_joblib_state(path: Path, encoder: Optional[object], version: str, joblib=None) -> _ModelState:
+    """Load a joblib artifact: a Pipeline, a bare forest, or a (model, columns) tuple."""
+    joblib = joblib or _import_joblib()
+    model = joblib.load(str(path))
 
-    if _is_pipeline:
-        # For full Pipeline models: provide raw features, let the pipeline handle encoding/FE
-        # Compute BMI if height is provided
-        h_cm = float(payload.height_cm) if (getattr(payload, 'height_cm', None) not in (None, "")) else None
-        bmi = float(payload.weight) / ((h_cm/100.0)**2) if (h_cm and h_cm > 0) else np.nan
-        df_raw = pd.DataFrame([{
-            # We keep minimal UI; set stable defaults for categorical fields used in training
-            'Gender': 'Male',
-            'Age': float(payload.age or 0.0),
-            'Weight(kg)': float(payload.weight or 0.0),
-            'Height(cm)': h_cm if h_cm else np.nan,
-            'BMI(kg/m2)': bmi,
-            'Waist circumference': wc,
-            'Hip circumference': hip_circ,
-            'WC/HC': wth_ratio,
-            'Family history diabetics': 'No',
-            'Physical activity': 'Light',
-            'Health Problem': 'None',
-            'Alcoholic': 'No',
-            'Blood Group': 'Unknown',
-            'Carb(g/100g)': float(payload.carb or 0.0),
-            'Protien(g/100g)': float(payload.protein or 0.0),
-            'Fat(g/100g)': float(payload.fat or 0.0),
-            'Dietary Fiber(g/100g)': float(payload.dietary_fiber or 0.0),
-        }])
-        return df_raw
+    # Loaded successfully; determine model type and feature info
+    feature_columns = None
+    try:
+        from sklearn.pipeline import Pipeline  # type: ignore
+        if isinstance(model, Pipeline):
+            return _ModelState(model, 'pipeline', is_pipeline=True, version=version, source=path)
+        if hasattr(model, 'feature_names_in_'):
+            feature_columns = list(model.feature_names_in_)
+        elif isinstance(model, tuple) and len(model) == 2:
+            m, cols = model
+            model, feature_columns = m, list(cols)
+    except Exception:
+        feature_columns = None
+
+    return _ModelState(_flatten_forest(model, path, feature_columns), 'random_forest', feature_columns,
+                       target_encoder=encoder, version=version, source=path)
+
+def _load_lightgbm_state(path: Path, encoder: Optional[object], version: str) -> _ModelState:
+    """Load a LightGBM text model, evaluated with NumPy (see lgbm_model.py).
+
+    LightGBM replaces spaces in feature names with underscores; names are
+    mapped back to the engineered column names so the usual feature path applies.
+    """
+    model = LightGBMTextModel.from_file(path)
+    known = _engineer_features(pd.DataFrame([_raw_feature_row(PredictInput())])).columns
+    lookup = {col.replace(' ', '_'): col for col in known}
+    feature_columns = [lookup.get(name, name) for name in model.feature_names]
+    return _ModelState(model, 'lightgbm', feature_columns, target_encoder=encoder, version=version, source=path)
+
+def _load_bundle_state(path: Path, version: str) -> _ModelState:
+    """Load a bundle directory written by ``python -m app.train`` or ``python -m app.rf_compact``.
+
+    ``bundle.json`` names the model file (or compact forest directory), the
+    target encoder fitted with it and the feature columns it was trained on.
+    """
+    meta = json.loads((path / BUNDLE_MANIFEST).read_text())
+    encoder = None
+    if meta.get('target_encoder'):
+        encoder = _import_joblib().load(str(path / meta['target_encoder']))
+    model_path = path / meta['model']
+    if meta.get('model_format') == 'compact_forest':
+        model = CompactForest.load(model_path, mmap_mode='r')
+        if meta.get('fallback_model'):
+            # The original forest (identical predictions) serves the large batches;
+            # it is only loaded on the first one, so small-batch workers start as fast as the arrays
+            fallback = str(path / meta['fallback_model'])
+            model = SmallBatchForest(model, lambda: _import_joblib().load(fallback), FLAT_FOREST_MAX_ROWS)
+        state = _ModelState(model, 'random_forest', target_encoder=encoder, version=version)
+    elif meta.get('backend') == 'lightgbm':
+        state = _load_lightgbm_state(model_path, encoder, version)
     else:
-        # For bare RF models: do local feature engineering matching training as closely as feasible
-        # Compute BMI if height is provided
-        h_cm = float(payload.height_cm) if (getattr(payload, 'height_cm', None) not in (None, "")) else None
-        bmi = float(payload.weight) / ((h_cm/100.0)**2) if (h_cm and h_cm > 0) else np.nan
-        df = pd.DataFrame([{
-            'Age': float(payload.age or 0.0),
-            'Weight(kg)': float(payload.weight or 0.0),
-            'Height(cm)': h_cm if h_cm else np.nan,
-            'Waist circumference': wc,
-            'Hip circumference': hip_circ,
-            'BMI(kg/m2)': bmi,
-            'WC/HC': wth_ratio,
-            'Carb(g/100g)': float(payload.carb or 0.0),
-            'Protien(g/100g)': float(payload.protein or 0.0),
-            'Fat(g/100g)': float(payload.fat or 0.0),
-            'Dietary Fiber(g/100g)': float(payload.dietary_fiber or 0.0),
+        state = _load_joblib_state(model_path, encoder, version)
+    if meta.get('feature_columns'):
+        state.feature_columns = list(meta['feature_columns'])
+    state.source = path
+    return state
+
+def _load_version(version: str, path: Optional[Path]) -> _ModelState:
+    """Registry loader: the default chain for 'default', else the artifact at ``path``."""
+    if path is None:
+        state = _load_default_state(version)
+    elif path.is_dir():
+        state = _load_bundle_state(path, version)
+    else:
+        encoder = _load_target_encoder(Path(__file__).parent.parent)
+        if path.suffix == '.txt':
+            state = _load_lightgbm_state(path, encoder, version)
+        else:
+            state = _load_joblib_state(path, encoder, version)
+    state.fingerprint = _artifact_fingerprint(state)
+    return state
+
+def _artifact_fingerprint(state: _ModelState) -> str:
+    """Short hash of the backend, serving options and the (path, size, mtime) of every loaded artifact file.
+
+    Part of the response-cache key, so replacing the model or encoder files
+    (which keeps the version label, e.g. ``random_forest:default``) never
+    serves results cached for the previous artifacts.
+    """
+    paths = [state.source] if state.source is not None else []
+    if state.target_encoder is not None and state.target_encoder is _target_encoder and _target_encoder_path:
+        paths.append(_target_encoder_path)
+    parts = [state.backend, USE_FLAT_FOREST]
+    for path in paths:
+        files = sorted(f for f in path.rglob('*') if f.is_file()) if path.is_dir() else [path]
+        for f in files:
+            st = f.stat()
+            parts.append((str(f), st.st_size, st.st_mtime_ns))
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+def _warm_state(state: _ModelState) -> None:
+    """Run a few predictions through a freshly loaded state before it serves traffic."""
+    _get_feature_plan(state)
+    _food_block_cache(state)
+    warm = [PredictInput(), PredictInput(height_cm=170.0, carb=50.0, protein=5.0, fat=3.0, dietary_fiber=2.0)]
+    iauc_food, iauc_glu = _score_payloads(state, warm, use_cache=False)
+    if not np.all(np.isfinite(iauc_food)) or not np.all(np.isfinite(iauc_glu)):
+        raise ValueError(f"Model {state.version} produced non-finite warm-up predictions")
+
+def _swap_state(state: _ModelState) -> None:
+    """Make ``state`` the active model (single reference assignment)."""
+    global _state
+    previous, _state = _state, state
+    # Reference IAUCs live on the state, so the new model starts with an empty cache
+    if previous is not None and previous is not state:
+        _retired_glucose_refs["hits"] += previous.glucose_refs.hits
+        _retired_glucose_refs["misses"] += previous.glucose_refs.misses
+
+_registry = ModelRegistry(MODEL_DIR or None, _load_version, _warm_state, _swap_state)
+
+def _flat_dump_dir(source: Path) -> Optional[Path]:
+    """Dump location for a flattened artifact, keyed on its name, size and mtime."""
+    if not MODEL_CACHE_DIR:
+        return None
+    st = source.stat()
+    return Path(MODEL_CACHE_DIR) / f"{source.stem}-{st.st_size}-{st.st_mtime_ns}"
+
+def _load_flat_dump(source: Path) -> Optional[FlatForest]:
+    """Memory-map a previously dumped FlatForest for ``source`` if one exists."""
+    if not USE_FLAT_FOREST:
+        return None
+    try:
+        d = _flat_dump_dir(source)
+        if d is not None and (d / 'meta.json').exists():
+            return FlatForest.load(d, mmap_mode='r')
+    except Exception:
+        pass
+    return None
+
+def _flatten_forest(model, source: Optional[Path] = None, columns: Optional[list] = None):
+    """Wrap bare sklearn forests (when enabled) so small batches use a FlatForest, else return the model.
+
+    When ``source`` is given the flattened arrays are dumped next to the other
+    cached artifacts and re-opened memory-mapped, so later loads (and other
+    workers) skip the export and share the same physical pages. Batches above
+    FLAT_FOREST_MAX_ROWS rows still go to the sklearn estimator.
+    """
+    if not USE_FLAT_FOREST or FLAT_FOREST_MAX_ROWS < 1 or not hasattr(model, 'estimators_'):
+        return model
+    flat = _load_flat_dump(source) if source is not None else None
+    if flat is None:
+        try:
+            flat = FlatForest.from_sklearn(model)
+        except Exception:
+            # Unsupported estimator layout: keep sklearn's own predict
+            return model
+        try:
+            d = _flat_dump_dir(source) if source is not None else None
+            if d is not None:
+                flat.save(d, meta={'source': str(source), 'feature_names': columns})
+                flat = FlatForest.load(d, mmap_mode='r')
+        except Exception:
+            # Read-only filesystem etc.: serve the in-memory arrays
+            pass
+    return SmallBatchForest(flat, model, FLAT_FOREST_MAX_ROWS)
+
+def _warm_model() -> None:
+    """Load the model and compile the feature plan, recording (not raising) failures."""
+    global _model_load_error
+    try:
+        _get_feature_plan(_get_state())
+        _model_load_error = None
+    except Exception as e:
+        _model_load_error = f"{e.__class__.__name__}: {e}"
+
+def preload_model() -> None:
+    """Eagerly load model + encoder before gunicorn forks its workers.
+
+    Objects created here are moved to the permanent GC generation so the
+    collector in each worker does not touch (and copy-on-write) their pages.
+    """
+    _warm_model()
+    gc.collect()
+    gc.freeze()
+
+_HIP_CIRCUMFERENCE = 95.0  # Assumed hip circumference if not collected
+
+def _raw_feature_row(payload: PredictInput, pipeline: bool = False) -> dict:
+    """Raw (pre-engineering) training-layout row for a single payload."""
+    if not pipeline:
+        return {
+            **dict(zip(BASE_COLUMNS, _raw_values(payload))),
             # Categorical columns present during training; use stable defaults
-            'Gender': 'Male',
-            'Family history diabetics': 'No',
-            'Physical activity': 'Light',
-            'Health Problem': 'None',
-            'Alcoholic': 'No',
-            'Blood Group': 'Unknown',
-        }])
-
-        # Feature engineering similar to notebook
-        df_eng = _engineer_features(df)
-
-        # If a target encoder was saved and loaded, apply it now (transform only)
-        # NOTE: Encoder was fitted BEFORE dropping 'WC/HC' and 'BMI(kg/m2)' in the notebook,
-        # so preserve those columns for transform and drop them afterwards.
-        if _target_encoder is not None:
+            **_CATEGORICAL_DEFAULTS,
+        }
+    hip_circ = _HIP_CIRCUMFERENCE
+    wc = float(payload.waist_circumference or 0.0)
+    wth_ratio = (wc / hip_circ) if hip_circ else 0.0
+    # Compute BMI if height is provided
+    h_cm = float(payload.height_cm) if (getattr(payload, 'height_cm', None) not in (None, "")) else None
+    bmi = float(payload.weight) / ((h_cm/100.0)**2) if (h_cm and h_cm > 0) else np.nan
+
+    # For full Pipeline models: provide raw features, let the pipeline handle encoding/FE
+    return {
+        # We keep minimal UI; set stable defaults for categorical fields used in training
+        'Gender': _CATEGORICAL_DEFAULTS['Gender'],
+        'Age': float(payload.age or 0.0),
+        'Weight(kg)': float(payload.weight or 0.0),
+        'Height(cm)': h_cm if h_cm else np.nan,
+        'BMI(kg/m2)': bmi,
+        'Waist circumference': wc,
+        'Hip circumference': hip_circ,
+        'WC/HC': wth_ratio,
+        'Family history diabetics': _CATEGORICAL_DEFAULTS['Family history diabetics'],
+        'Physical activity': _CATEGORICAL_DEFAULTS['Physical activity'],
+        'Health Problem': _CATEGORICAL_DEFAULTS['Health Problem'],
+        'Alcoholic': _CATEGORICAL_DEFAULTS['Alcoholic'],
+        'Blood Group': _CATEGORICAL_DEFAULTS['Blood Group'],
+        'Carb(g/100g)': float(payload.carb or 0.0),
+        'Protien(g/100g)': float(payload.protein or 0.0),
+        'Fat(g/100g)': float(payload.fat or 0.0),
+        'Dietary Fiber(g/100g)': float(payload.dietary_fiber or 0.0),
+    }
+
+def _raw_values(payload: PredictInput) -> tuple:
+    """Numeric raw inputs of one payload in BASE_COLUMNS order (the non-pipeline row)."""
+    wc = float(payload.waist_circumference or 0.0)
+    h_cm = float(payload.height_cm) if (getattr(payload, 'height_cm', None) not in (None, "")) else None
+    bmi = float(payload.weight) / ((h_cm/100.0)**2) if (h_cm and h_cm > 0) else np.nan
+    return (
+        float(payload.age or 0.0),
+        float(payload.weight or 0.0),
+        h_cm if h_cm else np.nan,
+        wc,
+        _HIP_CIRCUMFERENCE,
+        bmi,
+        wc / _HIP_CIRCUMFERENCE,
+        float(payload.carb or 0.0),
+        float(payload.protein or 0.0),
+        float(payload.fat or 0.0),
+        float(payload.dietary_fiber or 0.0),
+    )
+
+def _build_feature_frames(payloads: List[PredictInput], state: Optional[_ModelState] = None) -> pd.DataFrame:
+    """Build one model input frame with a row per payload (same order)."""
+    state = state or _get_state()
+    df = pd.DataFrame([_raw_feature_row(p, state.is_pipeline) for p in payloads])
+    if state.is_pipeline:
+        return df
+    return _model_frame(df, state.feature_columns, state.target_encoder, state.encoder_tables)
+
+def _model_frame(df: pd.DataFrame, feature_columns: Optional[list], target_encoder: Optional[object] = None,
+                 encoder_tables: Optional[CompiledTargetEncoder] = None) -> pd.DataFrame:
+    """Bare RF/LightGBM input for raw training-layout rows (also used by app.train to fit models)."""
+    # For bare RF models: do local feature engineering matching training as closely as feasible
+    # Feature engineering similar to notebook
+    df_eng = _engineer_features(df)
+
+    # If a target encoder was saved and loaded, apply it now (transform only)
+    # NOTE: Encoder was fitted BEFORE dropping 'WC/HC' and 'BMI(kg/m2)' in the notebook,
+    # so preserve those columns for transform and drop them afterwards.
+    with _metrics.stage("encoding"):
+        if encoder_tables is not None:
+            # Precompiled lookup tables (no category_encoders call per request)
+            df_eng = encoder_tables.transform_frame(df_eng)
+        elif target_encoder is not None:
             try:
-                df_enc = _target_encoder.transform(df_eng)
+                df_enc = target_encoder.transform(df_eng)
                 if isinstance(df_enc, pd.DataFrame):
                     df_eng = df_enc
             except Exception:
                 # If encoding fails, fall back to unencoded dataframe
                 pass
 
-        # Drop columns that were dropped at train time if present (post-encoding)
-        for drop_col in ['WC/HC', 'BMI(kg/m2)']:
-            if drop_col in df_eng.columns:
-                df_eng = df_eng.drop(columns=[drop_col])
+    # Drop columns that were dropped at train time if present (post-encoding)
+    for drop_col in ['WC/HC', 'BMI(kg/m2)']:
+        if drop_col in df_eng.columns:
+            df_eng = df_eng.drop(columns=[drop_col])
+
+    # Align to model features if known; otherwise pass engineered features as-is
+    if feature_columns:
+        for col in feature_columns:
+            if col not in df_eng.columns:
+                df_eng[col] = 0.0
+        df_eng = df_eng[feature_columns]
+
+    return df_eng
+
+def _build_feature_frame(payload: PredictInput) -> pd.DataFrame:
+    # Build the input dataframe
+    return _build_feature_frames([payload])
+
+def _prepare_X(df: pd.DataFrame, state: Optional[_ModelState] = None) -> pd.DataFrame:
+    """Align/features and coerce to numeric to satisfy the RandomForest input.
+
+    - If the model exposes feature_names_in_, add any missing columns with 0 and order columns.
+    - Then coerce all values to numeric (non-numeric become NaN) and fill NaN with 0.0 to
+      avoid string-to-float errors.
+    """
+    feature_columns = (state or _get_state()).feature_columns
+    if feature_columns:
+        for col in feature_columns:
+            if col not in df.columns:
+                df[col] = 0.0
+        # Drop any extra columns not used by the model
+        df = df[feature_columns]
+    # Ensure purely numeric matrix and no NaNs
+    df = df.apply(pd.to_numeric, errors='coerce').fillna(0.0)
+    return df
+
+def _raw_feature_matrix(payloads: List[PredictInput]) -> np.ndarray:
+    """Numeric raw inputs (BASE_COLUMNS order) for the array feature path."""
+    return np.array([_raw_values(p) for p in payloads], dtype=np.float64)
+
+def _get_feature_plan(state: Optional[_ModelState] = None) -> Optional[FeaturePlan]:
+    """Compile (once per model state) the array feature plan for a bare RF/LightGBM model.
+
+    The plan is only enabled after it reproduces the DataFrame path
+    (_build_feature_frames + _prepare_X) exactly on a few reference rows;
+    otherwise the DataFrame path stays in use.
+    """
+    state = state or _get_state()
+    if state.feature_plan_checked:
+        return state.feature_plan
+    state.feature_plan_checked = True
+    if state.is_pipeline or not state.feature_columns:
+        return None
+    try:
+        reference = [
+            PredictInput(),
+            PredictInput(height_cm=172.5, carb=48.3, protein=7.1, fat=3.3, dietary_fiber=2.9),
+            PredictInput(age=61.0, weight=88.0, height_cm=158.0, waist_circumference=104.0, carb=100.0),
+        ]
+        expected = _prepare_X(_build_feature_frames(reference, state), state)
+        # Categorical columns are constant per request (encoded defaults): look them up once
+        if state.encoder_tables is not None:
+            constants = {c: state.encoder_tables.value(c, v) for c, v in _CATEGORICAL_DEFAULTS.items()}
+        else:
+            constants = expected.iloc[0].to_dict()
+        plan = FeaturePlan(state.feature_columns, constants=constants)
+        got = plan.transform(_raw_feature_matrix(reference))
+        if np.array_equal(got, expected.to_numpy(dtype=np.float64)):
+            state.feature_plan = plan
+    except Exception:
+        state.feature_plan = None
+    return state.feature_plan
+
+def _with_nutrients(base: PredictInput, carb: float, prot: float, fat: float, fiber: float) -> PredictInput:
+    """Copy of ``base`` with only the nutrient fields overridden (user metadata kept)."""
+    # The nutrients no longer describe the catalog food
+    return replace(base, carb=carb, protein=prot, fat=fat, dietary_fiber=fiber, food_id=None)
+
+def _resolve_food(payload: PredictInput):
+    """Fill food_item and nutrients from the catalog when ``food_id`` is set.
+
+    Returns (payload, error). Catalog values are per 100 g, so
+    nutrients_per_serving is cleared; portion_g is kept for GL.
+    """
+    if not payload.food_id:
+        return payload, None
+    _maybe_reload_food_catalog()
+    food = _food_catalog.get(payload.food_id)
+    if food is None:
+        return payload, f"Unknown food_id: {payload.food_id}"
+    return replace(payload, **food.nutrients(), food_item=food.name, nutrients_per_serving=False), None
+
+def _portion_error(payload: PredictInput) -> Optional[str]:
+    """Validation message for payloads that cannot be scored, else None."""
+    if getattr(payload, 'nutrients_per_serving', False) and float(payload.portion_g or 0.0) <= 0:
+        return "Invalid portion_g for per-serving nutrients: must be > 0 grams."
+    return None
+
+def _food_payload(payload: PredictInput) -> PredictInput:
+    """Payload with nutrients expressed per-100g, as the model expects.
+
+    If nutrients_per_serving=True, payload.carb/protein/fat/fiber are per-serving
+    and must be converted to per-100g before feeding the model.
+    """
+    if not getattr(payload, 'nutrients_per_serving', False):
+        # Payload nutrients are already per-100g
+        return payload
+    # Convert per-serving -> per-100g
+    portion = float(payload.portion_g)
+    return _with_nutrients(
+        payload,
+        carb=float(payload.carb) * 100.0 / portion,
+        prot=float(payload.protein) * 100.0 / portion,
+        fat=float(payload.fat) * 100.0 / portion,
+        fiber=float(payload.dietary_fiber) * 100.0 / portion,
+    )
+
+# Food-block cache entry for the glucose reference (never a catalog id)
+_GLUCOSE_REF_FOOD = ("__glucose_ref__", (100.0, 0.0, 0.0, 0.0))
+
+def _glucose_ref_payload(payload: PredictInput) -> PredictInput:
+    """100g glucose reference (100g carb, others 0) for the same user."""
+    return replace(payload, carb=100.0, protein=0.0, fat=0.0, dietary_fiber=0.0, food_id=_GLUCOSE_REF_FOOD[0])
+
+def _carbs_per_serving(payload: PredictInput) -> float:
+    if getattr(payload, 'nutrients_per_serving', False):
+        return float(payload.carb or 0.0)
+    return float(payload.carb or 0.0) * float(payload.portion_g or 0.0) / 100.0
+
+def _build_result(payload: PredictInput, iauc_food: float, iauc_glu: float, source: Optional[str] = None) -> dict:
+    """Turn the two IAUC predictions into the public result dict."""
+    # Guard against zero/negative reference
+    if iauc_glu <= 0:
+        raise ValueError(f"Invalid glucose reference IAUC: {iauc_glu}")
+
+    # GI calculation
+    ppgi_val = 100.0 * iauc_food / iauc_glu
+
+    # Compute carbs per serving. If the user provided nutrients per-serving,
+    # payload.carb already represents carbs_per_serving; otherwise derive from per-100g
+    carbs_per_serving = _carbs_per_serving(payload)
+    nutrients = (float(payload.carb or 0.0), float(payload.protein or 0.0),
+                 float(payload.fat or 0.0), float(payload.dietary_fiber or 0.0))
+    portion = float(payload.portion_g or 0.0)
+    if getattr(payload, 'nutrients_per_serving', False) and portion > 0:
+        carb_100g, protein_100g, fat_100g, fiber_100g = (round(v * 100.0 / portion, 2) for v in nutrients)
+    else:
+        carb_100g, protein_100g, fat_100g, fiber_100g = (round(v, 2) for v in nutrients)
+    gl_val = (ppgi_val * carbs_per_serving) / 100.0
+
+    return {
+        "ppgi": round(ppgi_val, 2),
+        "gl": round(gl_val, 2),
+        "carbs_per_serving": round(carbs_per_serving, 2),
+        "carb_per_100g": carb_100g,
+        "protein_per_100g": protein_100g,
+        "fat_per_100g": fat_100g,
+        "dietary_fiber_per_100g": fiber_100g,
+        "iauc_food": round(iauc_food, 4),
+        "iauc_glucose_ref": round(iauc_glu, 4),
+        "input_summary": payload.dict(),
+        "source": source or _get_state().label,
+        "timestamp": datetime.utcnow().isoformat() + 'Z'
+    }
+
+_NUTRIENT_INDEX = [BASE_COLUMNS.index(c) for c in NUTRIENT_COLS]
+
+def _food_block_cache(state: _ModelState) -> Optional[FoodBlockCache]:
+    """Per-food nutrient-only columns for ``state``'s feature plan, in step with the current catalog.
+
+    Built when a model is warmed up; after a catalog reload only new or
+    changed foods are recomputed.
+    """
+    plan = None if state.is_pipeline else _get_feature_plan(state)
+    if plan is None:
+        return None
+    catalog = _food_catalog
+    cache = state.food_blocks
+    if cache is not None and cache.source is catalog:
+        return cache
+    with _food_blocks_lock:
+        if state.food_blocks is None:
+            state.food_blocks = FoodBlockCache(plan)
+        cache = state.food_blocks
+        if cache.source is not catalog:
+            foods = [(f.id, tuple(f.nutrients().values())) for f in catalog.foods]
+            cache.sync(foods + [_GLUCOSE_REF_FOOD], source=catalog)
+    return cache
+
+def _food_block_rows(state: _ModelState, plan: FeaturePlan, payloads: List[PredictInput],
+                     raw: np.ndarray) -> Optional[np.ndarray]:
+    """Nutrient-only columns for each payload, read from the food cache for catalog foods.
+
+    Returns None when no payload refers to a cached food (callers then use plan.transform).
+    """
+    cache = _food_block_cache(state) if any(p.food_id for p in payloads) else None
+    if cache is None:
+        return None
+    nutrients = raw[:, _NUTRIENT_INDEX].tolist()
+    rows = [cache.lookup(p.food_id, tuple(nutrients[i])) for i, p in enumerate(payloads)]
+    missing = [i for i, r in enumerate(rows) if r is None]
+    if len(missing) == len(rows):
+        return None
+    block = np.empty((len(rows), len(plan.food_columns)), dtype=np.float64)
+    for i, r in enumerate(rows):
+        if r is not None:
+            block[i] = r
+    if missing:
+        block[missing] = plan.food_block(raw[missing])
+    return block
+
+def _predict_iauc(state: _ModelState, payloads: List[PredictInput]) -> np.ndarray:
+    """Single model call over all payloads; returns one IAUC per payload."""
+    plan = None if state.is_pipeline else _get_feature_plan(state)
+    if plan is not None:
+        with _metrics.stage("features"):
+            raw = _raw_feature_matrix(payloads)
+            block = _food_block_rows(state, plan, payloads, raw)
+            X = plan.transform(raw) if block is None else plan.combine(raw, block)
+    else:
+        # Target encoding runs inside _build_feature_frames ("encoding" is part of "features")
+        with _metrics.stage("features"):
+            X = _build_feature_frames(payloads, state)
+        if not state.is_pipeline:
+            with _metrics.stage("prepare_x"):
+                X = _prepare_X(X, state)
+    with _metrics.stage("inference"):
+        return np.asarray(state.model.predict(X), dtype=float)
+
+def _glucose_ref_key(payload: PredictInput) -> tuple:
+    """Key in ``state.glucose_refs`` for the glucose reference: the user's anthropometrics.
+
+    Values are normalized the same way _raw_feature_row reads them, so inputs
+    that produce the same reference row share an entry.
+    """
+    h_cm = float(payload.height_cm) if (getattr(payload, 'height_cm', None) not in (None, "")) else None
+    return (
+        float(payload.age or 0.0),
+        float(payload.weight or 0.0),
+        h_cm if h_cm else None,
+        float(payload.waist_circumference or 0.0),
+    )
+
+def _score_payloads(state: _ModelState, payloads: List[PredictInput], use_cache: bool = True):
+    """Return (iauc_food, iauc_glucose_ref) arrays for the given payloads.
+
+    Food rows and any glucose-reference rows missing from the cache are scored
+    together in one model call; cached references skip inference entirely.
+    """
+    n = len(payloads)
+    with _metrics.stage("payload"):
+        rows = [_food_payload(p) for p in payloads]
+        iauc_glu = np.empty(n, dtype=float)
+        pending: dict = {}  # cache key -> indices waiting on that reference
+        for i, p in enumerate(payloads):
+            key = _glucose_ref_key(p)
+            cached = state.glucose_refs.get(key) if (use_cache and key not in pending) else None
+            if cached is None:
+                if key not in pending:
+                    pending[key] = []
+                    rows.append(_glucose_ref_payload(p))
+                pending[key].append(i)
+            else:
+                iauc_glu[i] = cached
+
+    if _metrics.enabled:
+        _metrics.inc("ppgi_inference_rows_total", {"kind": "food"}, n)
+        _metrics.inc("ppgi_inference_rows_total", {"kind": "glucose_ref"}, len(pending))
+    iauc = _predict_iauc(state, rows)
+    for j, (key, idxs) in enumerate(pending.items()):
+        value = float(iauc[n + j])
+        if use_cache:
+            state.glucose_refs.set(key, value)
+        iauc_glu[idxs] = value
+    return iauc[:n], iauc_glu
+
+def _score_batch(payloads: List[PredictInput]):
+    """Executor entry point: score payloads with the active model (loaded once per process).
 
-        # Align to model features if known; otherwise pass engineered features as-is
-        if _feature_columns:
-            for col in _feature_columns:
-                if col not in df_eng.columns:
-                    df_eng[col] = 0.0
-            df_eng = df_eng[_feature_columns]
+    Returns (iauc_food, iauc_glucose_ref, source) with one entry per payload,
+    where ``source`` is the label of the model state that produced the row.
+    """
+    _registry.maybe_sync()
+    state = _get_state()
+    iauc_food, iauc_glu = _score_payloads(state, payloads)
+    return iauc_food, iauc_glu, np.full(len(payloads), state.label, dtype=object)
+
+def _pair_payload(user: PredictInput, food: PredictInput) -> PredictInput:
+    """Food payload carrying ``user``'s anthropometrics."""
+    return replace(food, **{k: getattr(user, k) for k in USER_FIELDS})
+
+def _score_matrix(users: List[PredictInput], foods: List[PredictInput]):
+    """Executor entry point for the user x food matrix.
+
+    Returns (iauc_food of shape (U, F), iauc_glucose_ref of shape (U,), source).
+    With an array feature plan, each user's and each food's columns are built
+    once and combined by broadcasting (FeaturePlan.cross); the glucose
+    references missing from the cache ride along in the same model call.
+    """
+    _registry.maybe_sync()
+    state = _get_state()
+    n_users, n_foods = len(users), len(foods)
+    plan = None if state.is_pipeline else _get_feature_plan(state)
+    if plan is None:
+        pairs = [_pair_payload(u, f) for u in users for f in foods]
+        iauc_food, iauc_glu = _score_payloads(state, pairs)
+        return iauc_food.reshape(n_users, n_foods), iauc_glu[::n_foods], state.label
+
+    food_rows = [_food_payload(f) for f in foods]
+    food_raw = _raw_feature_matrix(food_rows)
+    X = plan.cross(_raw_feature_matrix(users), food_raw, _food_block_rows(state, plan, food_rows, food_raw))
+    iauc_glu = np.empty(n_users, dtype=float)
+    pending: dict = {}  # cache key -> user indices waiting on that reference
+    for i, u in enumerate(users):
+        key = _glucose_ref_key(u)
+        cached = state.glucose_refs.get(key) if key not in pending else None
+        if cached is None:
+            pending.setdefault(key, []).append(i)
+        else:
+            iauc_glu[i] = cached
+    if pending:
+        refs = [_glucose_ref_payload(users[idxs[0]]) for idxs in pending.values()]
+        X = np.vstack([X, plan.transform(_raw_feature_matrix(refs))])
+    if _metrics.enabled:
+        _metrics.inc("ppgi_inference_rows_total", {"kind": "food"}, n_users * n_foods)
+        _metrics.inc("ppgi_inference_rows_total", {"kind": "glucose_ref"}, len(pending))
+    with _metrics.stage("inference"):
+        iauc = np.asarray(state.model.predict(X), dtype=float)
+    n = n_users * n_foods
+    for j, (key, idxs) in enumerate(pending.items()):
+        value = float(iauc[n + j])
+        state.glucose_refs.set(key, value)
+        iauc_glu[idxs] = value
+    return iauc[:n].reshape(n_users, n_foods), iauc_glu, state.label
+
+def _score_sweep(payloads: List[PredictInput]):
+    """Executor entry point for /api/predict/sweep: one model call for the whole grid.
+
+    Cells that map to the same model row (a portion_g axis only changes GL
+    unless nutrients are per serving) are scored once, and _score_payloads
+    adds one glucose-reference row per distinct user.
+    Returns (iauc_food, iauc_glucose_ref, source) with one entry per payload.
+    """
+    _registry.maybe_sync()
+    state = _get_state()
+    rows: dict = {}  # per-100g record -> row index
+    index = np.empty(len(payloads), dtype=np.intp)
+    for i, p in enumerate(payloads):
+        key = _food_payload(p)._replace(portion_g=100.0, nutrients_per_serving=False)
+        index[i] = rows.setdefault(key, len(rows))
+    iauc_food, iauc_glu = _score_payloads(state, list(rows))
+    return iauc_food[index], iauc_glu[index], state.label
 
-        return df_eng
+_scheduler = InferenceScheduler(
+    _score_batch,
+    workers=INFERENCE_WORKERS,
+    kind=INFERENCE_EXECUTOR,
+    window_ms=BATCH_WINDOW_MS,
+    max_batch_rows=MAX_BATCH_ROWS,
+    max_queue=MAX_QUEUE,
+)
+
+_metrics.describe("ppgi_cache_hits_total", "counter", "Cache hits by cache.")
+_metrics.describe("ppgi_cache_misses_total", "counter", "Cache misses by cache.")
+_metrics.ratio("ppgi_cache_hit_ratio", "ppgi_cache_hits_total", "ppgi_cache_misses_total",
+               "Hits / lookups by cache, over all processes since they started.")
+_metrics.describe("ppgi_model_load_seconds", "gauge", "Last load (phase=load) and warm-up (phase=warmup) time per model version.")
+_metrics.describe("ppgi_inference_batches_total", "counter", "Model calls made by the micro-batching scheduler.")
+_metrics.describe("ppgi_inference_queue_depth", "gauge", "Requests waiting for the inference pool (largest over workers).")
+
+def _metric_samples():
+    """Values owned by the caches, registry and scheduler, read when metrics are rendered."""
+    state = _state
+    glucose = {k: v + (getattr(state.glucose_refs, k) if state is not None else 0)
+               for k, v in _retired_glucose_refs.items()}
+    for name, stats in (("glucose_ref", glucose), ("responses", _response_cache.stats())):
+        yield "ppgi_cache_hits_total", {"cache": name}, stats["hits"]
+        yield "ppgi_cache_misses_total", {"cache": name}, stats["misses"]
+    for v in _registry.describe()["versions"]:
+        for phase in ("load", "warmup"):
+            if v[f"{phase}_ms"] is not None:
+                yield "ppgi_model_load_seconds", {"version": v["version"], "phase": phase}, v[f"{phase}_ms"] / 1000.0
+    sched = _scheduler.stats()
+    yield "ppgi_inference_batches_total", None, sched["batches"]
+    yield "ppgi_inference_queue_depth", None, sched["queue_depth"]
+
+_metrics.add_collector(_metric_samples)
+
+def _queue_full(e: InferenceQueueFull) -> JSONResponse:
+    _metrics.inc("ppgi_errors_total", {"error_class": e.__class__.__name__})
+    return JSONResponse({"detail": str(e)}, status_code=429, headers={"Retry-After": "1"})
+
+def _prediction_error(e: Exception) -> JSONResponse:
+    # Production behavior: do not generate synthetic predictions; return an error
+    _metrics.inc("ppgi_errors_total", {"error_class": e.__class__.__name__})
+    return JSONResponse(
+        {
+            "detail": "Prediction failed. Please try again later.",
+            "error": str(e),
+            "error_class": e.__class__.__name__,
+        },
+        status_code=500,
+    )
+
+def _session_id(request: Request) -> Optional[str]:
+    """Caller's session: X-Session-Id header, else the session cookie."""
+    return request.headers.get("x-session-id") or request.cookies.get(SESSION_COOKIE) or None
+
+def _record_result(result: dict, request: Request, response: JSONResponse) -> None:
+    """Keep ``result`` as the caller's latest (history store, or in-memory fallback)."""
+    global _last_result
+    _last_result = result
+    if _result_store is None:
+        return
+    session = _session_id(request)
+    if session is None:
+        session = uuid.uuid4().hex
+        response.set_cookie(SESSION_COOKIE, session, max_age=365 * 24 * 3600, httponly=True, samesite="lax")
+    try:
+        _result_store.append(result, session_id=session, user_id=request.headers.get("x-user-id"))
+    except Exception:
+        pass
+
+async def _latest_result(request: Request) -> Optional[dict]:
+    """Caller's most recent result from the shared store (SQLite read runs off the event loop).
+
+    Callers without a session have none; other sessions' results are never returned.
+    """
+    if _result_store is None:
+        return _last_result
+    session = _session_id(request)
+    if session is None:
+        return None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, _result_store.latest, session)
+    except Exception:
+        return None
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, ``*`` matches anything)."""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
 
 @app.post("/api/predict")
-async def predict(payload: PredictInput):
+async def predict(payload: PredictInput, request: Request):
+    session = _profiler.session
+    if session is None:
+        return await _predict(payload, request)
+    # An /admin/profile session is sampling while predict requests are in flight
+    session.begin_request()
+    try:
+        return await _predict(payload, request)
+    finally:
+        session.end_request()
+
+async def _cached_response(key: str):
+    """Response-cache lookup; the shared SQLite level is read off the event loop."""
+    hit = _response_cache.get_local(key)
+    if hit is None:
+        if _response_cache.path is None:
+            return _response_cache.get(key)
+        hit = await asyncio.get_running_loop().run_in_executor(None, _response_cache.get, key)
+    return hit
+
+def _store_response(key: str, body: bytes) -> str:
+    """Cache ``body`` (shared SQLite write queued on the default executor); returns its ETag."""
+    etag = _response_cache.set_local(key, body)
+    if _response_cache.path is not None:
+        asyncio.get_running_loop().run_in_executor(None, _response_cache.store_shared, key, body, etag)
+    return etag
+
+async def _predict(payload: PredictInput, request: Request):
     """Predict GI (PPGI) as 100 * IAUC(food) / IAUC(glucose-ref).
 
     Notes:
@@ -273,200 +1215,291 @@ async def predict(payload: PredictInput):
       0 protein/fat/fiber.
     """
 
-    global _last_result
+    # Validated once by FastAPI; the pipeline works on the immutable record
+    # Catalog foods: nutrients come from the server-side food table
+    payload, err = _resolve_food(PredictRecord.from_input(payload))
+    if err:
+        return JSONResponse({"detail": err}, status_code=400)
 
-    def _frame_with_override_nutrients(base: PredictInput, carb: float, prot: float, fat: float, fiber: float) -> pd.DataFrame:
-        """Helper to override only nutrient fields while keeping user metadata constant."""
-        temp_dict = base.dict()
-        temp_dict.update({
-            'carb': carb,
-            'protein': prot,
-            'fat': fat,
-            'dietary_fiber': fiber,
-        })
-        temp = PredictInput(**temp_dict)
-        return _build_feature_frame(temp)
-
-    def _prepare_X(df: pd.DataFrame) -> pd.DataFrame:
-        """Align/features and coerce to numeric to satisfy the RandomForest input.
-
-        - If the model exposes feature_names_in_, add any missing columns with 0 and order columns.
-        - Then coerce all values to numeric (non-numeric become NaN) and fill NaN with 0.0 to
-          avoid string-to-float errors.
-        """
-        global _feature_columns
-        if _feature_columns:
-            for col in _feature_columns:
-                if col not in df.columns:
-                    df[col] = 0.0
-            # Drop any extra columns not used by the model
-            df = df[_feature_columns]
-        # Ensure purely numeric matrix and no NaNs
-        df = df.apply(pd.to_numeric, errors='coerce').fillna(0.0)
-        return df
+    # Validate portion for per-serving conversion
+    err = _portion_error(payload)
+    if err:
+        return JSONResponse({"detail": err}, status_code=400)
+
+    # Repeated inputs under the same model artifacts are answered from the response cache
+    cache_key, cache_state = None, None
+    if _response_cache.enabled and _state is not None:
+        _registry.maybe_sync()
+        cache_state = _state
+        cache_key = canonical_key(payload.dict(), cache_state.cache_version)
+        hit = await _cached_response(cache_key)
+        if hit is not None:
+            body, etag = hit
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                _response_cache.not_modified += 1
+                return Response(status_code=304, headers={"ETag": etag, "X-Cache": "HIT"})
+            response = Response(body, media_type="application/json", headers={"ETag": etag, "X-Cache": "HIT"})
+            _record_result(json.loads(body), request, response)
+            return response
 
     try:
-        model = _load_rf_model()
-
-        # Determine how to interpret the user-provided nutrient fields.
-        # If nutrients_per_serving=True, payload.carb/protein/fat/fiber are per-serving
-        # and must be converted to per-100g before feeding the model.
-        if getattr(payload, 'nutrients_per_serving', False):
-            # Validate portion for per-serving conversion
-            if float(payload.portion_g or 0.0) <= 0:
-                return JSONResponse(
-                    {"detail": "Invalid portion_g for per-serving nutrients: must be > 0 grams."},
-                    status_code=400,
-                )
-            # Convert per-serving -> per-100g
-            portion = float(payload.portion_g)
-            carb_per_100g = float(payload.carb) * 100.0 / portion
-            protein_per_100g = float(payload.protein) * 100.0 / portion
-            fat_per_100g = float(payload.fat) * 100.0 / portion
-            fiber_per_100g = float(payload.dietary_fiber) * 100.0 / portion
-
-            # Build a temporary PredictInput with converted per-100g nutrients
-            temp = PredictInput(**{**payload.dict(), 'carb': carb_per_100g, 'protein': protein_per_100g, 'fat': fat_per_100g, 'dietary_fiber': fiber_per_100g})
-            X_food = _build_feature_frame(temp)
-        else:
-            # Payload nutrients are already per-100g
-            X_food = _build_feature_frame(payload)
-        if not _is_pipeline:
-            X_food = _prepare_X(X_food)
-        iauc_food = float(model.predict(X_food)[0])
-
-        # IAUC for 100g glucose reference (100g carb, others 0)
-        X_glu = _frame_with_override_nutrients(payload, carb=100.0, prot=0.0, fat=0.0, fiber=0.0)
-        if not _is_pipeline:
-            X_glu = _prepare_X(X_glu)
-        iauc_glu = float(model.predict(X_glu)[0])
-
-        # Guard against zero/negative reference
-        if iauc_glu <= 0:
-            raise ValueError(f"Invalid glucose reference IAUC: {iauc_glu}")
-
-        # GI calculation
-        ppgi_val = 100.0 * iauc_food / iauc_glu
-
-        # Compute carbs per serving. If the user provided nutrients per-serving,
-        # payload.carb already represents carbs_per_serving; otherwise derive from per-100g
-        if getattr(payload, 'nutrients_per_serving', False):
-            carbs_per_serving = float(payload.carb or 0.0)
-            carb_per_100g_value = round((float(payload.carb or 0.0) * 100.0 / float(payload.portion_g or 100.0)), 2) if float(payload.portion_g or 0.0) > 0 else round(float(payload.carb or 0.0), 2)
-            protein_per_100g_value = round((float(payload.protein or 0.0) * 100.0 / float(payload.portion_g or 100.0)), 2) if float(payload.portion_g or 0.0) > 0 else round(float(payload.protein or 0.0), 2)
-            fat_per_100g_value = round((float(payload.fat or 0.0) * 100.0 / float(payload.portion_g or 100.0)), 2) if float(payload.portion_g or 0.0) > 0 else round(float(payload.fat or 0.0), 2)
-            fiber_per_100g_value = round((float(payload.dietary_fiber or 0.0) * 100.0 / float(payload.portion_g or 100.0)), 2) if float(payload.portion_g or 0.0) > 0 else round(float(payload.dietary_fiber or 0.0), 2)
-        else:
-            carbs_per_serving = float(payload.carb or 0.0) * float(payload.portion_g or 0.0) / 100.0
-            carb_per_100g_value = round(float(payload.carb or 0.0), 2)
-            protein_per_100g_value = round(float(payload.protein or 0.0), 2)
-            fat_per_100g_value = round(float(payload.fat or 0.0), 2)
-            fiber_per_100g_value = round(float(payload.dietary_fiber or 0.0), 2)
-        gl_val = (ppgi_val * carbs_per_serving) / 100.0
-
-        result = {
-            "ppgi": round(ppgi_val, 2),
-            "gl": round(gl_val, 2),
-            "carbs_per_serving": round(carbs_per_serving, 2),
-            "carb_per_100g": carb_per_100g_value,
-            "protein_per_100g": protein_per_100g_value,
-            "fat_per_100g": fat_per_100g_value,
-            "dietary_fiber_per_100g": fiber_per_100g_value,
-            "iauc_food": round(iauc_food, 4),
-            "iauc_glucose_ref": round(iauc_glu, 4),
-            "input_summary": payload.dict(),
-            "source": 'pipeline' if _is_pipeline else 'random_forest',
-            "timestamp": datetime.utcnow().isoformat() + 'Z'
-        }
+        # IAUC for the food and for the 100g glucose reference (100g carb, others 0);
+        # the reference only depends on the user and is served from cache when possible.
+        # Scoring runs on the inference pool, possibly batched with concurrent requests.
+        iauc_food, iauc_glu, source = await _scheduler.submit([payload])
+
+        with _metrics.stage("serialize"):
+            result = _build_result(payload, float(iauc_food[0]), float(iauc_glu[0]), source[0])
+            response = FastJSONResponse(result)
 
-        # Cache last result in-memory
-        _last_result = result
-        return JSONResponse(result)
+        # Record as the caller's last result (persisted off the request path)
+        if _response_cache.enabled:
+            # Only cached under the key of the state that actually scored (it may differ after a swap)
+            if cache_key is None and _state is not None:
+                cache_state = _state
+                cache_key = canonical_key(payload.dict(), cache_state.cache_version)
+            if cache_key is not None and source[0] == cache_state.label:
+                response.headers["ETag"] = _store_response(cache_key, response.body)
+            else:
+                response.headers["ETag"] = etag_for(response.body)
+            response.headers["X-Cache"] = "MISS"
+        _record_result(result, request, response)
+        return response
 
+    except InferenceQueueFull as e:
+        return _queue_full(e)
     except Exception as e:
-        # Production behavior: do not generate synthetic predictions; return an error
+        return _prediction_error(e)
+
+@app.post("/api/predict/batch")
+async def predict_batch(payloads: List[PredictInput]):
+    """Score many foods/users with a single model call.
+
+    Food rows and (uncached) glucose-reference rows for every item are stacked into one
+    feature matrix, so the per-request overhead is paid once per batch. Each
+    entry of ``results`` has the same shape as the ``/api/predict`` response.
+    """
+    if len(payloads) > MAX_BATCH_ITEMS:
         return JSONResponse(
-            {
-                "detail": "Prediction failed. Please try again later.",
-                "error": str(e),
-                "error_class": e.__class__.__name__,
-            },
-            status_code=500,
+            {"detail": f"Too many items in batch: {len(payloads)} > {MAX_BATCH_ITEMS}."},
+            status_code=413,
         )
+    for i, p in enumerate(payloads):
+        p, err = _resolve_food(PredictRecord.from_input(p))
+        payloads[i] = p
+        err = err or _portion_error(p)
+        if err:
+            return JSONResponse({"detail": f"Item {i}: {err}", "index": i}, status_code=400)
+    if not payloads:
+        return JSONResponse({"count": 0, "results": []})
+
+    try:
+        iauc_food, iauc_glu, source = await _scheduler.submit(payloads)
+        results = [
+            _build_result(p, float(iauc_food[i]), float(iauc_glu[i]), source[i])
+            for i, p in enumerate(payloads)
+        ]
+        return FastJSONResponse({"count": len(results), "results": results})
+    except InferenceQueueFull as e:
+        return _queue_full(e)
+    except Exception as e:
+        return _prediction_error(e)
+
+@app.post("/api/predict/matrix")
+async def predict_matrix(body: GIMatrixInput):
+    """PPGI / GL for every (user, food) pair: ``ppgi[u][f]`` is users[u] eating foods[f].
+
+    Each cell equals what ``/api/predict`` returns for the same user and food.
+    """
+    n_users, n_foods = len(body.users), len(body.foods)
+    if n_users * n_foods > MAX_MATRIX_CELLS:
+        return JSONResponse(
+            {"detail": f"Too many cells: {n_users} users x {n_foods} foods > {MAX_MATRIX_CELLS}."},
+            status_code=413,
+        )
+    for i, f in enumerate(body.foods):
+        f, err = _resolve_food(PredictRecord.from_input(f))
+        body.foods[i] = f
+        err = err or _portion_error(f)
+        if err:
+            return JSONResponse({"detail": f"Food {i}: {err}", "index": i}, status_code=400)
+
+    users = [{k: getattr(u, k) for k in USER_FIELDS} for u in body.users]
+    carbs = [_carbs_per_serving(f) for f in body.foods]
+    foods = [{"food_item": f.food_item, "carbs_per_serving": round(c, 2)} for f, c in zip(body.foods, carbs)]
+    if not n_users or not n_foods:
+        return JSONResponse({"users": users, "foods": foods, "ppgi": [[] for _ in users], "gl": [[] for _ in users],
+                             "iauc_food": [[] for _ in users], "iauc_glucose_ref": [], "source": None})
+    try:
+        records = [PredictRecord.from_input(u) for u in body.users]
+        iauc_food, iauc_glu, source = await _scheduler.run(_score_matrix, records, body.foods)
+        if (iauc_glu <= 0).any():
+            raise ValueError(f"Invalid glucose reference IAUC: {float(iauc_glu.min())}")
+        # Same arithmetic as _build_result, element-wise
+        ppgi = 100.0 * iauc_food / iauc_glu[:, None]
+        gl = (ppgi * np.asarray(carbs)[None, :]) / 100.0
+        return FastJSONResponse({
+            "users": users,
+            "foods": foods,
+            "ppgi": [[round(v, 2) for v in row] for row in ppgi.tolist()],
+            "gl": [[round(v, 2) for v in row] for row in gl.tolist()],
+            "iauc_food": [[round(v, 4) for v in row] for row in iauc_food.tolist()],
+            "iauc_glucose_ref": [round(v, 4) for v in iauc_glu.tolist()],
+            "source": source,
+            "timestamp": datetime.utcnow().isoformat() + 'Z',
+        })
+    except InferenceQueueFull as e:
+        return _queue_full(e)
+    except Exception as e:
+        return _prediction_error(e)
+
+@app.post("/api/predict/sweep")
+async def predict_sweep(body: SweepInput):
+    """PPGI / GL over a grid of one or two varied fields of ``base``.
+
+    With one axis ``ppgi[i]`` is base with axes[0].field = values[i]; with two,
+    ``ppgi[i][j]`` also sets axes[1].field = axes[1].values[j]. Each cell equals
+    what ``/api/predict`` returns for the same input, and the whole grid is
+    scored with a single model call.
+    """
+    axes = body.axes
+    if not 1 <= len(axes) <= 2:
+        return JSONResponse({"detail": "A sweep takes one or two axes."}, status_code=400)
+    for a in axes:
+        if a.field not in SWEEP_FIELDS:
+            return JSONResponse({"detail": f"Cannot sweep {a.field!r}; choose from {', '.join(SWEEP_FIELDS)}."},
+                                status_code=400)
+        if a.steps < 1:
+            return JSONResponse({"detail": f"Axis {a.field!r}: steps must be >= 1."}, status_code=400)
+    if len(axes) == 2 and axes[0].field == axes[1].field:
+        return JSONResponse({"detail": "The two axes must vary different fields."}, status_code=400)
+    shape = tuple(a.steps for a in axes)
+    if int(np.prod(shape)) > MAX_SWEEP_CELLS:
+        return JSONResponse({"detail": f"Too many cells: {' x '.join(map(str, shape))} > {MAX_SWEEP_CELLS}."},
+                            status_code=413)
+
+    base, err = _resolve_food(PredictRecord.from_input(body.base))
+    if err:
+        return JSONResponse({"detail": err}, status_code=400)
+    if base.food_id and any(a.field in NUTRIENT_FIELDS for a in axes):
+        # Swept nutrients no longer match the catalog entry
+        base = base._replace(food_id=None)
+    values = [[round(float(v), 6) for v in np.linspace(a.start, a.stop, a.steps)] for a in axes]
+    if len(axes) == 1:
+        cells = [base._replace(**{axes[0].field: v}) for v in values[0]]
+    else:
+        cells = [base._replace(**{axes[0].field: v, axes[1].field: w}) for v in values[0] for w in values[1]]
+    for p in cells:
+        err = _portion_error(p)
+        if err:
+            return JSONResponse({"detail": err}, status_code=400)
+
+    try:
+        iauc_food, iauc_glu, source = await _scheduler.run(_score_sweep, cells)
+        if (iauc_glu <= 0).any():
+            raise ValueError(f"Invalid glucose reference IAUC: {float(iauc_glu.min())}")
+        # Same arithmetic as _build_result, element-wise
+        carbs = np.array([_carbs_per_serving(p) for p in cells])
+        ppgi = 100.0 * iauc_food / iauc_glu
+        gl = (ppgi * carbs) / 100.0
+
+        def grid(a: np.ndarray, ndigits: int):
+            flat = [round(v, ndigits) for v in a.tolist()]
+            return flat if len(shape) == 1 else [flat[i:i + shape[1]] for i in range(0, len(flat), shape[1])]
+
+        return FastJSONResponse({
+            "axes": [{"field": a.field, "values": v} for a, v in zip(axes, values)],
+            "base": base.dict(),
+            "ppgi": grid(ppgi, 2),
+            "gl": grid(gl, 2),
+            "carbs_per_serving": grid(carbs, 2),
+            "iauc_food": grid(iauc_food, 4),
+            "iauc_glucose_ref": grid(iauc_glu, 4),
+            "source": source,
+            "timestamp": datetime.utcnow().isoformat() + 'Z',
+        })
+    except InferenceQueueFull as e:
+        return _queue_full(e)
+    except Exception as e:
+        return _prediction_error(e)
 
 # Route for the main prediction page
-@app.get("/", response_class=FileResponse)
-async def index():
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
     """Return the static index page (Prediction Form)."""
-    fp = Path(__file__).parent.parent / "static" / "index.html"
-    return FileResponse(fp)
+    return _static.response("index.html", request, page=True)
 
 # Alias to calculator
-@app.get("/calculate", response_class=FileResponse)
-async def calculate():
-    fp = Path(__file__).parent.parent / "static" / "index.html"
-    return FileResponse(fp)
+@app.get("/calculate", response_class=HTMLResponse)
+async def calculate(request: Request):
+    return _static.response("index.html", request, page=True)
 
 # Route for the About Us page
-@app.get("/about", response_class=FileResponse)
-async def about():
+@app.get("/about", response_class=HTMLResponse)
+async def about(request: Request):
     """Return the static about page."""
-    fp = Path(__file__).parent.parent / "static" / "about.html"
-    return FileResponse(fp)
+    return _static.response("about.html", request, page=True)
 
 # Route for the Documentation page
-@app.get("/docs", response_class=FileResponse)
-async def docs():
+@app.get("/docs", response_class=HTMLResponse)
+async def docs(request: Request):
     """Return the static documentation page."""
-    fp = Path(__file__).parent.parent / "static" / "docs.html"
-    return FileResponse(fp)
+    return _static.response("docs.html", request, page=True)
 
 # Introduction page
-@app.get("/introduction", response_class=FileResponse)
-async def introduction():
-    fp = Path(__file__).parent.parent / "static" / "introduction.html"
-    return FileResponse(fp)
+@app.get("/introduction", response_class=HTMLResponse)
+async def introduction(request: Request):
+    return _static.response("introduction.html", request, page=True)
 
 # How-to page
-@app.get("/how-to", response_class=FileResponse)
-async def how_to():
-    fp = Path(__file__).parent.parent / "static" / "howto.html"
-    return FileResponse(fp)
+@app.get("/how-to", response_class=HTMLResponse)
+async def how_to(request: Request):
+    return _static.response("howto.html", request, page=True)
 
 # Saved results page
-@app.get("/saved", response_class=FileResponse)
-async def saved():
-    fp = Path(__file__).parent.parent / "static" / "saved.html"
-    return FileResponse(fp)
+@app.get("/saved", response_class=HTMLResponse)
+async def saved(request: Request):
+    return _static.response("saved.html", request, page=True)
 
 # Last result as JSON
 @app.get("/api/last_result")
-async def last_result():
-    if _last_result is None:
+async def last_result(request: Request):
+    result = await _latest_result(request)
+    if result is None:
         return JSONResponse({"exists": False})
-    return JSONResponse({"exists": True, "result": _last_result})
+    return JSONResponse({"exists": True, "result": result})
 
-# Last result as CSV download
-@app.get("/api/last_result.csv")
-async def last_result_csv():
-    if _last_result is None:
-        return JSONResponse({"detail": "No result available"}, status_code=404)
+# Consistent CSV column order for exported results
+RESULT_CSV_COLUMNS = [
+    'age','weight','height_cm','waist_circumference','food_item',
+    'carb','protein','fat','dietary_fiber','portion_g',
+    'carb_per_100g','protein_per_100g','fat_per_100g','dietary_fiber_per_100g',
+    'carbs_per_serving','ppgi','gl','iauc_food','iauc_glucose_ref','source','timestamp'
+]
 
-    # Flatten payload for CSV
-    r = _last_result.copy()
+def _flatten_result(result: dict) -> dict:
+    """Flatten payload for CSV: input_summary fields followed by result fields."""
+    r = result.copy()
     payload = r.pop("input_summary", {})
-    flat = {**payload, **r}
-
-    # Consistent column order
-    cols = [
-        'age','weight','height_cm','waist_circumference','food_item',
-        'carb','protein','fat','dietary_fiber','portion_g',
-        'carb_per_100g','protein_per_100g','fat_per_100g','dietary_fiber_per_100g',
-        'carbs_per_serving','ppgi','gl','iauc_food','iauc_glucose_ref','source','timestamp'
-    ]
-    for k in list(flat.keys()):
+    return {**payload, **r}
+
+def _result_csv_columns(keys) -> list:
+    """RESULT_CSV_COLUMNS followed by any other flattened keys, in their original order."""
+    cols = list(RESULT_CSV_COLUMNS)
+    for k in keys:
         if k not in cols:
             cols.append(k)
+    return cols
+
+# Last result as CSV download
+@app.get("/api/last_result.csv")
+async def last_result_csv(request: Request):
+    result = await _latest_result(request)
+    if result is None:
+        return JSONResponse({"detail": "No result available"}, status_code=404)
+
+    flat = _flatten_result(result)
+    cols = _result_csv_columns(flat.keys())
 
     buf = io.StringIO()
     writer = csv.DictWriter(buf, fieldnames=cols)
@@ -477,7 +1510,342 @@ async def last_result_csv():
     headers = {"Content-Disposition": f"attachment; filename={filename}"}
     return StreamingResponse(buf, media_type='text/csv', headers=headers)
 
-# Lightweight health endpoint for readiness/liveness checks
+# Bulk upload output: last_result.csv columns for every PredictInput field, plus a per-row error
+_PREDICT_FIELDS = list(getattr(PredictInput, "model_fields", None) or PredictInput.__fields__)
+STREAM_CSV_COLUMNS = _result_csv_columns(_PREDICT_FIELDS) + ["error"]
+
+# Content-Types of line-delimited JSON bodies
+NDJSON_CONTENT_TYPES = {
+    "application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines",
+    "application/jsonlines", "application/json-seq",
+}
+
+def _upload_format(request: Request, fmt: Optional[str]) -> str:
+    """'csv' or 'ndjson', from the ``format`` query parameter or the Content-Type.
+
+    A plain JSON body (one array) cannot be parsed incrementally and is refused.
+    """
+    if fmt:
+        return fmt.strip().lower()
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if ctype in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    if ctype == "application/json" or ctype.endswith("+json"):
+        raise BulkParseError(f"Unsupported Content-Type {ctype}: send one JSON object per line as "
+                             "application/x-ndjson (or use ?format=ndjson), or CSV as text/csv.")
+    return "csv"
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}" for err in e.errors())
+
+def _payloads_from_rows(rows: list):
+    """Validate uploaded rows; returns (flats, payloads, index).
+
+    ``flats`` has one slot per row: rows that fail parsing or validation are
+    filled with their inputs and an ``error``, the others are left as None and
+    listed in ``index`` alongside their parsed ``payloads``.
+    """
+    flats: List[Optional[dict]] = [None] * len(rows)
+    payloads, index = [], []
+    for i, row in enumerate(rows):
+        if isinstance(row, BulkParseError):
+            flats[i] = {"error": str(row)}
+            continue
+        try:
+            p = PredictInput(**row)
+        except ValidationError as e:
+            flats[i] = {**row, "error": _validation_message(e)}
+            continue
+        p, err = _resolve_food(PredictRecord.from_input(p))
+        err = err or _portion_error(p)
+        if err:
+            flats[i] = {**p.dict(), "error": err}
+            continue
+        payloads.append(p)
+        index.append(i)
+    return flats, payloads, index
+
+def _merge_results(flats: list, index: list, payloads: list, iauc_food, iauc_glu, source) -> list:
+    """Fill the slots left by _payloads_from_rows with flattened results (or scoring errors)."""
+    for j, (i, p) in enumerate(zip(index, payloads)):
+        try:
+            flats[i] = _flatten_result(_build_result(p, float(iauc_food[j]), float(iauc_glu[j]), source[j]))
+        except Exception as e:
+            flats[i] = {**p.dict(), "error": str(e)}
+    return flats
+
+async def _score_rows(rows: list) -> List[dict]:
+    """Score one chunk of uploaded rows; returns flattened results in input order.
+
+    Rows that fail parsing, validation or scoring come back with their inputs and an ``error``.
+    """
+    flats, payloads, index = _payloads_from_rows(rows)
+    if not payloads:
+        return flats
+    try:
+        while True:
+            try:
+                iauc_food, iauc_glu, source = await _scheduler.submit(payloads)
+                break
+            except InferenceQueueFull:
+                # The response is already streaming, so wait for capacity instead of a 429
+                await asyncio.sleep(0.05)
+    except Exception as e:
+        for i, p in zip(index, payloads):
+            flats[i] = {**p.dict(), "error": f"Prediction failed: {e.__class__.__name__}: {e}"}
+        return flats
+    return _merge_results(flats, index, payloads, iauc_food, iauc_glu, source)
+
+def _csv_text(flats: List[dict], cols: list) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for flat in flats:
+        writer.writerow([flat.get(c, '') for c in cols])
+    return buf.getvalue()
+
+async def _stream_scores(request: Request, parser):
+    """Read the body chunk by chunk and yield CSV for every STREAM_CHUNK_ROWS rows parsed."""
+    yield _csv_text([{c: c for c in STREAM_CSV_COLUMNS}], STREAM_CSV_COLUMNS)
+    pending: list = []
+    failure = None
+    try:
+        async for chunk in request.stream():
+            pending.extend(parser.feed(chunk))
+            while len(pending) >= STREAM_CHUNK_ROWS:
+                rows, pending = pending[:STREAM_CHUNK_ROWS], pending[STREAM_CHUNK_ROWS:]
+                yield _csv_text(await _score_rows(rows), STREAM_CSV_COLUMNS)
+        pending.extend(parser.close())
+    except BulkParseError as e:
+        failure = str(e)
+    for start in range(0, len(pending), STREAM_CHUNK_ROWS):
+        yield _csv_text(await _score_rows(pending[start:start + STREAM_CHUNK_ROWS]), STREAM_CSV_COLUMNS)
+    if failure:
+        # Status is already sent; report the fatal parse error as a final row
+        yield _csv_text([{"error": failure}], STREAM_CSV_COLUMNS)
+
+class _UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator itself reads the request body.
+
+    The stock response listens for ``http.disconnect`` on ``receive`` while
+    streaming (ASGI < 2.4), which would swallow the upload's body messages.
+    Here the generator is the only reader; a disconnect ends ``request.stream()``.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+# Bulk scoring of a CSV / NDJSON upload, streamed back as CSV while the body is still arriving
+@app.post("/api/predict/stream")
+async def predict_stream(request: Request, format: Optional[str] = None):
+    try:
+        parser = parser_for(_upload_format(request, format))
+    except BulkParseError as e:
+        return JSONResponse({"detail": str(e)}, status_code=415)
+    filename = f"ppgi_results_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.csv"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    return _UploadStreamingResponse(_stream_scores(request, parser), media_type='text/csv', headers=headers)
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Unix seconds from a query value given as a number or an ISO-8601 timestamp."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+# Paginated prediction history for the caller's session (or an explicit user_id)
+@app.get("/api/history")
+async def history(request: Request, user_id: Optional[str] = None, since: Optional[str] = None,
+                  until: Optional[str] = None, limit: int = 50, before_id: Optional[int] = None):
+    if _result_store is None:
+        return JSONResponse({"detail": "Result history is disabled (PPGI_RESULT_DB is empty)."}, status_code=404)
+    # Callers only see their own session; user_id narrows it, and only an admin may
+    # look a user up across sessions
+    session = _session_id(request)
+    cross_session = bool(user_id) and "x-admin-token" in request.headers
+    if cross_session:
+        denied = _admin_denied(request)
+        if denied:
+            return denied
+    elif not session:
+        return JSONResponse({"items": [], "next_before_id": None})
+    try:
+        start, end = _parse_time(since), _parse_time(until)
+    except ValueError as e:
+        return JSONResponse({"detail": f"Invalid time range: {e}"}, status_code=400)
+    items, next_before = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: _result_store.history(
+            session_id=None if cross_session else session, user_id=user_id,
+            since=start, until=end, limit=limit, before_id=before_id,
+        )
+    )
+    return JSONResponse({"items": items, "next_before_id": next_before})
+
+# Food catalog autocomplete: prefix matches on name tokens, topped up with fuzzy (trigram) matches
+@app.get("/api/foods")
+async def search_foods(q: str = "", limit: int = 10):
+    _maybe_reload_food_catalog()
+    limit = max(1, min(limit, 100))
+    body = {"items": _food_catalog.search(q, limit=limit), "total": len(_food_catalog)}
+    if _food_catalog_error:
+        body["error"] = _food_catalog_error
+    return JSONResponse(body)
+
+@app.get("/api/foods/{food_id}")
+async def get_food(food_id: str):
+    _maybe_reload_food_catalog()
+    food = _food_catalog.get(food_id)
+    if food is None:
+        return JSONResponse({"detail": f"Unknown food_id: {food_id}"}, status_code=404)
+    return JSONResponse(food.to_dict())
+
+# Cache hit/miss counters
+@app.get("/api/cache/stats")
+async def cache_stats():
+    state = _state
+    blocks = state.food_blocks if state is not None else None
+    return JSONResponse({
+        "glucose_ref": state.glucose_refs.stats() if state is not None else None,
+        "static": _static.stats(),
+        "responses": _response_cache.stats(),
+        "food_blocks": {
+            "foods": len(blocks) if blocks is not None else 0,
+            "catalog_foods": len(_food_catalog),
+            "recomputed": blocks.recomputed if blocks is not None else 0,
+        },
+    })
+
+# Prometheus scrape endpoint: request counts/latency, per-stage timings, errors, caches
+@app.get("/metrics")
+async def metrics():
+    if not METRICS_ENABLED:
+        return JSONResponse({"detail": "Metrics disabled (PPGI_METRICS=0)."}, status_code=404)
+    body = await asyncio.get_running_loop().run_in_executor(None, _metrics.render)
+    return Response(body, media_type=METRICS_CONTENT_TYPE)
+
+# Inference pool / micro-batching counters
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    return JSONResponse(_scheduler.stats())
+
+# Lightweight health endpoint for liveness checks
 @app.get("/health")
 async def health():
     return JSONResponse({"status": "ok"})
+
+# Readiness: only report ready once the model is loaded
+@app.get("/ready")
+async def ready():
+    if _state is None:
+        body = {"status": "loading"}
+        if _model_load_error:
+            body = {"status": "error", "error": _model_load_error}
+        return JSONResponse(body, status_code=503)
+    return JSONResponse({"status": "ready", "source": _state.label, "model": type(_state.model).__name__})
+
+def _admin_denied(request: Request) -> Optional[JSONResponse]:
+    """403 response unless the request carries the configured X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"detail": "Admin API disabled (set PPGI_ADMIN_TOKEN)."}, status_code=403)
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse({"detail": "Forbidden"}, status_code=403)
+    return None
+
+# Model registry: list versions
+@app.get("/admin/models")
+async def admin_models(request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    _registry.scan()
+    return JSONResponse(_registry.describe())
+
+# Load, warm and atomically activate a version; the current model keeps serving meanwhile
+@app.post("/admin/models/{version}/activate")
+async def admin_activate_model(version: str, request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    _registry.scan()
+    if _registry.get(version) is None:
+        return JSONResponse({"detail": f"Unknown model version: {version}"}, status_code=404)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _registry.activate, version)
+    except Exception as e:
+        return JSONResponse({"detail": "Activation failed", "error": str(e), "error_class": e.__class__.__name__}, status_code=500)
+    return JSONResponse(_registry.describe())
+
+# Re-activate the previously active version
+@app.post("/admin/models/rollback")
+async def admin_rollback_model(request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _registry.rollback)
+    except LookupError as e:
+        return JSONResponse({"detail": str(e)}, status_code=409)
+    except Exception as e:
+        return JSONResponse({"detail": "Rollback failed", "error": str(e), "error_class": e.__class__.__name__}, status_code=500)
+    return JSONResponse(_registry.describe())
+
+# Profile this worker: sampled stacks (and allocations) for the next N predict requests or a window
+@app.post("/admin/profile")
+async def admin_profile_start(request: Request, requests: Optional[int] = None, seconds: Optional[float] = None,
+                              interval_ms: float = 5.0, memory: bool = True):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    if requests is not None and requests < 1:
+        return JSONResponse({"detail": "requests must be at least 1."}, status_code=400)
+    try:
+        session = _profiler.start(requests=requests, seconds=seconds, interval_ms=interval_ms, memory=memory)
+    except RuntimeError as e:
+        return JSONResponse({"detail": str(e)}, status_code=409)
+    return JSONResponse(session.describe(), status_code=202)
+
+# Running session on this worker (if any) and finished profiles from all workers
+@app.get("/admin/profile")
+async def admin_profile_status(request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    session = _profiler.session
+    profiles = await asyncio.get_running_loop().run_in_executor(None, _profiler.profiles)
+    return JSONResponse({"active": session.describe() if session is not None else None, "profiles": profiles})
+
+# End this worker's running session now and write its output
+@app.post("/admin/profile/stop")
+async def admin_profile_stop(request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    session = await asyncio.get_running_loop().run_in_executor(None, _profiler.stop)
+    if session is None:
+        return JSONResponse({"detail": "No profile is running on this worker."}, status_code=409)
+    return JSONResponse(session.describe())
+
+# Download: kind = collapsed | allocations | alloc_collapsed
+@app.get("/admin/profile/{profile_id}/{kind}")
+async def admin_profile_download(profile_id: str, kind: str, request: Request):
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    path = _profiler.path(profile_id, kind)
+    if path is None:
+        return JSONResponse({"detail": f"No {kind} output for profile {profile_id}."}, status_code=404)
+    return FileResponse(str(path), media_type="text/plain", filename=path.name)
+
+if PRELOAD_MODEL:
+    preload_model()
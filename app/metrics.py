@@ -0,0 +1,330 @@
+"""Counters and latency histograms in the Prometheus text format.
+
+Every process (gunicorn workers and inference pool processes alike) records
+into its own in-memory registry and, when a shared directory is configured,
+dumps a snapshot there every few seconds from a background thread. The
+exposition merges the snapshots of live processes: counters and histograms
+are summed, gauges take the largest value. A process removes its snapshot
+when it exits; snapshots of processes that died without doing so (or that
+stopped refreshing them) are ignored and deleted.
+
+When disabled, ``stage`` returns a shared no-op context manager, so
+instrumented code pays only for one attribute lookup and a ``with``.
+"""
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import atexit
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('metrics', 'labels', 'start')
+
+    def __init__(self, metrics: 'Metrics', labels: Labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe('ppgi_stage_duration_seconds', self.labels, time.perf_counter() - self.start)
+        return False
+
+
+def _labels(labels: Optional[dict]) -> Labels:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items())) if labels else ()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _fmt_labels(labels, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _le(bound) -> str:
+    return 'le="%s"' % bound
+
+
+def _fmt_value(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class Metrics:
+    """Process-local registry with optional cross-process aggregation through ``directory``.
+
+    ``describe`` declares a metric's type and help text. ``add_collector``
+    registers a callable returning ``(name, labels, value)`` samples that is
+    read at snapshot time (for values owned by other objects, such as cache
+    counters). ``ratio`` declares a gauge computed after merging, as
+    ``hits / (hits + misses)`` of two counters sharing labels.
+    """
+
+    def __init__(self, enabled: bool = True, directory: Optional[Union[str, Path]] = None,
+                 flush_interval: float = 5.0, buckets=DEFAULT_BUCKETS):
+        self.enabled = bool(enabled)
+        self.directory = Path(directory) if (directory and enabled) else None
+        self.flush_interval = max(float(flush_interval), 0.1)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], list] = {}
+        self._types: Dict[str, Tuple[str, str]] = {}
+        self._collectors: List[Callable] = []
+        self._ratios: List[Tuple[str, str, str]] = []
+        self._stage_labels: Dict[str, Labels] = {}
+        self._flusher_pid: Optional[int] = None
+        self.describe('ppgi_stage_duration_seconds', 'histogram', 'Time spent in each prediction pipeline stage.')
+
+    # -- declaration --
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._types[name] = (kind, help_text)
+
+    def add_collector(self, fn: Callable) -> None:
+        self._collectors.append(fn)
+
+    def ratio(self, name: str, hits: str, misses: str, help_text: str) -> None:
+        self.describe(name, 'gauge', help_text)
+        self._ratios.append((name, hits, misses))
+
+    # -- recording --
+
+    def stage(self, name: str):
+        """Context manager timing one pipeline stage (no-op when disabled)."""
+        if not self.enabled:
+            return _NULL_STAGE
+        labels = self._stage_labels.get(name)
+        if labels is None:
+            labels = self._stage_labels.setdefault(name, (('stage', name),))
+        return _Stage(self, labels)
+
+    def inc(self, name: str, labels: Optional[dict] = None, value: float = 1.0) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None) -> None:
+        if self.enabled:
+            self._observe(name, _labels(labels), value)
+
+    def _observe(self, name: str, labels: Labels, value: float) -> None:
+        key = (name, labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+        self._ensure_flusher()
+
+    # -- snapshots / cross-process sharing --
+
+    def snapshot(self) -> dict:
+        gauges, counters = [], []
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    kind = self._types.get(name, ('gauge', ''))[0]
+                    (counters if kind == 'counter' else gauges).append([name, list(_labels(labels)), float(value)])
+            except Exception:
+                pass
+        with self._lock:
+            counters += [[n, list(l), v] for (n, l), v in self._counters.items()]
+            hists = [[n, list(l), list(h[0]), h[1], h[2]] for (n, l), h in self._histograms.items()]
+        return {'pid': os.getpid(), 'counters': counters, 'histograms': hists, 'gauges': gauges}
+
+    def _ensure_flusher(self) -> None:
+        if self.directory is None or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        atexit.register(self._remove_snapshot)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this process's snapshot to the shared directory."""
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f'{os.getpid()}.json'
+            tmp = path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self.snapshot(), separators=(',', ':')))
+            tmp.replace(path)
+        except OSError:
+            pass
+
+    def _remove_snapshot(self) -> None:
+        """Delete this process's snapshot (at exit), so its counters leave the merged totals."""
+        if self.directory is None or self._flusher_pid != os.getpid():
+            return
+        try:
+            (self.directory / f'{os.getpid()}.json').unlink()
+        except OSError:
+            pass
+
+    def _snapshots(self) -> List[dict]:
+        own = self.snapshot()
+        snaps = [own]
+        if self.directory is not None and self.directory.is_dir():
+            # Live processes rewrite their snapshot every flush_interval; older ones are
+            # left over from killed workers or earlier deployments (possibly with a reused PID)
+            stale_before = time.time() - (3 * self.flush_interval + 5.0)
+            for path in self.directory.glob('*.json'):
+                try:
+                    mtime = path.stat().st_mtime
+                    snap = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                if snap.get('pid') == own['pid']:
+                    continue
+                if mtime < stale_before or not _pid_alive(int(snap.get('pid', 0))):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                    continue
+                snaps.append(snap)
+        return snaps
+
+    # -- exposition --
+
+    def render(self) -> str:
+        """All metrics, merged over processes, in the Prometheus text format."""
+        counters: Dict[Tuple[str, Labels], float] = {}
+        gauges: Dict[Tuple[str, Labels], float] = {}
+        hists: Dict[Tuple[str, Labels], list] = {}
+        n_buckets = len(self.buckets) + 1
+        for snap in self._snapshots():
+            for name, labels, value in snap.get('counters', ()):
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, value in snap.get('gauges', ()):
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = max(gauges.get(key, value), value)
+            for name, labels, buckets, total, count in snap.get('histograms', ()):
+                if len(buckets) != n_buckets:
+                    continue
+                key = (name, tuple(map(tuple, labels)))
+                h = hists.setdefault(key, [[0] * n_buckets, 0.0, 0])
+                h[0] = [a + b for a, b in zip(h[0], buckets)]
+                h[1] += total
+                h[2] += count
+        for name, hits, misses in self._ratios:
+            for (n, labels), value in list(counters.items()):
+                if n == hits:
+                    lookups = value + counters.get((misses, labels), 0.0)
+                    gauges[(name, labels)] = value / lookups if lookups else 0.0
+
+        by_name: Dict[str, List[str]] = {}
+        for (name, labels), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append(f'{name}{_fmt_labels(labels)} {_fmt_value(value)}')
+        for (name, labels), value in sorted(gauges.items()):
+            by_name.setdefault(name, []).append(f'{name}{_fmt_labels(labels)} {_fmt_value(value)}')
+        for (name, labels), (buckets, total, count) in sorted(hists.items()):
+            lines = by_name.setdefault(name, [])
+            cumulative = 0
+            for le, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f'{name}_bucket{_fmt_labels(labels, _le(le))} {cumulative}')
+            lines.append(f'{name}_bucket{_fmt_labels(labels, _le("+Inf"))} {count}')
+            lines.append(f'{name}_sum{_fmt_labels(labels)} {_fmt_value(total)}')
+            lines.append(f'{name}_count{_fmt_labels(labels)} {count}')
+        out = []
+        for name in sorted(by_name):
+            kind, help_text = self._types.get(name, ('untyped', ''))
+            if help_text:
+                out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(by_name[name])
+        return '\n'.join(out) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests and timing them per route template."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+        metrics.describe('ppgi_http_requests_total', 'counter', 'HTTP requests by method, route and status.')
+        metrics.describe('ppgi_http_request_duration_seconds', 'histogram',
+                         'HTTP request latency (until the last body byte is sent) by method and route.')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            labels = {'method': scope.get('method', ''), 'route': route}
+            self.metrics.observe('ppgi_http_request_duration_seconds', time.perf_counter() - start, labels)
+            self.metrics.inc('ppgi_http_requests_total', {**labels, 'status': status[0]})
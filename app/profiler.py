@@ -0,0 +1,234 @@
+"""On-demand sampling profiler for a running worker.
+
+A profile session samples the Python stacks of the event-loop thread and the
+inference pool threads every few milliseconds from a background thread
+(``sys._current_frames``), either while ``/api/predict`` requests are in
+flight (for the next N requests) or for a fixed time window. Optionally,
+allocations are traced with ``tracemalloc`` for the same span. Nothing is
+installed while no session is running; the request path only checks whether
+``Profiler.session`` is set.
+
+Results are written to a directory shared by all workers:
+
+* ``<id>.collapsed``: stack samples in the collapsed format read by
+  flamegraph.pl, speedscope and similar tools (``frame;frame;frame count``);
+* ``<id>.alloc.txt``: largest allocation sites (still live at the end of the span);
+* ``<id>.alloc.collapsed``: the same allocations as collapsed stacks weighted by bytes;
+* ``<id>.json``: session parameters and counters.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+MAX_SECONDS = 600.0
+MAX_DEPTH = 128
+KINDS = {'collapsed': '.collapsed', 'allocations': '.alloc.txt', 'alloc_collapsed': '.alloc.collapsed'}
+
+
+def _frame_label(code) -> str:
+    parts = Path(code.co_filename).parts[-2:]
+    return f"{code.co_name} ({'/'.join(parts)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, prefix: str) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    names.append(prefix)
+    return ';'.join(reversed(names))
+
+
+class ProfileSession:
+    """One profiling run; see the module docstring."""
+
+    def __init__(self, directory: Path, requests: Optional[int], seconds: float,
+                 interval: float, memory: bool, thread_ids: set, on_finish=None):
+        self.id = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        self.directory = directory
+        self.requests = requests
+        self.seconds = min(float(seconds), MAX_SECONDS)
+        self.interval = max(float(interval), 0.001)
+        self.memory = memory
+        self.thread_ids = thread_ids
+        self.on_finish = on_finish
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.samples = 0
+        self.requests_seen = 0
+        self.in_flight = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self) -> None:
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(MAX_DEPTH // 4)
+            self._started_tracemalloc = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # -- request hooks (called on the event loop) --
+
+    def begin_request(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def end_request(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.requests_seen += 1
+            if self.requests is not None and self.requests_seen >= self.requests:
+                self._stop.set()
+
+    def _sampled_threads(self) -> Dict[int, str]:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        return {tid: names.get(tid, str(tid)) for tid in self.thread_ids} | {
+            t.ident: t.name for t in threading.enumerate() if t.name.startswith('inference')
+        }
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.seconds
+        own = threading.get_ident()
+        threads = self._sampled_threads()
+        next_refresh = time.monotonic() + 1.0
+        try:
+            while not self._stop.wait(self.interval):
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if now >= next_refresh:
+                    # Pool threads are created on demand
+                    threads = self._sampled_threads()
+                    next_refresh = now + 1.0
+                if self.requests is not None and self.in_flight <= 0:
+                    continue
+                frames = sys._current_frames()
+                for tid, name in threads.items():
+                    frame = frames.get(tid)
+                    if frame is not None and tid != own:
+                        self._stacks[_collapse(frame, name)] += 1
+                self.samples += 1
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        snapshot = tracemalloc.take_snapshot() if (self.memory and tracemalloc.is_tracing()) else None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self.finished = time.time()
+        try:
+            self._write(snapshot)
+        finally:
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def _write(self, snapshot) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / self.id
+        with open(f'{base}.collapsed', 'w') as f:
+            for stack, n in self._stacks.most_common():
+                f.write(f'{stack} {n}\n')
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                               tracemalloc.Filter(False, __file__)])
+            stats = snapshot.statistics('traceback')
+            with open(f'{base}.alloc.collapsed', 'w') as f:
+                for st in stats:
+                    frames = ';'.join(f'{Path(fr.filename).name}:{fr.lineno}' for fr in reversed(st.traceback))
+                    f.write(f'{frames} {st.size}\n')
+            with open(f'{base}.alloc.txt', 'w') as f:
+                total = sum(st.size for st in stats)
+                f.write(f'{total / 1024:.1f} KiB in {sum(st.count for st in stats)} blocks '
+                        f'allocated during the session and still live at its end\n\n')
+                for st in snapshot.statistics('lineno')[:50]:
+                    fr = st.traceback[0]
+                    f.write(f'{st.size / 1024:10.1f} KiB {st.count:8d} blocks  {fr.filename}:{fr.lineno}\n')
+        (self.directory / f'{self.id}.json').write_text(json.dumps(self.describe(), indent=2))
+
+    def describe(self) -> dict:
+        return {
+            'id': self.id,
+            'pid': os.getpid(),
+            'mode': 'requests' if self.requests is not None else 'window',
+            'requests': self.requests,
+            'seconds': self.seconds,
+            'interval_ms': self.interval * 1000.0,
+            'memory': self.memory,
+            'started': self.started,
+            'finished': self.finished,
+            'samples': self.samples,
+            'requests_seen': self.requests_seen,
+            'stacks': len(self._stacks),
+        }
+
+
+class Profiler:
+    """Starts sessions (one at a time per process) and finds their output in ``directory``."""
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+              interval_ms: float = 5.0, memory: bool = True) -> ProfileSession:
+        """Start a session on this worker; raises RuntimeError if one is already running.
+
+        Must be called on the event-loop thread (which is sampled along with
+        the inference threads). With ``requests`` the session ends after that
+        many /api/predict requests or after ``seconds`` (default MAX_SECONDS),
+        whichever comes first; otherwise it samples for ``seconds`` (default 30).
+        """
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError(f'Profile {self.session.id} is already running.')
+            if seconds is None:
+                seconds = MAX_SECONDS if requests is not None else 30.0
+            session = ProfileSession(self.directory, requests, seconds, interval_ms / 1000.0, memory,
+                                     {threading.get_ident()}, on_finish=self._finished)
+            self.session = session
+        session.start()
+        return session
+
+    def _finished(self, session: ProfileSession) -> None:
+        with self._lock:
+            if self.session is session:
+                self.session = None
+
+    def stop(self) -> Optional[ProfileSession]:
+        session = self.session
+        if session is not None:
+            session.stop()
+            session._thread.join(timeout=30.0)
+        return session
+
+    def profiles(self) -> List[dict]:
+        """Finished sessions from every worker, newest first."""
+        if not self.directory.is_dir():
+            return []
+        out = []
+        for path in self.directory.glob('*.json'):
+            try:
+                out.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return sorted(out, key=lambda d: d.get('started') or 0, reverse=True)
+
+    def path(self, profile_id: str, kind: str) -> Optional[Path]:
+        suffix = KINDS.get(kind)
+        if suffix is None or Path(profile_id).name != profile_id:
+            return None
+        path = self.directory / f'{profile_id}{suffix}'
+        return path if path.is_file() else None
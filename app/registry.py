@@ -0,0 +1,182 @@
+"""Versioned model registry with background loading and atomic activation.
+
+Artifacts live in one directory (``PPGI_MODEL_DIR``); each file or bundle
+directory in it is a version named after its stem. Activating a version
+loads and warms it while the current model keeps serving, then hands the
+new state to ``swap_fn`` in one step. The active version is recorded in an
+``ACTIVE`` marker file so every worker process converges on it.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+
+DEFAULT_VERSION = 'default'
+ARTIFACT_SUFFIXES = ('.joblib', '.txt')
+_MARKER = 'ACTIVE'
+
+
+class ModelVersion:
+    __slots__ = ('version', 'path', 'status', 'error', 'loaded_at', 'load_ms', 'warmup_ms')
+
+    def __init__(self, version: str, path: Optional[Path]):
+        self.version = version
+        self.path = path
+        self.status = 'available'
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_ms: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.version,
+            'path': str(self.path) if self.path else None,
+            'status': self.status,
+            'error': self.error,
+            'loaded_at': self.loaded_at,
+            'load_ms': self.load_ms,
+            'warmup_ms': self.warmup_ms,
+        }
+
+
+class ModelRegistry:
+    """Tracks model versions and performs load -> warm -> swap activations.
+
+    ``load_fn(version, path)`` returns a ready-to-serve state object (``path``
+    is None for the built-in default chain), ``warm_fn(state)`` runs a few
+    predictions against it and ``swap_fn(state)`` makes it the active one.
+    """
+
+    def __init__(self, directory: Optional[Path], load_fn: Callable, warm_fn: Callable,
+                 swap_fn: Callable, sync_interval: float = 5.0):
+        self.directory = Path(directory) if directory else None
+        self.load_fn = load_fn
+        self.warm_fn = warm_fn
+        self.swap_fn = swap_fn
+        self.sync_interval = float(sync_interval)
+        self.active: Optional[str] = None
+        self.history: List[str] = []
+        self._versions: Dict[str, ModelVersion] = {}
+        self._lock = threading.Lock()
+        self._next_sync = 0.0
+        self._syncing = False
+        self.scan()
+
+    def scan(self) -> List[str]:
+        """Pick up artifacts added to the registry directory since the last scan."""
+        found = {DEFAULT_VERSION: None}
+        if self.directory is not None and self.directory.is_dir():
+            for p in sorted(self.directory.iterdir()):
+                if p.name.startswith('.') or p.name == _MARKER:
+                    continue
+                if p.is_dir() or p.suffix in ARTIFACT_SUFFIXES:
+                    found[p.stem if p.is_file() else p.name] = p
+        for version, path in found.items():
+            if version not in self._versions:
+                self._versions[version] = ModelVersion(version, path)
+        return list(found)
+
+    def get(self, version: str) -> Optional[ModelVersion]:
+        return self._versions.get(version)
+
+    def describe(self) -> dict:
+        return {
+            'active': self.active,
+            'history': list(self.history),
+            'versions': [v.to_dict() for v in self._versions.values()],
+        }
+
+    def marker_version(self) -> Optional[str]:
+        """Version recorded in the ACTIVE marker (set by any worker), if any."""
+        if self.directory is None:
+            return None
+        try:
+            name = (self.directory / _MARKER).read_text().strip()
+        except OSError:
+            return None
+        return name or None
+
+    def _write_marker(self, version: str) -> None:
+        if self.directory is None:
+            return
+        try:
+            tmp = self.directory / f'.{_MARKER}.tmp'
+            tmp.write_text(version)
+            tmp.replace(self.directory / _MARKER)
+        except OSError:
+            pass
+
+    def load(self, version: str):
+        """Load and warm ``version`` without activating it; returns the state."""
+        if version not in self._versions:
+            self.scan()
+        mv = self._versions.get(version)
+        if mv is None:
+            raise KeyError(f'Unknown model version: {version}')
+        mv.status = 'loading'
+        mv.error = None
+        try:
+            t0 = time.perf_counter()
+            state = self.load_fn(version, mv.path)
+            t1 = time.perf_counter()
+            self.warm_fn(state)
+            t2 = time.perf_counter()
+        except Exception as e:
+            mv.status = 'failed'
+            mv.error = f'{e.__class__.__name__}: {e}'
+            raise
+        mv.load_ms = (t1 - t0) * 1000.0
+        mv.warmup_ms = (t2 - t1) * 1000.0
+        mv.status = 'ready'
+        return state
+
+    def activate(self, version: str, record: bool = True, publish: bool = True):
+        """Load, warm and atomically swap in ``version``. Blocking; call off the event loop."""
+        with self._lock:
+            state = self.load(version)
+            self.swap_fn(state)
+            previous = self.active
+            if previous is not None and previous != version:
+                self._versions[previous].status = 'ready'
+                if record:
+                    self.history.append(previous)
+            self.active = version
+            mv = self._versions[version]
+            mv.status = 'active'
+            mv.loaded_at = time.time()
+            if publish:
+                self._write_marker(version)
+            return state
+
+    def rollback(self):
+        """Re-activate the previously active version."""
+        if not self.history:
+            raise LookupError('No previous model version to roll back to.')
+        version = self.history.pop()
+        try:
+            return self.activate(version, record=False)
+        except Exception:
+            self.history.append(version)
+            raise
+
+    def maybe_sync(self) -> None:
+        """Follow activations made by other workers (cheap; checks the marker at most every sync_interval)."""
+        now = time.monotonic()
+        if now < self._next_sync or self._syncing or self.directory is None:
+            return
+        self._next_sync = now + self.sync_interval
+        target = self.marker_version()
+        if not target or target == self.active or self.active is None:
+            return
+        self._syncing = True
+
+        def _run():
+            try:
+                self.activate(target, publish=False)
+            except Exception:
+                pass
+            finally:
+                self._syncing = False
+
+        threading.Thread(target=_run, name='model-sync', daemon=True).start()
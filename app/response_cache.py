@@ -0,0 +1,184 @@
+"""Cache of rendered prediction responses, shared by all worker processes.
+
+Entries are keyed by a canonical hash of the request inputs and the model
+version, so a repeat of the same (user profile, food, portion) is answered
+without running the model and with a byte-identical body and ETag. Lookups
+go to a per-process LRU first and then to a SQLite file in WAL mode that
+every worker on the host reads and writes. The SQLite calls block, so
+async callers check ``get_local`` first and run ``get`` / ``store_shared``
+on an executor.
+"""
+from pathlib import Path
+from typing import Optional, Tuple, Union
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from .cache import LRUCache
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    body BLOB NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_used ON responses (used);
+"""
+
+# Shared entries refresh their last-used time at most this often (keeps reads read-only)
+_TOUCH_INTERVAL = 60.0
+
+
+def _canonical(value):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)):
+        f = float(value)
+        return repr(f) if math.isfinite(f) else str(f)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return str(value)
+
+
+def canonical_key(fields: dict, version: str) -> str:
+    """Stable hash of ``fields`` (numbers compared by value, keys sorted) and ``version``."""
+    blob = json.dumps({'v': version, 'f': _canonical(fields)}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ResponseCache:
+    """Two-level (process LRU + shared SQLite) cache of response bodies with ETags.
+
+    ``maxsize`` bounds the per-process LRU, ``shared_maxsize`` the SQLite
+    table; the least recently used shared entries are pruned as it grows.
+    With ``path=None`` only the per-process level is used.
+    """
+
+    def __init__(self, maxsize: int = 10000, path: Optional[Union[str, Path]] = None,
+                 shared_maxsize: int = 100000):
+        self.local = LRUCache(maxsize)
+        self.path = Path(path) if path else None
+        self.shared_maxsize = max(int(shared_maxsize), 1)
+        self._local_conn = threading.local()
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.local.maxsize > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local_conn, 'conn', None)
+        if conn is None or getattr(self._local_conn, 'pid', None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=0.25, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.executescript(_SCHEMA)
+            self._local_conn.conn = conn
+            self._local_conn.pid = os.getpid()
+        return conn
+
+    def get_local(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """(body, etag) from the per-process level only (a hit is counted; a miss is not)."""
+        entry = self.local.get(key)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """(body, etag) for ``key``, or None."""
+        entry = self.local.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        if self.path is not None:
+            try:
+                row = self._conn().execute('SELECT body, etag, used FROM responses WHERE key = ?', (key,)).fetchone()
+            except sqlite3.Error:
+                self.errors += 1
+                row = None
+            if row is not None:
+                entry = (bytes(row[0]), row[1])
+                self.local.set(key, entry)
+                now = time.time()
+                if now - row[2] > _TOUCH_INTERVAL:
+                    try:
+                        self._conn().execute('UPDATE responses SET used = ? WHERE key = ?', (now, key))
+                    except sqlite3.Error:
+                        self.errors += 1
+                self.hits += 1
+                self.shared_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def set(self, key: str, body: bytes) -> str:
+        """Store ``body`` under ``key``; returns its ETag."""
+        etag = self.set_local(key, body)
+        if self.enabled:
+            self.store_shared(key, body, etag)
+        return etag
+
+    def set_local(self, key: str, body: bytes) -> str:
+        """Store ``body`` in the per-process level only; returns its ETag."""
+        etag = etag_for(body)
+        if self.enabled:
+            self.local.set(key, (body, etag))
+            self.stores += 1
+        return etag
+
+    def store_shared(self, key: str, body: bytes, etag: str) -> None:
+        """Write an entry to the shared SQLite level (no-op without one)."""
+        if self.path is None:
+            return
+        try:
+            conn = self._conn()
+            conn.execute('INSERT OR REPLACE INTO responses (key, etag, body, used) VALUES (?, ?, ?, ?)',
+                         (key, etag, body, time.time()))
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= max(self.shared_maxsize // 100, 1):
+                self._writes_since_prune = 0
+                conn.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used DESC '
+                    'LIMIT -1 OFFSET ?)', (self.shared_maxsize,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def clear(self) -> None:
+        self.local.clear()
+        if self.path is not None:
+            try:
+                self._conn().execute('DELETE FROM responses')
+            except sqlite3.Error:
+                self.errors += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'local': self.local.stats(),
+            'shared_path': str(self.path) if self.path else None,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'stores': self.stores,
+            'errors': self.errors,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+        }
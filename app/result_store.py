@@ -0,0 +1,204 @@
+"""Append-only prediction history shared by all worker processes.
+
+Results are kept in a SQLite database in WAL mode, so any number of gunicorn
+workers can append while others read. Appends only enqueue the record; a
+background thread per process writes queued records in batches, keeping
+disk I/O off the request path.
+"""
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    session_id TEXT,
+    user_id TEXT,
+    food_item TEXT,
+    source TEXT,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_session_ts ON results (session_id, ts);
+CREATE INDEX IF NOT EXISTS idx_results_user_ts ON results (user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_results_ts ON results (ts);
+"""
+
+_STOP = object()
+
+
+class ResultStore:
+    """SQLite-backed result log with batched background writes.
+
+    ``append`` never touches the database; records are written by a daemon
+    thread in batches of up to ``batch_size``, at most ``flush_interval``
+    seconds after they were queued. ``flush`` blocks until this process's
+    queue has been written (used before reads for read-your-writes).
+    """
+
+    def __init__(self, path: Union[str, Path], batch_size: int = 128, flush_interval: float = 0.05):
+        self.path = Path(path)
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = float(flush_interval)
+        self._pid: Optional[int] = None
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self.written = 0
+        self.write_errors = 0
+
+    # -- connection / writer lifecycle (per process, so it is fork-safe) --
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10.0, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=10000')
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_writer(self) -> None:
+        if self._pid == os.getpid() and self._writer is not None and self._writer.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._writer is not None and self._writer.is_alive():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, args=(self._queue,),
+                                            name='result-store-writer', daemon=True)
+            self._writer.start()
+
+    def _write_loop(self, q: queue.Queue) -> None:
+        conn = None
+        while True:
+            item = q.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                # A flush request (or a full batch) is written without waiting for more
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                try:
+                    item = q.get(timeout=max(timeout, 0)) if timeout > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    conn = conn or self._connect()
+                    with conn:
+                        conn.execute('BEGIN')
+                        conn.executemany(
+                            'INSERT INTO results (ts, session_id, user_id, food_item, source, result) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            batch,
+                        )
+                    self.written += len(batch)
+                except Exception:
+                    self.write_errors += len(batch)
+            for w in waiters:
+                w.set()
+            if stop:
+                if conn is not None:
+                    conn.close()
+                return
+
+    # -- public API --
+
+    def append(self, result: dict, session_id: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        """Queue ``result`` for writing; returns immediately."""
+        self._ensure_writer()
+        summary = result.get('input_summary') or {}
+        self._queue.put((
+            time.time(), session_id, user_id, summary.get('food_item'),
+            result.get('source'), json.dumps(result, separators=(',', ':')),
+        ))
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Wait until records queued by this process so far are on disk."""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            if self._writer is not None:
+                self._writer.join(timeout=2.0)
+        self._writer = None
+        self._queue = None
+
+    def latest(self, session_id: str) -> Optional[dict]:
+        """Most recent result of ``session_id``."""
+        self.flush()
+        row = self._reader().execute(
+            'SELECT result FROM results WHERE session_id = ? ORDER BY ts DESC, id DESC LIMIT 1',
+            (session_id,),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def history(self, session_id: Optional[str] = None, user_id: Optional[str] = None,
+                since: Optional[float] = None, until: Optional[float] = None,
+                limit: int = 50, before_id: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        """Page of results, newest first, plus the ``before_id`` cursor for the next page (or None)."""
+        self.flush()
+        where, args = [], []
+        if session_id:
+            where.append('session_id = ?')
+            args.append(session_id)
+        if user_id:
+            where.append('user_id = ?')
+            args.append(user_id)
+        if since is not None:
+            where.append('ts >= ?')
+            args.append(float(since))
+        if until is not None:
+            where.append('ts < ?')
+            args.append(float(until))
+        if before_id is not None:
+            where.append('id < ?')
+            args.append(int(before_id))
+        limit = max(1, min(int(limit), 500))
+        sql = 'SELECT id, ts, session_id, user_id, result FROM results'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        rows = self._reader().execute(sql, (*args, limit + 1)).fetchall()
+        items = [
+            {'id': r[0], 'ts': r[1], 'session_id': r[2], 'user_id': r[3], 'result': json.loads(r[4])}
+            for r in rows[:limit]
+        ]
+        next_before = items[-1]['id'] if len(rows) > limit else None
+        return items, next_before
+
+    def stats(self) -> dict:
+        return {
+            'path': str(self.path),
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'written': self.written,
+            'write_errors': self.write_errors,
+        }
@@ -0,0 +1,412 @@
+"""Compact RandomForest artifacts: split nodes and leaf values only.
+
+A fitted ``RandomForestRegressor`` pickles every tree with float64
+thresholds, per-node value/impurity/sample-count arrays and both child
+pointers for every node, leaves included. ``CompactForest`` keeps what
+prediction reads:
+
+* per split node: feature (uint8/uint16), threshold (float32), left and
+  right child (int32; a negative child ``~i`` is leaf ``i``) and, only if
+  the forest has any, the missing-value direction;
+* per leaf: one value (float64, or float32 with ``leaf_dtype``).
+
+Thresholds are rounded *down* to float32. sklearn compares float32 inputs
+against float64 thresholds, and for a float32 ``x``, ``x <= t`` holds exactly
+when ``x <= float32_floor(t)``, so the split decisions (and, with float64
+leaves, the predictions) are bit-for-bit those of sklearn. Sibling leaves
+with equal (stored) values are merged into their parent. Optionally the
+forest is cut to its first ``max_trees`` trees and/or to ``max_depth``
+levels (the cut node predicts its training mean, as sklearn stores it);
+those two change predictions, which the CLI reports.
+
+Prediction advances only the (row, tree) pairs that have not reached a leaf
+yet, so shallow trees stop costing work once they are done.
+
+Usage::
+
+    python -m app.rf_compact random_forest_model.joblib --version rf-compact
+    python -m app.rf_compact models/rf-20261017-101500 --leaf-dtype float32 --max-trees 50
+
+The CLI writes a bundle directory to ``PPGI_MODEL_DIR`` (``bundle.json``,
+``forest/``, the target encoder and, for exact compactions, the original
+forest as ``fallback.joblib`` for large batches) that the model registry loads, and
+prints the size, load time, latency and prediction/accuracy differences
+against the original.
+"""
+from pathlib import Path
+from typing import List, Optional, Union
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+_ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_value', 'roots', 'missing_left')
+
+
+def _floor_float32(threshold: np.ndarray) -> np.ndarray:
+    """Largest float32 not above each float64 threshold."""
+    t32 = threshold.astype(np.float32)
+    return np.where(t32.astype(np.float64) > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+
+
+def _tree_parts(tree, max_depth: Optional[int], leaf_dtype):
+    """Split/leaf arrays of one sklearn tree (local ids), after depth cut and leaf merging."""
+    n = tree.node_count
+    left, right = tree.children_left.copy(), tree.children_right.copy()
+    value = np.asarray(tree.value, dtype=np.float64).reshape(n, -1)[:, 0].astype(leaf_dtype)
+    if max_depth is not None:
+        depth = np.zeros(n, dtype=np.int64)
+        for i in range(n):  # preorder: parents come before their children
+            if left[i] >= 0:
+                depth[left[i]] = depth[right[i]] = depth[i] + 1
+        cut = (depth >= max_depth) & (left >= 0)
+        left[cut] = right[cut] = -1
+    # Merge sibling leaves with equal values (bottom-up: children have higher ids)
+    merged = 0
+    for i in range(n - 1, -1, -1):
+        li, ri = left[i], right[i]
+        if li >= 0 and left[li] < 0 and left[ri] < 0 and value[li] == value[ri]:
+            value[i] = value[li]
+            left[i] = right[i] = -1
+            merged += 1
+    # Keep the nodes still reachable from the root, in preorder
+    order, stack = [], [0]
+    while stack:
+        i = stack.pop()
+        order.append(i)
+        if left[i] >= 0:
+            stack.extend((right[i], left[i]))
+    order = np.array(order, dtype=np.int64)
+    is_leaf = left[order] < 0
+    split_ids = order[~is_leaf]
+    leaf_ids = order[is_leaf]
+    local = np.empty(n, dtype=np.int64)
+    local[split_ids] = np.arange(len(split_ids))
+    local[leaf_ids] = ~np.arange(len(leaf_ids))
+    mgl = getattr(tree, 'missing_go_to_left', None)
+    return {
+        'feature': tree.feature[split_ids],
+        'threshold': _floor_float32(tree.threshold[split_ids]),
+        'left': local[left[split_ids]],
+        'right': local[right[split_ids]],
+        'leaf_value': value[leaf_ids],
+        'missing_left': None if mgl is None else np.asarray(mgl)[split_ids] != 0,
+        'root': local[0],
+        'merged': merged,
+    }
+
+
+def _shift(ids: np.ndarray, split_off: int, leaf_off: int) -> np.ndarray:
+    """Tree-local ids -> forest ids (split ids after the earlier trees' splits, leaf ids ~i after their leaves)."""
+    return np.where(ids >= 0, ids + split_off, ids - leaf_off)
+
+
+class CompactForest:
+    """Mean of regression trees stored as split-node and leaf arrays (see the module docstring)."""
+
+    def __init__(self, feature, threshold, left, right, leaf_value, roots, missing_left=None,
+                 n_features: Optional[int] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.missing_left = missing_left
+        self.n_trees = len(roots)
+        self.n_features_in_ = int(n_features) if n_features is not None else int(feature.max()) + 1
+        self.meta: dict = {}
+
+    @classmethod
+    def from_sklearn(cls, forest, max_trees: Optional[int] = None, max_depth: Optional[int] = None,
+                     leaf_dtype=np.float64) -> 'CompactForest':
+        """Compact a fitted single-output forest regressor (``estimators_`` of decision trees)."""
+        estimators = list(forest.estimators_)[:max_trees] if max_trees else list(forest.estimators_)
+        n_features = getattr(forest, 'n_features_in_', None)
+        parts = []
+        for est in estimators:
+            if est.tree_.n_outputs != 1:
+                raise ValueError('Only single-output forests are supported.')
+            parts.append(_tree_parts(est.tree_, max_depth, np.dtype(leaf_dtype)))
+        n_features = n_features or max(int(p['feature'].max(initial=0)) for p in parts) + 1
+        feature_dtype = np.uint8 if n_features <= 256 else np.uint16
+        split_off = leaf_off = 0
+        cols = {k: [] for k in ('feature', 'threshold', 'left', 'right', 'leaf_value', 'missing_left')}
+        roots = []
+        for p in parts:
+            cols['feature'].append(p['feature'].astype(feature_dtype))
+            cols['threshold'].append(p['threshold'])
+            cols['left'].append(_shift(p['left'], split_off, leaf_off))
+            cols['right'].append(_shift(p['right'], split_off, leaf_off))
+            cols['leaf_value'].append(p['leaf_value'])
+            cols['missing_left'].append(p['missing_left'] if p['missing_left'] is not None
+                                        else np.zeros(len(p['feature']), dtype=bool))
+            roots.append(int(_shift(np.array([p['root']]), split_off, leaf_off)[0]))
+            split_off += len(p['feature'])
+            leaf_off += len(p['leaf_value'])
+        if split_off >= 2 ** 31 or leaf_off >= 2 ** 31:
+            raise ValueError('Forest too large for int32 node ids.')
+        missing_left = np.concatenate(cols['missing_left'])
+        compact = cls(
+            feature=np.concatenate(cols['feature']),
+            threshold=np.concatenate(cols['threshold']).astype(np.float32),
+            left=np.concatenate(cols['left']).astype(np.int32),
+            right=np.concatenate(cols['right']).astype(np.int32),
+            leaf_value=np.concatenate(cols['leaf_value']),
+            roots=np.array(roots, dtype=np.int32),
+            missing_left=missing_left if missing_left.any() else None,
+            n_features=n_features,
+        )
+        compact.meta['merged_leaves'] = sum(p['merged'] for p in parts)
+        return compact
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in _ARRAYS if getattr(self, name) is not None)
+
+    def save(self, directory: Union[str, Path], meta: Optional[dict] = None) -> Path:
+        """Write the arrays as ``.npy`` files plus ``meta.json`` (to a temporary sibling, then renamed)."""
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=directory.name + '.', dir=directory.parent))
+        try:
+            for name in _ARRAYS:
+                arr = getattr(self, name)
+                if arr is not None:
+                    np.save(tmp / f'{name}.npy', np.ascontiguousarray(arr))
+            info = {**self.meta, **(meta or {}), 'n_features': self.n_features_in_, 'n_trees': self.n_trees}
+            (tmp / 'meta.json').write_text(json.dumps(info))
+            os.replace(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return directory
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap_mode: Optional[str] = 'r') -> 'CompactForest':
+        """Load a forest written by ``save``; with ``mmap_mode='r'`` workers share the page cache."""
+        directory = Path(directory)
+        info = json.loads((directory / 'meta.json').read_text())
+        arrays = {}
+        for name in _ARRAYS:
+            fp = directory / f'{name}.npy'
+            # np.asarray drops the memmap subclass (and its per-access overhead) but keeps the mapping
+            arrays[name] = np.asarray(np.load(fp, mmap_mode=mmap_mode)) if fp.exists() else None
+        forest = cls(n_features=info['n_features'], **arrays)
+        forest.meta.update(info)
+        return forest
+
+    def predict(self, X) -> np.ndarray:
+        """Predict one value per row of ``X`` (array-like, n_rows x n_features)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got {X.shape[1]}')
+        n = X.shape[0]
+        # Working ids are intp: indexing with the stored int32 ids would convert them on every step
+        node = np.tile(self.roots.astype(np.intp), n)
+        row = np.repeat(np.arange(n), self.n_trees)
+        active = np.flatnonzero(node >= 0)
+        check_nan = self.missing_left is not None and bool(np.isnan(X).any())
+        while active.size:
+            at = node[active]
+            fval = X[row[active], self.feature[at]]
+            go_left = fval <= self.threshold[at]
+            if check_nan:
+                go_left |= np.isnan(fval) & self.missing_left[at]
+            nxt = np.where(go_left, self.left[at], self.right[at])
+            node[active] = nxt
+            active = active[nxt >= 0]
+        # Sequential accumulation over trees, then mean (same order as sklearn's n_jobs=None path)
+        leaves = self.leaf_value[~node].reshape(n, self.n_trees).astype(np.float64)
+        return np.cumsum(leaves, axis=1)[:, -1] / self.n_trees
+
+
+# -- compaction CLI --
+
+def _load_source(path: Path):
+    """(sklearn forest, target encoder, feature columns) of a joblib artifact or an app.train bundle."""
+    import joblib
+    from app import train
+
+    main = train._app()
+    if path.is_dir():
+        meta = json.loads((path / main.BUNDLE_MANIFEST).read_text())
+        if meta.get('backend') != 'random_forest' or meta.get('model_format'):
+            raise SystemExit(f'{path}: not a RandomForest joblib bundle.')
+        model = joblib.load(path / meta['model'])
+        encoder = joblib.load(path / meta['target_encoder']) if meta.get('target_encoder') else None
+        return model, encoder, list(meta['feature_columns'])
+    model = joblib.load(path)
+    if isinstance(model, tuple) and len(model) == 2:
+        model, columns = model
+    else:
+        columns = getattr(model, 'feature_names_in_', None)
+    if not hasattr(model, 'estimators_') or columns is None:
+        raise SystemExit(f'{path}: expected a bare RandomForest with feature names.')
+    return model, main._load_target_encoder(train.ROOT), list(columns)
+
+
+def _timed(fn, repeat: int) -> float:
+    """Median seconds per call."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob('*') if p.is_file()) if path.is_dir() else path.stat().st_size
+
+
+def evaluate(model, compact, encoder, columns: List[str], data: str, samples: int, options: dict,
+             folds: int = 5, seed: int = 42) -> dict:
+    """Prediction and accuracy differences of ``compact`` against ``model``.
+
+    Three row sets: ``holdout``, out-of-fold predictions of refits of
+    ``model`` (same hyperparameters, the KFold split of ``app.train``) and of
+    their compactions, with MAE against IAUC; ``train``, the labelled rows of
+    ``data`` through the given forest (in-sample: the artifact was fitted on
+    them); and ``samples`` random API inputs (prediction differences only).
+    """
+    import pandas as pd
+    from sklearn.base import clone
+    from sklearn.model_selection import KFold
+    from app import benchmark, train
+
+    main = train._app()
+    out = {}
+    frame, y = train.load_training_frame(data)
+    X = train._matrix(frame, columns, encoder).to_numpy(dtype=np.float64)
+    sets = {'train': (model.predict(X), compact.predict(X), y)}
+    if folds > 1:
+        enc_params = {k: v for k, v in encoder.get_params().items()
+                      if k in ('min_samples_leaf', 'smoothing', 'handle_unknown', 'handle_missing')}
+        original, got = np.empty(len(y)), np.empty(len(y))
+        for train_idx, val_idx in KFold(n_splits=folds, shuffle=True, random_state=seed).split(frame):
+            fold_encoder = train._fit_encoder(enc_params, frame.iloc[train_idx], y[train_idx])
+            refit = clone(model).fit(train._matrix(frame.iloc[train_idx], columns, fold_encoder), y[train_idx])
+            X_val = train._matrix(frame.iloc[val_idx], columns, fold_encoder).to_numpy(dtype=np.float64)
+            original[val_idx] = refit.predict(X_val)
+            got[val_idx] = type(compact).from_sklearn(refit, **options).predict(X_val)
+        sets = {'holdout': (original, got, y), **sets}
+    if samples:
+        raw = pd.DataFrame([main._raw_feature_row(p) for p in benchmark._payloads(samples, seed=7)])
+        X = train._matrix(raw, columns, encoder).to_numpy(dtype=np.float64)
+        sets['random'] = (model.predict(X), compact.predict(X), None)
+    for name, (original, got, target) in sets.items():
+        diff = np.abs(got - original)
+        entry = {'rows': int(len(got)), 'max_abs_diff': float(diff.max()), 'mean_abs_diff': float(diff.mean()),
+                 'identical': bool(np.array_equal(got, original))}
+        if target is not None:
+            entry['mae_original'] = float(np.mean(np.abs(original - target)))
+            entry['mae_compact'] = float(np.mean(np.abs(got - target)))
+            entry['mae_delta'] = entry['mae_compact'] - entry['mae_original']
+        out[name] = entry
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.rf_compact', description=__doc__.split('\n\n')[0])
+    ap.add_argument('source', type=Path, help='RandomForest .joblib file or a bundle directory from app.train')
+    ap.add_argument('--leaf-dtype', choices=('float64', 'float32'), default='float64',
+                    help='leaf value precision (float64 keeps predictions identical)')
+    ap.add_argument('--max-trees', type=int, help='keep only the first N trees')
+    ap.add_argument('--max-depth', type=int, help='cut every tree to this many levels')
+    ap.add_argument('--data', default='cleaned', help='labelled rows for the accuracy check (see app.dataset)')
+    ap.add_argument('--folds', type=int, default=5,
+                    help='refit the forest on KFold splits of --data for held-out MAE (0 = skip)')
+    ap.add_argument('--seed', type=int, default=42, help='KFold seed (default: that of app.train)')
+    ap.add_argument('--samples', type=int, default=2000, help='random API inputs for the prediction check')
+    ap.add_argument('--version', help='bundle version name (default: <source stem>-compact)')
+    ap.add_argument('--out', type=Path, help='registry directory (default: PPGI_MODEL_DIR)')
+    ap.add_argument('--activate', action='store_true', help='make the bundle the active model of every worker')
+    ap.add_argument('--dry-run', action='store_true', help='report only; write nothing')
+    args = ap.parse_args(argv)
+
+    import joblib
+    from app import train
+    from app.rf_flat import FlatForest
+    # Under ``python -m`` this module is __main__; use the importable class so bundles load elsewhere
+    from app.rf_compact import CompactForest
+
+    source = args.source.resolve()
+    main_mod = train._app()
+    out = args.out.resolve() if args.out else Path(main_mod.MODEL_DIR).resolve()
+    if args.activate and out != Path(main_mod.MODEL_DIR).resolve():
+        raise SystemExit('--activate needs the bundle in PPGI_MODEL_DIR (omit --out).')
+    model, encoder, columns = _load_source(source)
+    options = {'leaf_dtype': args.leaf_dtype, 'max_trees': args.max_trees, 'max_depth': args.max_depth}
+    compact = CompactForest.from_sklearn(model, **options)
+    flat = FlatForest.from_sklearn(model)
+
+    quality = evaluate(model, compact, encoder, columns, args.data, args.samples, options, args.folds, args.seed)
+    frame, _ = train.load_training_frame(args.data)
+    X = np.resize(train._matrix(frame, columns, encoder).to_numpy(dtype=np.float32), (256, len(columns)))
+    model_file = source / json.loads((source / main_mod.BUNDLE_MANIFEST).read_text())['model'] \
+        if source.is_dir() else source
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = compact.save(Path(tmp) / 'forest')
+        report = {
+            'trees': [len(model.estimators_), compact.n_trees],
+            'split_nodes': int(len(compact.feature)),
+            'leaves': int(len(compact.leaf_value)),
+            'merged_leaves': compact.meta['merged_leaves'],
+            'file_bytes': [_dir_bytes(model_file), _dir_bytes(saved)],
+            'array_bytes': [int(sum(a.nbytes for a in (flat.feature, flat.threshold, flat.left, flat.right,
+                                                        flat.value, flat.roots) if a is not None)), compact.nbytes],
+            'load_ms': [_timed(lambda: joblib.load(model_file), 3) * 1e3,
+                        _timed(lambda: CompactForest.load(saved), 10) * 1e3],
+            'predict_1_us': [_timed(lambda: flat.predict(X[:1]), 200) * 1e6,
+                             _timed(lambda: compact.predict(X[:1]), 200) * 1e6],
+            'predict_256_us': [_timed(lambda: flat.predict(X), 20) * 1e6,
+                               _timed(lambda: compact.predict(X), 20) * 1e6],
+            'quality': quality,
+        }
+    print(f'{"":16} {"original":>12} {"compact":>12}')
+    print(f'{"trees":16} {report["trees"][0]:12d} {report["trees"][1]:12d}')
+    print(f'{"file bytes":16} {report["file_bytes"][0]:12,d} {report["file_bytes"][1]:12,d}')
+    print(f'{"array bytes":16} {report["array_bytes"][0]:12,d} {report["array_bytes"][1]:12,d}  (flat forest vs compact)')
+    print(f'{"load ms":16} {report["load_ms"][0]:12.2f} {report["load_ms"][1]:12.2f}  (joblib vs compact)')
+    print(f'{"1 row us":16} {report["predict_1_us"][0]:12.1f} {report["predict_1_us"][1]:12.1f}  (flat forest vs compact)')
+    print(f'{"256 rows us":16} {report["predict_256_us"][0]:12.1f} {report["predict_256_us"][1]:12.1f}')
+    labels = {'holdout': f'held-out, {args.folds}-fold refits', 'train': 'training rows, in-sample',
+              'random': 'random API inputs'}
+    for name, q in quality.items():
+        line = (f'{name} ({labels[name]}, {q["rows"]} rows): max |diff| {q["max_abs_diff"]:.6g}, mean |diff| {q["mean_abs_diff"]:.6g}'
+                f'{" (identical)" if q["identical"] else ""}')
+        if 'mae_delta' in q:
+            line += f'; MAE {q["mae_original"]:.2f} -> {q["mae_compact"]:.2f} ({q["mae_delta"]:+.2f})'
+        print(line)
+    if args.dry_run:
+        return 0
+
+    version = args.version or f'{source.stem if source.is_file() else source.name}-compact'
+    info = {'source': str(source), 'compaction': {**options, **report}}
+    # Only an exact compaction can hand large batches to the original forest
+    exact = args.leaf_dtype == 'float64' and not args.max_depth and \
+        (not args.max_trees or args.max_trees >= len(model.estimators_))
+    path = train.write_bundle(out, version, 'random_forest', compact, encoder, columns, info,
+                              fallback=model if exact else None)
+    state = main_mod._load_version(version, path)
+    main_mod._warm_state(state)
+    print(f'[rf_compact] wrote {path} ({state.label}, plan={"array" if state.feature_plan else "frame"})',
+          file=sys.stderr)
+    if args.activate:
+        main_mod._registry.scan()
+        main_mod._registry.activate(version)
+        print(f'[rf_compact] {version} is now active', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
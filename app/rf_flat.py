@@ -0,0 +1,176 @@
+"""Array-backed RandomForest inference.
+
+``FlatForest.from_sklearn`` packs every ``estimators_[i].tree_`` of a fitted
+RandomForestRegressor into contiguous node arrays shared across trees. The
+predictor walks all (row, tree) pairs one level per step with NumPy, which
+skips sklearn's per-call validation and per-estimator thread dispatch; for
+the 1-2 row requests served by the API that overhead dominates. The walk
+scales worse than sklearn with the batch size, so the API wraps it in
+``SmallBatchForest`` and sends larger batches to the sklearn estimator.
+
+Split semantics follow sklearn: inputs are cast to float32 and compared with
+``<=`` against the float64 thresholds; NaN follows ``missing_go_to_left``.
+"""
+from pathlib import Path
+from typing import Optional, Union
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'missing_left')
+
+
+class FlatForest:
+    """Mean of regression trees stored as flat arrays.
+
+    Leaf nodes point to themselves, so every row can be advanced ``max_depth``
+    times without tracking which (row, tree) pairs are already at a leaf.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 missing_left=None, n_features: Optional[int] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.missing_left = missing_left
+        self.n_trees = len(roots)
+        self.n_features_in_ = int(n_features) if n_features is not None else int(feature.max()) + 1
+        self.meta: dict = {}
+
+    @classmethod
+    def from_sklearn(cls, forest) -> 'FlatForest':
+        """Export a fitted single-output forest regressor (``estimators_`` of decision trees)."""
+        feature, threshold, left, right, value, missing, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in forest.estimators_:
+            t = est.tree_
+            if t.n_outputs != 1:
+                raise ValueError('Only single-output forests are supported.')
+            n = t.node_count
+            ids = np.arange(n, dtype=np.int64) + offset
+            is_leaf = t.children_left < 0
+            feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+            threshold.append(np.asarray(t.threshold, dtype=np.float64))
+            left.append(np.where(is_leaf, ids, t.children_left + offset))
+            right.append(np.where(is_leaf, ids, t.children_right + offset))
+            value.append(np.asarray(t.value, dtype=np.float64).reshape(n, -1)[:, 0])
+            mgl = getattr(t, 'missing_go_to_left', None)
+            missing.append(np.zeros(n, dtype=bool) if mgl is None else (np.asarray(mgl) != 0) & ~is_leaf)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, int(t.max_depth))
+
+        missing_left = np.concatenate(missing)
+        return cls(
+            feature=np.concatenate(feature),
+            threshold=np.concatenate(threshold),
+            left=np.concatenate(left),
+            right=np.concatenate(right),
+            value=np.concatenate(value),
+            roots=np.array(roots, dtype=np.int64),
+            max_depth=max_depth,
+            missing_left=missing_left if missing_left.any() else None,
+            n_features=getattr(forest, 'n_features_in_', None),
+        )
+
+    def save(self, directory: Union[str, Path], meta: Optional[dict] = None) -> Path:
+        """Write the arrays as ``.npy`` files (plus ``meta.json``) into ``directory``.
+
+        The directory is written to a temporary sibling and renamed into place,
+        so concurrent readers never observe a partial dump.
+        """
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=directory.name + '.', dir=directory.parent))
+        try:
+            for name in _ARRAYS:
+                arr = getattr(self, name)
+                if arr is not None:
+                    np.save(tmp / f'{name}.npy', np.ascontiguousarray(arr))
+            info = dict(meta or {})
+            info.update({'max_depth': self.max_depth, 'n_features': self.n_features_in_})
+            (tmp / 'meta.json').write_text(json.dumps(info))
+            os.replace(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not (directory / 'meta.json').exists():
+                raise
+        return directory
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap_mode: Optional[str] = 'r') -> 'FlatForest':
+        """Load a dump written by ``save``.
+
+        With ``mmap_mode='r'`` the arrays are read-only memory maps: pages come
+        from the OS page cache and are shared by every process using the dump.
+        """
+        directory = Path(directory)
+        info = json.loads((directory / 'meta.json').read_text())
+        arrays = {}
+        for name in _ARRAYS:
+            fp = directory / f'{name}.npy'
+            # np.asarray drops the memmap subclass (and its per-access overhead) but keeps the mapping
+            arrays[name] = np.asarray(np.load(fp, mmap_mode=mmap_mode)) if fp.exists() else None
+        forest = cls(max_depth=info['max_depth'], n_features=info['n_features'], **arrays)
+        forest.meta.update(info)
+        return forest
+
+    def predict(self, X) -> np.ndarray:
+        """Predict one value per row of ``X`` (array-like, n_rows x n_features)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got {X.shape[1]}')
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            fval = X[rows, self.feature[node]]
+            go_left = fval <= self.threshold[node]
+            if self.missing_left is not None:
+                go_left |= np.isnan(fval) & self.missing_left[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        # Sequential accumulation over trees, then mean (same order as sklearn's n_jobs=None path)
+        return np.cumsum(self.value[node], axis=1)[:, -1] / self.n_trees
+
+
+class SmallBatchForest:
+    """Serve batches of up to ``max_rows`` rows with ``small``, larger ones with ``large``.
+
+    The array predictors (``FlatForest``, ``CompactForest``) win only while
+    sklearn's fixed per-call overhead dominates: their level-by-level walk
+    allocates rows x trees temporaries, so big batches go to the original
+    estimator. Both must make the same predictions. ``large`` may also be a
+    zero-argument loader, called once on the first large batch, so a process
+    that only serves small batches never loads the original estimator.
+    """
+
+    def __init__(self, small, large, max_rows: int):
+        self.small = small
+        self.large = large if hasattr(large, 'predict') else None
+        self._load_large = None if self.large is not None else large
+        self._lock = threading.Lock()
+        self.max_rows = int(max_rows)
+        self.n_features_in_ = small.n_features_in_
+        self.meta = getattr(small, 'meta', {})
+
+    def _large(self):
+        if self.large is None:
+            with self._lock:
+                if self.large is None:
+                    self.large = self._load_large()
+        return self.large
+
+    def predict(self, X) -> np.ndarray:
+        """Predict one value per row of ``X``."""
+        return (self.small if len(X) <= self.max_rows else self._large()).predict(X)
@@ -0,0 +1,164 @@
+"""Inference scheduling: run model calls off the event loop, coalescing requests.
+
+Requests submitted within ``window_ms`` of each other are merged into one
+call of the scoring function, which runs on a bounded thread or process
+pool so CPU-bound inference never blocks the asyncio event loop.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+import asyncio
+
+import numpy as np
+
+
+class InferenceQueueFull(Exception):
+    """Raised by ``submit`` and ``run`` when the pending-request queue is at capacity."""
+
+
+class _Request:
+    __slots__ = ('items', 'future')
+
+    def __init__(self, items: Sequence, future: asyncio.Future):
+        self.items = items
+        self.future = future
+
+
+class InferenceScheduler:
+    """Micro-batching front end for a batch scoring function.
+
+    ``fn(items)`` must take a list of inputs and return a tuple of arrays with
+    one entry per input; each caller gets back its own slice of every array.
+    At most ``workers`` batches run concurrently and at most ``max_queue``
+    requests (queued ``submit`` calls plus ``run`` calls waiting for a slot)
+    wait; beyond that ``submit`` and ``run`` raise InferenceQueueFull.
+    """
+
+    def __init__(self, fn: Callable, workers: int = 2, kind: str = 'thread',
+                 window_ms: float = 2.0, max_batch_rows: int = 256, max_queue: int = 1000):
+        self.fn = fn
+        self.workers = max(int(workers), 1)
+        self.kind = kind
+        self.window = max(float(window_ms), 0.0) / 1000.0
+        self.max_batch_rows = max(int(max_batch_rows), 1)
+        self.max_queue = max(int(max_queue), 1)
+        self._executor: Optional[Executor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        # run() callers waiting for a slot; they count against max_queue with the queued requests
+        self._waiting = 0
+        self.batches = 0
+        self.rows = 0
+        self.rejected = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._collector is not None and not self._collector.done():
+            return
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        self._loop = loop
+        self._waiting = 0
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = loop.create_task(self._collect())
+
+    async def submit(self, items: Sequence):
+        """Score ``items`` (possibly together with other callers' items)."""
+        self._ensure_started()
+        self._check_capacity()
+        fut = self._loop.create_future()
+        self._queue.put_nowait(_Request(list(items), fut))
+        return await fut
+
+    async def run(self, fn: Callable, *args):
+        """Run ``fn(*args)`` on the inference pool, sharing the in-flight limit with batches.
+
+        For work that does not fit the per-item batching of ``submit``; raises
+        InferenceQueueFull under the same conditions.
+        """
+        self._ensure_started()
+        self._check_capacity()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            return await self._loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    def _check_capacity(self) -> None:
+        if self._queue.qsize() + self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise InferenceQueueFull(f'Inference queue is full ({self.max_queue} pending requests).')
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Take a slot only once there is work, so an idle collector never holds one from run()
+            batch = [await self._queue.get()]
+            await self._slots.acquire()
+            rows = len(batch[0].items)
+            deadline = loop.time() + self.window
+            while rows < self.max_batch_rows:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        req = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    req = self._queue.get_nowait()
+                batch.append(req)
+                rows += len(req.items)
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[_Request]) -> None:
+        items = [it for req in batch for it in req.items]
+        try:
+            out = await self._loop.run_in_executor(self._executor, self.fn, items)
+        except Exception as e:
+            for req in batch:
+                if not req.future.done():
+                    req.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        self.batches += 1
+        self.rows += len(items)
+        start = 0
+        for req in batch:
+            end = start + len(req.items)
+            if not req.future.done():
+                req.future.set_result(tuple(np.asarray(a)[start:end] for a in out))
+            start = end
+
+    def shutdown(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'executor': self.kind,
+            'workers': self.workers,
+            'window_ms': self.window * 1000.0,
+            'max_batch_rows': self.max_batch_rows,
+            'max_queue': self.max_queue,
+            'queue_depth': (self._queue.qsize() + self._waiting) if self._queue is not None else 0,
+            'batches': self.batches,
+            'rows': self.rows,
+            'avg_batch_rows': (self.rows / self.batches) if self.batches else 0.0,
+            'rejected': self.rejected,
+        }
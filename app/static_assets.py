@@ -0,0 +1,162 @@
+"""In-memory static assets: pre-compressed, content-hashed and cache-friendly.
+
+Every file under the static directory is read once. Text files (HTML, CSS,
+JS, SVG, JSON) are compressed ahead of time with gzip and, when the
+``brotli`` package is installed, brotli; a request gets the smallest
+variant its ``Accept-Encoding`` allows. Each asset is also published under a
+content-hashed name (``style.css`` -> ``style.3f2a9c1e.css``), and references
+to ``/static/<file>`` inside HTML and CSS are rewritten to the hashed URLs,
+which are served with a far-future immutable ``Cache-Control``. Pages and
+unhashed URLs are served with ``no-cache`` and strong ETags, so browsers
+revalidate them cheaply (``If-None-Match`` -> 304).
+"""
+from pathlib import Path
+from typing import Dict, Optional, Union
+import gzip
+import hashlib
+import mimetypes
+import re
+
+try:  # optional: brotli variants are skipped without it
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Text files whose /static/... references are rewritten, after the files they point to are hashed
+_REWRITE_ORDER = {'.css': 1, '.html': 2, '.htm': 2}
+_ENCODINGS = ('br', 'gzip')
+
+
+class Asset:
+    __slots__ = ('name', 'hashed_name', 'media_type', 'etag', 'variants')
+
+    def __init__(self, name: str, data: bytes, media_type: str):
+        self.name = name
+        self.media_type = media_type
+        digest = hashlib.sha256(data).hexdigest()
+        stem, dot, ext = name.rpartition('.')
+        self.hashed_name = f'{stem}.{digest[:8]}.{ext}' if dot else f'{name}.{digest[:8]}'
+        self.etag = digest[:32]
+        # encoding -> body; only variants smaller than the original are kept
+        self.variants: Dict[str, bytes] = {'identity': data}
+        if media_type.startswith(_COMPRESSIBLE) and len(data) > 256:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.variants['gzip'] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(self.variants.get('gzip', data)):
+                    self.variants['br'] = br
+
+    def tag(self, encoding: str) -> str:
+        return f'"{self.etag}"' if encoding == 'identity' else f'"{self.etag}-{encoding}"'
+
+
+def _accepted(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding -> {coding: q}."""
+    out: Dict[str, float] = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[coding] = q
+    return out
+
+
+class StaticAssets:
+    """Assets of ``directory`` (read recursively at construction), served under ``prefix``."""
+
+    def __init__(self, directory: Union[str, Path], prefix: str = '/static'):
+        self.directory = Path(directory)
+        self.prefix = prefix.rstrip('/')
+        self._by_name: Dict[str, Asset] = {}
+        self._by_url: Dict[str, Asset] = {}
+        files = sorted(p for p in self.directory.rglob('*') if p.is_file())
+        files.sort(key=lambda p: _REWRITE_ORDER.get(p.suffix.lower(), 0))
+        self._ref = None
+        for path in files:
+            name = path.relative_to(self.directory).as_posix()
+            data = path.read_bytes()
+            if path.suffix.lower() in _REWRITE_ORDER:
+                data = self._rewrite(data)
+            media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            asset = Asset(name, data, media_type)
+            self._by_name[name] = asset
+            self._by_url[name] = asset
+            self._by_url[asset.hashed_name] = asset
+            self._ref = None
+
+    def _rewrite(self, data: bytes) -> bytes:
+        """Point ``/static/<name>`` references at the hashed URLs of the assets loaded so far."""
+        if not self._by_name:
+            return data
+        if self._ref is None:
+            names = sorted(self._by_name, key=len, reverse=True)
+            self._ref = re.compile(
+                re.escape(self.prefix + '/').encode() + b'(' + b'|'.join(re.escape(n).encode() for n in names) + b')'
+                + rb'(?=[\'")?#\s]|$)'
+            )
+        return self._ref.sub(lambda m: self.url(m.group(1).decode()).encode(), data)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def url(self, name: str) -> str:
+        """Content-hashed URL of asset ``name`` (the plain URL if unknown)."""
+        asset = self._by_name.get(name)
+        return f'{self.prefix}/{asset.hashed_name if asset else name}'
+
+    def response(self, path: str, request: Request, page: bool = False) -> Response:
+        """Best variant of the asset at URL path ``path`` (plain or hashed name), or a 404.
+
+        ``page`` serves an asset by its plain name as an HTML page would be
+        (revalidated on every load).
+        """
+        asset = self._by_name.get(path) if page else self._by_url.get(path)
+        if asset is None:
+            return Response('Not Found', status_code=404, media_type='text/plain')
+        immutable = not page and path == asset.hashed_name
+        accepted = _accepted(request.headers.get('accept-encoding'))
+        encoding = 'identity'
+        for coding in _ENCODINGS:
+            if coding in asset.variants and accepted.get(coding, accepted.get('*', 0.0)) > 0:
+                encoding = coding
+                break
+        headers = {
+            'ETag': asset.tag(encoding),
+            'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        inm = request.headers.get('if-none-match')
+        if inm:
+            tags = {t.strip()[2:] if t.strip().startswith('W/') else t.strip() for t in inm.split(',')}
+            if '*' in tags or any(asset.tag(e) in tags for e in asset.variants):
+                return Response(status_code=304, headers=headers)
+        body = b'' if request.method == 'HEAD' else asset.variants[encoding]
+        response = Response(body, media_type=asset.media_type, headers=headers)
+        if request.method == 'HEAD':
+            response.headers['Content-Length'] = str(len(asset.variants[encoding]))
+        return response
+
+    def stats(self) -> dict:
+        return {
+            'assets': len(self._by_name),
+            'bytes': {e: sum(len(a.variants.get(e, a.variants['identity'])) for a in self._by_name.values())
+                      for e in ('identity',) + _ENCODINGS},
+        }
@@ -0,0 +1,437 @@
+"""Cross-validated hyperparameter search that writes serving-ready model bundles.
+
+Usage::
+
+    python -m app.train                                  # RandomForest grid, 5 folds, all cores
+    python -m app.train --backend random_forest lightgbm --max-latency-us 300 --activate
+
+Training rows come from ``NoteBooks/out/df_cleaned.xlsx`` (through the
+``app.dataset`` cache) and go through the served feature code: the raw
+training-layout columns of ``_raw_feature_row``, ``_engineer_features`` and
+``_model_frame`` from ``app.main``. The target encoder is refitted inside
+every fold with the parameters of the served ``target_encoder.joblib``, so
+validation scores do not see their own targets.
+
+Each (candidate, fold) fit is a task for a process pool. For every candidate
+the report lists out-of-fold MAE/RMSE/R², mean fit time, and single-row and
+per-row (batch of 256) latency of the evaluator that serves the model
+(``FlatForest`` or ``LightGBMTextModel``, timed in the parent process); ``*`` marks candidates no other
+candidate beats on error, fit time and latency at once. The best candidate
+(lowest ``--metric``, within ``--max-latency-us`` if given) is refitted on
+all rows and written as a bundle directory to ``PPGI_MODEL_DIR``::
+
+    models/<version>/bundle.json           backend, files, feature columns, params, CV scores, data hash
+    models/<version>/<version>.joblib      the model (<version>.txt for LightGBM)
+    models/<version>/target_encoder.joblib
+    models/<version>/search.json           every candidate's scores
+
+The bundle is loaded and warmed through the registry loader before the
+command exits; ``--activate`` also makes it the active version for every
+worker (``models/ACTIVE``).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# Training must not add its feature timings to the server's /metrics
+os.environ.setdefault('PPGI_METRICS', '0')
+
+ROOT = Path(__file__).resolve().parent.parent
+
+TARGET = 'IAUC'
+# df_cleaned.xlsx headers -> the served raw-row names
+COLUMN_RENAMES = {
+    'Protien(g)': 'Protien(g/100g)',
+    'Fat(g)': 'Fat(g/100g)',
+    'Dietary Fiber': 'Dietary Fiber(g/100g)',
+}
+# Feature columns of the shipped random_forest_model.joblib / lightgbm_model.txt
+SERVED_FEATURES = [
+    'Gender', 'Age', 'Weight(kg)', 'Height(cm)', 'Waist circumference', 'Hip circumference',
+    'Family history diabetics', 'Physical activity', 'Health Problem', 'Alcoholic', 'Blood Group',
+    'Carb(g/100g)', 'Protien(g/100g)', 'Fat(g/100g)', 'Dietary Fiber(g/100g)', 'Total_Nutrients',
+    'Carb_Proportion', 'Protien_Proportion', 'Fat_Proportion', 'Dietary_Fiber_Proportion',
+    'Carb_x_Protien', 'Carb_x_Fat', 'Carb_x_Dietary_Fiber', 'Protien_x_Fat', 'Protien_x_Dietary_Fiber',
+    'Fat_x_Dietary_Fiber',
+]
+# Used when no target_encoder.joblib is found (the shipped encoder's settings)
+ENCODER_PARAMS = {'min_samples_leaf': 20, 'smoothing': 10}
+
+SEARCH_SPACES = {
+    'random_forest': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 8],
+        'min_samples_leaf': [1, 3],
+        'max_features': [1.0, 'sqrt'],
+    },
+    'lightgbm': {
+        'n_estimators': [100, 300],
+        'learning_rate': [0.05, 0.1],
+        'num_leaves': [7, 15, 31],
+        'min_child_samples': [5, 20],
+    },
+}
+LATENCY_BATCH = 256
+
+_main = None  # app.main, imported lazily (per process) by _app()
+_data: Optional[dict] = None  # training data of a pool worker (see _init_worker)
+
+
+def _app():
+    """Import ``app.main`` with the repo root as cwd, as the server runs it (relative PPGI_* paths)."""
+    global _main
+    if _main is None:
+        os.chdir(ROOT)
+        from app import main
+        _main = main
+    return _main
+
+
+# -- data --
+
+def load_training_frame(source: str = 'cleaned', sheet=0):
+    """Raw training-layout rows (the columns of ``_raw_feature_row``) and the IAUC target."""
+    import pandas as pd
+    from app import dataset
+
+    main = _app()
+    df = dataset.load(source, sheet).rename(columns=COLUMN_RENAMES)
+    raw_columns = list(main._raw_feature_row(main.PredictInput()))
+    missing = [c for c in raw_columns + [TARGET] if c not in df.columns]
+    if missing:
+        raise SystemExit(f'{source}: missing training columns {missing}')
+    df = df[df[TARGET].notna()].reset_index(drop=True)
+    numeric = [c for c in raw_columns if c not in main._CATEGORICAL_DEFAULTS]
+    X = df[raw_columns].copy()
+    X[numeric] = X[numeric].apply(pd.to_numeric, errors='coerce')
+    return X, df[TARGET].to_numpy(dtype=np.float64)
+
+
+def feature_columns(kind: str) -> List[str]:
+    """'served' (the shipped models' columns) or 'all' (every engineered column the server keeps)."""
+    if kind == 'served':
+        return list(SERVED_FEATURES)
+    main = _app()
+    probe = main._model_frame(main.pd.DataFrame([main._raw_feature_row(main.PredictInput())]), None)
+    return list(probe.columns)
+
+
+def encoder_params() -> dict:
+    """TargetEncoder settings of the served encoder (or ENCODER_PARAMS without one)."""
+    main = _app()
+    served = main._load_target_encoder(ROOT)
+    params = dict(ENCODER_PARAMS)
+    if served is not None:
+        params = {k: v for k, v in served.get_params().items() if k in ('min_samples_leaf', 'smoothing',
+                                                                      'handle_unknown', 'handle_missing')}
+    return params
+
+
+def _fit_encoder(params: dict, frame, y):
+    """Fit a TargetEncoder on engineered rows, as the served encoder was fitted."""
+    from category_encoders import TargetEncoder
+    main = _app()
+    encoder = TargetEncoder(cols=list(main._CATEGORICAL_DEFAULTS), **params)
+    return encoder.fit(main._engineer_features(frame), y)
+
+
+def _matrix(frame, columns: List[str], encoder):
+    """Model input for raw rows, exactly as the server builds it (_model_frame + _prepare_X)."""
+    import pandas as pd
+    main = _app()
+    df = main._model_frame(frame, columns, encoder)
+    # _model_frame serves unencoded rows if the encoder fails; training must not
+    unencoded = [c for c in main._CATEGORICAL_DEFAULTS if c in df.columns and not pd.api.types.is_numeric_dtype(df[c])]
+    if unencoded:
+        raise ValueError(f'Target encoding failed for {unencoded}')
+    return main._prepare_X(df, SimpleNamespace(feature_columns=columns))
+
+
+# -- models --
+
+def _make_model(backend: str, params: dict, seed: int):
+    if backend == 'random_forest':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(random_state=seed, n_jobs=1, **params)
+    if backend == 'lightgbm':
+        import lightgbm
+        return lightgbm.LGBMRegressor(random_state=seed, n_jobs=1, verbose=-1, **params)
+    raise ValueError(f'Unknown backend: {backend}')
+
+
+def _serving_model(backend: str, model):
+    """The evaluator the server would use for ``model``."""
+    main = _app()
+    if backend == 'lightgbm':
+        return main.LightGBMTextModel(model.booster_.model_to_string())
+    return main.FlatForest.from_sklearn(model)
+
+
+def _latency_us(predictor, X: np.ndarray, repeat: int = 50) -> Dict[str, float]:
+    """Median single-row latency and per-row latency at LATENCY_BATCH rows, in microseconds."""
+    one = X[:1]
+    batch = np.resize(X, (LATENCY_BATCH, X.shape[1]))
+    predictor.predict(one)
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        predictor.predict(one)
+        times.append(time.perf_counter() - t)
+    single = float(np.median(times)) * 1e6
+    times = []
+    for _ in range(max(repeat // 10, 3)):
+        t = time.perf_counter()
+        predictor.predict(batch)
+        times.append(time.perf_counter() - t)
+    return {'latency_1_us': single, 'latency_row_us': float(np.median(times)) * 1e6 / LATENCY_BATCH}
+
+
+# -- pool tasks --
+
+def _init_worker(data: dict) -> None:
+    global _data
+    _data = data
+    _app()
+
+
+def fit_fold(candidate: int, backend: str, params: dict, fold: int, train_idx, val_idx) -> dict:
+    """Fit one candidate on one fold; runs in a pool worker."""
+    frame, y, columns, enc_params, seed = (_data[k] for k in ('frame', 'y', 'columns', 'encoder', 'seed'))
+    t0 = time.perf_counter()
+    encoder = _fit_encoder(enc_params, frame.iloc[train_idx], y[train_idx])
+    X_train = _matrix(frame.iloc[train_idx], columns, encoder)
+    model = _make_model(backend, params, seed).fit(X_train, y[train_idx])
+    fit_s = time.perf_counter() - t0
+    X_val = _matrix(frame.iloc[val_idx], columns, encoder).to_numpy(dtype=np.float64)
+    predictor = _serving_model(backend, model)
+    pred = predictor.predict(X_val)
+    # The first fold's evaluator goes back to the parent, which times it without pool contention
+    return {'candidate': candidate, 'fold': fold, 'val_idx': list(map(int, val_idx)), 'pred': pred.tolist(),
+            'fit_s': fit_s, 'predictor': predictor if fold == 0 else None, 'X_val': X_val if fold == 0 else None}
+
+
+# -- search --
+
+def candidates(backends: List[str], trials: Optional[int], seed: int) -> List[tuple]:
+    """(backend, params) pairs: the full grid of each backend, or ``trials`` random picks from it."""
+    out = []
+    for backend in backends:
+        space = SEARCH_SPACES[backend]
+        grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+        if trials is not None and trials < len(grid):
+            grid = random.Random(seed).sample(grid, trials)
+        out.extend((backend, params) for params in grid)
+    return out
+
+
+def _pareto(rows: List[dict], metric: str) -> None:
+    keys = (metric, 'fit_s', 'latency_1_us')
+    for r in rows:
+        r['pareto'] = not any(
+            all(o[k] <= r[k] for k in keys) and any(o[k] < r[k] for k in keys) for o in rows if o is not r
+        )
+
+
+def search(frame, y, cands: List[tuple], columns: List[str], enc_params: dict, folds: int = 5,
+           workers: int = os.cpu_count() or 1, seed: int = 42, metric: str = 'mae') -> List[dict]:
+    """Cross-validate every candidate; returns one result dict per candidate, best ``metric`` first."""
+    from sklearn.model_selection import KFold
+
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(frame))
+    data = {'frame': frame, 'y': y, 'columns': columns, 'encoder': enc_params, 'seed': seed}
+    tasks = [(c, backend, params, f, tr, va) for c, (backend, params) in enumerate(cands)
+             for f, (tr, va) in enumerate(splits)]
+    oof = np.full((len(cands), len(y)), np.nan)
+    fits: Dict[int, List[dict]] = {c: [] for c in range(len(cands))}
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+            results = pool.map(fit_fold, *zip(*tasks), chunksize=max(len(tasks) // (workers * 4), 1))
+            done = list(_progress(results, len(tasks), start))
+    else:
+        _init_worker(data)
+        done = list(_progress((fit_fold(*t) for t in tasks), len(tasks), start))
+    latency = {}
+    for r in done:
+        oof[r['candidate'], r['val_idx']] = r['pred']
+        fits[r['candidate']].append(r)
+        if r['predictor'] is not None:
+            latency[r['candidate']] = _latency_us(r['predictor'], r['X_val'])
+
+    rows = []
+    for c, (backend, params) in enumerate(cands):
+        err = oof[c] - y
+        rows.append({
+            'backend': backend,
+            'params': params,
+            'mae': float(np.mean(np.abs(err))),
+            'rmse': float(np.sqrt(np.mean(err ** 2))),
+            'r2': float(1.0 - np.sum(err ** 2) / np.sum((y - y.mean()) ** 2)),
+            'fit_s': float(np.mean([f['fit_s'] for f in fits[c]])),
+            **latency[c],
+        })
+    _pareto(rows, metric)
+    return sorted(rows, key=lambda r: (r[metric], r['latency_1_us']))
+
+
+def _progress(results, total: int, start: float):
+    next_report = time.monotonic() + 5.0
+    for n, r in enumerate(results, 1):
+        if time.monotonic() >= next_report or n == total:
+            next_report = time.monotonic() + 5.0
+            print(f'[train] {n}/{total} fits, {time.perf_counter() - start:.1f}s elapsed', file=sys.stderr, flush=True)
+        yield r
+
+
+def select(rows: List[dict], max_latency_us: Optional[float] = None) -> dict:
+    """Best-ranked candidate whose single-row latency fits the budget."""
+    for r in rows:
+        if max_latency_us is None or r['latency_1_us'] <= max_latency_us:
+            return r
+    raise SystemExit(f'No candidate predicts a row within {max_latency_us:g} us '
+                     f'(fastest: {min(r["latency_1_us"] for r in rows):.0f} us).')
+
+
+def format_report(rows: List[dict], metric: str, chosen: Optional[dict] = None) -> str:
+    header = f'{"":2} {"backend":14} {"MAE":>9} {"RMSE":>9} {"R2":>6} {"fit s":>7} {"1 row us":>9} {"us/row@256":>10}  params'
+    lines = [header]
+    for r in rows:
+        mark = ('>' if r is chosen else ' ') + ('*' if r['pareto'] else ' ')
+        lines.append(f'{mark} {r["backend"]:14} {r["mae"]:9.1f} {r["rmse"]:9.1f} {r["r2"]:6.3f} {r["fit_s"]:7.3f} '
+                     f'{r["latency_1_us"]:9.1f} {r["latency_row_us"]:10.2f}  {json.dumps(r["params"])}')
+    lines.append(f'(ranked by {metric}; * = Pareto-optimal on {metric}, fit time and 1-row latency; > = selected)')
+    return '\n'.join(lines)
+
+
+# -- bundles --
+
+def write_bundle(directory: Path, version: str, backend: str, model, encoder, columns: List[str],
+                 info: dict, report: Optional[List[dict]] = None, fallback=None) -> Path:
+    """Write a bundle directory for the registry (assembled under a hidden name, then renamed).
+
+    ``model`` is a fitted sklearn/LightGBM estimator or a ``CompactForest``
+    (saved as the ``forest/`` array directory). ``fallback`` is an estimator
+    with the same predictions that serves large batches (``fallback.joblib``).
+    """
+    from app.rf_compact import CompactForest
+    import joblib
+
+    target = directory / version
+    if target.exists():
+        raise SystemExit(f'{target} already exists; choose another --version.')
+    tmp = directory / f'.{version}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    model_format = None
+    if isinstance(model, CompactForest):
+        model_file, model_format = 'forest', 'compact_forest'
+        model.save(tmp / model_file)
+    elif backend == 'lightgbm':
+        model_file = f'{version}.txt'
+        model.booster_.save_model(str(tmp / model_file))
+    else:
+        model_file = f'{version}.joblib'
+        joblib.dump(model, tmp / model_file)
+    if fallback is not None:
+        joblib.dump(fallback, tmp / 'fallback.joblib')
+    joblib.dump(encoder, tmp / 'target_encoder.joblib')
+    meta = {
+        'format': 1,
+        'version': version,
+        'backend': backend,
+        'model': model_file,
+        'model_format': model_format,
+        'fallback_model': 'fallback.joblib' if fallback is not None else None,
+        'target_encoder': 'target_encoder.joblib',
+        'feature_columns': columns,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        **info,
+    }
+    (tmp / 'bundle.json').write_text(json.dumps(meta, indent=2))
+    if report is not None:
+        (tmp / 'search.json').write_text(json.dumps(report, indent=1))
+    os.replace(tmp, target)
+    return target
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.train', description=__doc__.split('\n\n')[0])
+    ap.add_argument('--data', default='cleaned', help='workbook name or path (see app.dataset; default: cleaned)')
+    ap.add_argument('--sheet', default=0, help='worksheet index or name')
+    ap.add_argument('--backend', nargs='+', choices=sorted(SEARCH_SPACES), default=['random_forest'])
+    ap.add_argument('--features', choices=('served', 'all'), default='served',
+                    help="'served': the shipped models' columns; 'all': every engineered column")
+    ap.add_argument('--folds', type=int, default=5)
+    ap.add_argument('--trials', type=int, help='random candidates per backend (default: the full grid)')
+    ap.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='fitting processes (1 = in-process)')
+    ap.add_argument('--metric', choices=('mae', 'rmse'), default='mae')
+    ap.add_argument('--max-latency-us', type=float, help='only select candidates this fast for one row')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--version', help='bundle version name (default: <backend>-<UTC timestamp>)')
+    ap.add_argument('--out', type=Path, help='registry directory (default: PPGI_MODEL_DIR)')
+    ap.add_argument('--activate', action='store_true', help='make the bundle the active model of every worker')
+    ap.add_argument('--dry-run', action='store_true', help='search and report only; write nothing')
+    args = ap.parse_args(argv)
+
+    out = args.out.resolve() if args.out else None
+    main_mod = _app()
+    out = out or Path(main_mod.MODEL_DIR).resolve()
+    if args.activate and out != Path(main_mod.MODEL_DIR).resolve():
+        raise SystemExit('--activate needs the bundle in PPGI_MODEL_DIR (omit --out).')
+    sheet = int(args.sheet) if str(args.sheet).isdigit() else args.sheet
+
+    from app import dataset
+    frame, y = load_training_frame(args.data, sheet)
+    columns = feature_columns(args.features)
+    enc_params = encoder_params()
+    cands = candidates(args.backend, args.trials, args.seed)
+    print(f'[train] {len(y)} rows, {len(columns)} features, {len(cands)} candidates x {args.folds} folds '
+          f'on {max(args.workers, 1)} processes', file=sys.stderr)
+    rows = search(frame, y, cands, columns, enc_params, folds=args.folds, workers=max(args.workers, 1),
+                  seed=args.seed, metric=args.metric)
+    best = select(rows, args.max_latency_us)
+    print(format_report(rows, args.metric, best))
+    if args.dry_run:
+        return 0
+
+    t0 = time.perf_counter()
+    encoder = _fit_encoder(enc_params, frame, y)
+    model = _make_model(best['backend'], best['params'], args.seed).fit(_matrix(frame, columns, encoder), y)
+    refit_s = time.perf_counter() - t0
+    version = args.version or f'{best["backend"]}-{time.strftime("%Y%m%d-%H%M%S", time.gmtime())}'
+    source = dataset.resolve(args.data)
+    info = {
+        'params': best['params'],
+        'encoder_params': enc_params,
+        'cv': {k: best[k] for k in ('mae', 'rmse', 'r2', 'fit_s', 'latency_1_us', 'latency_row_us')},
+        'cv_folds': args.folds,
+        'seed': args.seed,
+        'refit_s': refit_s,
+        'data': {'source': str(source), 'sheet': sheet, 'rows': int(len(y)), 'sha256': dataset._sha256(source)},
+    }
+    path = write_bundle(out, version, best['backend'], model, encoder, columns, info, rows)
+
+    # Load it the way the server will, so a broken bundle fails here rather than at activation
+    state = main_mod._load_version(version, path)
+    main_mod._warm_state(state)
+    print(f'[train] wrote {path} ({state.label}, plan={"array" if state.feature_plan else "frame"})', file=sys.stderr)
+    if args.activate:
+        main_mod._registry.scan()
+        main_mod._registry.activate(version)
+        print(f'[train] {version} is now active', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
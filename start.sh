@@ -6,8 +6,12 @@
 PORT="${PORT:-8000}"
 WEB_CONCURRENCY="${WEB_CONCURRENCY:-2}"
 
+# Load the model once in the master before forking workers (shared copy-on-write)
+export PPGI_PRELOAD="${PPGI_PRELOAD:-1}"
+
 echo "Starting Gunicorn on 0.0.0.0:${PORT} with workers=${WEB_CONCURRENCY}"
 exec gunicorn -k uvicorn.workers.UvicornWorker app.main:app \
   --bind 0.0.0.0:"${PORT}" \
   --workers "${WEB_CONCURRENCY}" \
+  --preload \
   --timeout 60
@@ -0,0 +1,26 @@
+"""Shared fixtures: the app runs against the shipped artifacts with its state kept out of the repo."""
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix='ppgi-tests-')
+# Set before app.main is imported (its configuration is read at import time)
+os.environ.setdefault('PPGI_METRICS', '0')
+os.environ.setdefault('PPGI_MODEL_DIR', os.path.join(_TMP, 'models'))
+os.environ.setdefault('PPGI_MODEL_CACHE_DIR', os.path.join(_TMP, 'model_cache'))
+os.environ.setdefault('PPGI_RESULT_DB', os.path.join(_TMP, 'results.sqlite3'))
+os.environ.setdefault('PPGI_RESPONSE_CACHE_DB', os.path.join(_TMP, 'response_cache.sqlite3'))
+os.environ.setdefault('PPGI_DATASET_CACHE_DIR', os.path.join(_TMP, 'datasets'))
+
+
+@pytest.fixture(scope='session')
+def main():
+    from app import main
+    return main
+
+
+@pytest.fixture(scope='session')
+def state(main):
+    """The default model state (bare RandomForest + target encoder)."""
+    return main._get_state()
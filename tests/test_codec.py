@@ -0,0 +1,14 @@
+from app.codec import PredictRecord, replace
+
+
+def test_record_matches_predict_input(main):
+    fields = main.PredictInput.model_fields
+    assert PredictRecord._fields == tuple(fields)
+    assert PredictRecord._field_defaults == {k: f.default for k, f in fields.items()}
+
+
+def test_record_round_trip(main):
+    payload = main.PredictInput(age=61.0, carb=48.3, food_id='rice')
+    record = PredictRecord.from_input(payload)
+    assert record.dict() == payload.model_dump()
+    assert replace(record, carb=1.0).dict() == replace(payload, carb=1.0).model_dump()
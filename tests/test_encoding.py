@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.encoding import CompiledTargetEncoder, compile_target_encoder
+
+ce = pytest.importorskip('category_encoders')
+
+
+def _training_frame():
+    rng = np.random.default_rng(0)
+    n = 200
+    frame = pd.DataFrame({
+        'Gender': rng.choice(['Male', 'Female'], n),
+        'Blood Group': rng.choice(['A+', 'B+', 'O+', 'AB-'], n),
+        'Physical activity': rng.choice(['Light', 'Moderate', 'Heavy', None], n),
+        'Age': rng.uniform(18, 80, n),
+    })
+    y = frame['Age'] * 3 + (frame['Gender'] == 'Male') * 40 + rng.normal(0, 10, n)
+    return frame, y
+
+
+def _probe(frame):
+    # Every known category, an unseen one and a missing one in each column
+    rows = []
+    for col in ('Gender', 'Blood Group', 'Physical activity'):
+        for value in list(frame[col].dropna().unique()) + ['__unseen__', None, np.nan]:
+            row = frame.iloc[0].to_dict()
+            row[col] = value
+            rows.append(row)
+    return pd.DataFrame(rows, columns=frame.columns)
+
+
+@pytest.mark.parametrize('policy', ['value', 'return_nan'])
+def test_tables_match_transform(policy):
+    frame, y = _training_frame()
+    cols = ['Gender', 'Blood Group', 'Physical activity']
+    encoder = ce.TargetEncoder(cols=cols, handle_unknown=policy, handle_missing=policy).fit(frame, y)
+    compiled = compile_target_encoder(encoder, frame.iloc[[0]])
+    assert compiled is not None
+    probe = _probe(frame)
+    expected = encoder.transform(probe)
+    for col in cols:
+        got = compiled.encode_column(col, probe[col].tolist())
+        np.testing.assert_array_equal(got, expected[col].to_numpy(dtype=np.float64))
+    pd.testing.assert_frame_equal(compiled.transform_frame(probe), expected, check_dtype=False)
+
+
+def test_probe_rejects_mismatching_tables(monkeypatch):
+    frame, y = _training_frame()
+    encoder = ce.TargetEncoder(cols=['Gender']).fit(frame, y)
+    compiled = CompiledTargetEncoder.from_category_encoders(encoder)
+    compiled.tables['Gender']['Male'] += 1.0
+    monkeypatch.setattr(CompiledTargetEncoder, 'from_category_encoders', classmethod(lambda cls, enc: compiled))
+    assert compile_target_encoder(encoder, frame.iloc[[0]]) is None
+
+
+def test_shipped_encoder_compiles(state):
+    # Fails if the installed category-encoders cannot run the shipped encoder (see requirements.txt)
+    assert state.target_encoder is not None
+    assert state.encoder_tables is not None
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from app.codec import PredictRecord
+from app.features import FeaturePlan
+
+
+def _frame_path(main, state, payloads):
+    return main._prepare_X(main._build_feature_frames(payloads, state), state).to_numpy(dtype=np.float64)
+
+
+def _random_payloads(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        PredictRecord(age=float(rng.uniform(18, 80)), weight=float(rng.uniform(40, 130)),
+                      height_cm=float(rng.uniform(140, 200)), waist_circumference=float(rng.uniform(60, 130)),
+                      carb=float(rng.uniform(0, 100)), protein=float(rng.uniform(0, 40)),
+                      fat=float(rng.uniform(0, 40)), dietary_fiber=float(rng.uniform(0, 15)))
+        for _ in range(n)
+    ]
+
+
+# Missing height (BMI is NaN), all-zero nutrients (Total_Nutrients floor), zero anthropometrics
+BLANK_PAYLOADS = [
+    PredictRecord(),
+    PredictRecord(height_cm=None, carb=50.0),
+    PredictRecord(height_cm='', carb=50.0, protein=5.0),
+    PredictRecord(height_cm=0.0, carb=12.5),
+    PredictRecord(age=0.0, weight=0.0, waist_circumference=0.0, carb=0.0, protein=0.0, fat=0.0, dietary_fiber=0.0),
+    PredictRecord(height_cm=170.0, carb=0.0, protein=0.0, fat=0.0, dietary_fiber=3.0),
+]
+
+
+def test_plan_compiles_for_shipped_model(main, state):
+    # The runtime check disables the plan on mismatch; the shipped model must keep it
+    assert main._get_feature_plan(state) is not None
+
+
+@pytest.mark.parametrize('payloads', [
+    _random_payloads(1),
+    _random_payloads(257, seed=1),
+    BLANK_PAYLOADS,
+], ids=['single', 'many', 'blank'])
+def test_transform_matches_frame_path(main, state, payloads):
+    plan = main._get_feature_plan(state)
+    got = plan.transform(main._raw_feature_matrix(payloads))
+    np.testing.assert_array_equal(got, _frame_path(main, state, payloads))
+
+
+def test_transform_all_engineered_columns(main, state):
+    # Every column the DataFrame path can produce, not just the shipped model's 26
+    columns = list(main._model_frame(main.pd.DataFrame([main._raw_feature_row(PredictRecord())]), None).columns)
+    constants = {c: state.encoder_tables.value(c, v) for c, v in main._CATEGORICAL_DEFAULTS.items()}
+    plan = FeaturePlan(columns, constants=constants)
+    view = type(state)(state.model, state.backend, columns, target_encoder=state.target_encoder)
+    payloads = _random_payloads(20, seed=2) + BLANK_PAYLOADS
+    np.testing.assert_array_equal(plan.transform(main._raw_feature_matrix(payloads)),
+                                  _frame_path(main, view, payloads))
+
+
+def test_combine_with_food_block(main, state):
+    plan = main._get_feature_plan(state)
+    payloads = _random_payloads(30, seed=3) + BLANK_PAYLOADS
+    raw = main._raw_feature_matrix(payloads)
+    np.testing.assert_array_equal(plan.combine(raw, plan.food_block(raw)), _frame_path(main, state, payloads))
+
+
+def test_cross_matches_frame_path(main, state):
+    plan = main._get_feature_plan(state)
+    users = _random_payloads(4, seed=4) + [PredictRecord(height_cm=None), PredictRecord(age=0.0, weight=0.0)]
+    foods = _random_payloads(7, seed=5) + [PredictRecord(carb=0.0), PredictRecord(height_cm='', fat=9.0)]
+    pairs = [main._pair_payload(u, f) for u in users for f in foods]
+    got = plan.cross(main._raw_feature_matrix(users), main._raw_feature_matrix(foods))
+    np.testing.assert_array_equal(got, _frame_path(main, state, pairs))
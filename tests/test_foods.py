@@ -0,0 +1,12 @@
+from fastapi.testclient import TestClient
+
+
+def test_food_endpoints_check_for_catalog_edits(main, monkeypatch):
+    checks = []
+    monkeypatch.setattr(main, '_maybe_reload_food_catalog', lambda: checks.append(1))
+    with TestClient(main.app) as client:
+        items = client.get('/api/foods', params={'q': ''}).json()['items']
+        assert len(checks) == 1
+        food_id = items[0]['id'] if items else 'missing'
+        client.get(f'/api/foods/{food_id}')
+        assert len(checks) == 2
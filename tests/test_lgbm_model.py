@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.lgbm_model import LightGBMTextModel
+
+lightgbm = pytest.importorskip('lightgbm')
+
+ROOT = Path(__file__).resolve().parent.parent
+MODELS = sorted(p.name for p in ROOT.glob('lightgbm_model*.txt'))
+
+
+def _inputs(booster, n=2000, seed=0):
+    # Values spread over each feature's split thresholds, plus exact thresholds, zeros and NaN
+    rng = np.random.default_rng(seed)
+    trees = booster.dump_model()['tree_info']
+    thresholds = [[] for _ in range(booster.num_feature())]
+
+    def walk(node):
+        if 'split_feature' in node:
+            thresholds[node['split_feature']].append(float(node['threshold']))
+            walk(node['left_child'])
+            walk(node['right_child'])
+
+    for t in trees:
+        walk(t['tree_structure'])
+    X = np.empty((n, booster.num_feature()))
+    for j, ts in enumerate(thresholds):
+        lo, hi = (min(ts), max(ts)) if ts else (0.0, 1.0)
+        span = (hi - lo) or 1.0
+        X[:, j] = rng.uniform(lo - 0.1 * span, hi + 0.1 * span, n)
+        if ts:
+            exact = rng.random(n) < 0.1
+            X[exact, j] = rng.choice(ts, exact.sum())
+    X[rng.random(X.shape) < 0.03] = 0.0
+    X[rng.random(X.shape) < 0.03] = np.nan
+    return X
+
+
+@pytest.mark.parametrize('name', MODELS)
+def test_predict_matches_lightgbm(name):
+    path = ROOT / name
+    booster = lightgbm.Booster(model_file=str(path))
+    model = LightGBMTextModel.from_file(path)
+    X = _inputs(booster)
+    np.testing.assert_allclose(model.predict(X), booster.predict(X), rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(model.predict(X[:1]), booster.predict(X[:1]), rtol=1e-12, atol=1e-9)
+
+
+def test_shipped_models_found():
+    assert {'lightgbm_model.txt', 'lightgbm_model_3.txt'} <= set(MODELS)
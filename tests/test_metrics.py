@@ -0,0 +1,36 @@
+import json
+import os
+import time
+
+from app.metrics import Metrics
+
+
+def _write(directory, pid, value, age=0.0):
+    path = directory / f'{pid}.json'
+    path.write_text(json.dumps({'pid': pid, 'counters': [['hits_total', [], value]], 'histograms': [], 'gauges': []}))
+    if age:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return path
+
+
+def test_dead_and_stale_snapshots_are_dropped(tmp_path):
+    metrics = Metrics(True, tmp_path, flush_interval=1.0)
+    metrics.describe('hits_total', 'counter', 'Hits.')
+    metrics.inc('hits_total', None, 1)
+    live = _write(tmp_path, os.getppid(), 10)             # a live process
+    dead = _write(tmp_path, 2 ** 22 + 12345, 100)         # no such PID
+    stale = _write(tmp_path, 1, 1000, age=3600)           # PID alive (init) but not refreshed for an hour
+    out = metrics.render()
+    assert 'hits_total 11' in out
+    assert live.exists() and not dead.exists() and not stale.exists()
+
+
+def test_snapshot_removed_at_exit(tmp_path):
+    metrics = Metrics(True, tmp_path, flush_interval=60.0)
+    metrics.inc('hits_total', None, 1)
+    metrics.flush()
+    own = tmp_path / f'{os.getpid()}.json'
+    assert own.exists()
+    metrics._remove_snapshot()
+    assert not own.exists()
@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+
+def test_last_result_is_scoped_to_the_session(main):
+    with TestClient(main.app) as client:
+        r = client.post('/api/predict', json={'food_item': 'rice', 'carb': 28.0}, headers={'X-Session-Id': 'alice'})
+        assert r.status_code == 200
+        mine = client.get('/api/last_result', headers={'X-Session-Id': 'alice'}).json()
+        assert mine['exists'] and mine['result']['input_summary']['food_item'] == 'rice'
+
+        client.cookies.clear()
+        assert client.get('/api/last_result').json() == {'exists': False}
+        assert client.get('/api/last_result.csv').status_code == 404
+        assert client.get('/api/last_result', headers={'X-Session-Id': 'bob'}).json() == {'exists': False}
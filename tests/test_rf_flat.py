@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.rf_flat import FlatForest, SmallBatchForest
+
+sklearn_ensemble = pytest.importorskip('sklearn.ensemble')
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _data(n=400, n_features=6, seed=0, missing=0.0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features)) * 10
+    y = X[:, 0] * 2 + np.sin(X[:, 1]) * 5 + rng.normal(size=n)
+    if missing:
+        X[rng.random(X.shape) < missing] = np.nan
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def forest():
+    X, y = _data(missing=0.1)
+    return sklearn_ensemble.RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(X, y)
+
+
+def test_predict_matches_sklearn(forest):
+    flat = FlatForest.from_sklearn(forest)
+    X, _ = _data(n=300, seed=1)
+    np.testing.assert_array_equal(flat.predict(X), forest.predict(X))
+    np.testing.assert_array_equal(flat.predict(X[:1]), forest.predict(X[:1]))
+
+
+def test_missing_values_follow_sklearn(forest):
+    flat = FlatForest.from_sklearn(forest)
+    X, _ = _data(n=300, seed=2, missing=0.2)
+    assert flat.missing_left is not None
+    np.testing.assert_array_equal(flat.predict(X), forest.predict(X))
+
+
+def test_save_load_mmap_round_trip(forest, tmp_path):
+    flat = FlatForest.from_sklearn(forest)
+    flat.save(tmp_path / 'forest', meta={'feature_names': ['a', 'b']})
+    loaded = FlatForest.load(tmp_path / 'forest', mmap_mode='r')
+    assert loaded.meta['feature_names'] == ['a', 'b']
+    assert loaded.max_depth == flat.max_depth and loaded.n_features_in_ == flat.n_features_in_
+    # Plain ndarrays backed by the file mapping
+    assert type(loaded.threshold) is np.ndarray and not loaded.threshold.flags.writeable
+    X, _ = _data(n=200, seed=3, missing=0.1)
+    np.testing.assert_array_equal(loaded.predict(X), forest.predict(X))
+
+
+def test_shipped_model():
+    joblib = pytest.importorskip('joblib')
+    model = joblib.load(ROOT / 'random_forest_model.joblib')
+    flat = FlatForest.from_sklearn(model)
+    rng = np.random.default_rng(4)
+    X = rng.normal(size=(500, model.n_features_in_)) * 50 + 50
+    X[rng.random(X.shape) < 0.05] = np.nan
+    np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+
+
+def test_small_batch_forest_routes_by_rows(forest):
+    calls = []
+
+    class Spy:
+        def __init__(self, name, model):
+            self.name, self.model, self.n_features_in_ = name, model, model.n_features_in_
+
+        def predict(self, X):
+            calls.append(self.name)
+            return self.model.predict(X)
+
+    routed = SmallBatchForest(Spy('small', FlatForest.from_sklearn(forest)), Spy('large', forest), max_rows=4)
+    X, _ = _data(n=10, seed=5)
+    np.testing.assert_array_equal(routed.predict(X[:4]), forest.predict(X[:4]))
+    np.testing.assert_array_equal(routed.predict(X), forest.predict(X))
+    assert calls == ['small', 'large']
+
+
+def test_small_batch_forest_loads_large_lazily(forest):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return forest
+
+    routed = SmallBatchForest(FlatForest.from_sklearn(forest), load, max_rows=4)
+    X, _ = _data(n=10, seed=6)
+    np.testing.assert_array_equal(routed.predict(X[:4]), forest.predict(X[:4]))
+    assert loads == []
+    np.testing.assert_array_equal(routed.predict(X), forest.predict(X))
+    np.testing.assert_array_equal(routed.predict(X), forest.predict(X))
+    assert loads == [1]
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.scheduler import InferenceQueueFull, InferenceScheduler
+
+
+def _score(items):
+    return (np.asarray(items, dtype=float) * 2,)
+
+
+def test_submit_returns_own_slice():
+    async def go():
+        sched = InferenceScheduler(_score, workers=1, window_ms=5)
+        try:
+            return await asyncio.gather(sched.submit([1, 2]), sched.submit([3]))
+        finally:
+            sched.shutdown()
+
+    (a,), (b,) = asyncio.run(go())
+    np.testing.assert_array_equal(a, [2, 4])
+    np.testing.assert_array_equal(b, [6])
+
+
+def test_run_waiters_count_against_max_queue():
+    release = threading.Event()
+
+    def blocking():
+        release.wait(5)
+        return 'done'
+
+    async def go():
+        sched = InferenceScheduler(_score, workers=1, max_queue=2)
+        try:
+            running = asyncio.ensure_future(sched.run(blocking))  # holds the only slot
+            await asyncio.sleep(0.05)
+            waiting = [asyncio.ensure_future(sched.run(lambda: 'ok')) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            assert sched.stats()['queue_depth'] == 2
+            with pytest.raises(InferenceQueueFull):
+                await sched.run(lambda: 'rejected')
+            with pytest.raises(InferenceQueueFull):
+                await sched.submit([1])
+            release.set()
+            results = await asyncio.gather(running, *waiting)
+            return results, sched.stats()
+        finally:
+            release.set()
+            sched.shutdown()
+
+    results, stats = asyncio.run(go())
+    assert results == ['done', 'ok', 'ok']
+    assert stats['rejected'] == 2 and stats['queue_depth'] == 0
@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+
+def _post(client, body, ctype, **params):
+    return client.post('/api/predict/stream', content=body, headers={'Content-Type': ctype}, params=params)
+
+
+def test_upload_content_types(main):
+    with TestClient(main.app) as client:
+        ndjson = b'{"food_item": "rice", "carb": 28}\n{"food_item": "bread", "carb": 49}\n'
+        for ctype in ('application/x-ndjson', 'application/jsonl; charset=utf-8', 'application/json-seq'):
+            r = _post(client, ndjson, ctype)
+            assert r.status_code == 200, ctype
+            assert len(r.text.strip().splitlines()) == 3 and 'rice' in r.text
+
+        array = b'[{"food_item": "rice", "carb": 28}]'
+        r = _post(client, array, 'application/json')
+        assert r.status_code == 415 and 'ndjson' in r.json()['detail']
+        assert _post(client, ndjson, 'application/json', format='ndjson').status_code == 200
+
+        assert _post(client, b'food_item,carb\nrice,28\n', 'text/csv').status_code == 200